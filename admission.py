@@ -0,0 +1,225 @@
+import asyncio
+import collections
+import json
+import math
+import time
+
+# Route class -> (concurrency, queue size, longest queue wait in seconds)
+DEFAULT_LIMITS = "predict=32:128:1.0,batch=4:16:5.0,historical=32:128:0.5,bulk=2:4:5.0,info=8:8:0.25"
+
+# Route class -> the paths it covers; entries ending in "/" match by prefix
+DEFAULT_ROUTE_CLASSES = {
+    "predict": ["/predict"],
+    # Up to 10,000 rows a call; kept apart so their service time doesn't inflate single predictions' expected wait
+    "batch": ["/predict/batch", "/predict/sweep"],
+    "historical": ["/historical-data", "/summary", "/summary/top"],
+    "bulk": ["/predict/stream"],
+    "info": ["/model-info", "/model-info/", "/unknown-categories", "/cache-stats", "/batcher-stats", "/executor-stats"],
+}
+
+# Lower sheds first: a class's requests are turned away while any class with a smaller number has a queue
+DEFAULT_PRIORITIES = {"predict": 0, "historical": 0, "batch": 1, "bulk": 1, "info": 2}
+
+
+def parse_limits(spec):
+    """'name=concurrency:queue:max_wait,...' -> {name: (concurrency, queue, max_wait)}"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, values = item.partition("=")
+        concurrency, queue, max_wait = values.split(":")
+        limits[name.strip()] = (int(concurrency), int(queue), float(max_wait))
+    return limits
+
+
+class Overloaded(Exception):
+    def __init__(self, reason, retry_after):
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RouteClass:
+    """
+    Concurrency slots plus a bounded FIFO wait queue for one group of routes.
+    Only touched from the event loop, so the counters need no lock.
+    """
+
+    def __init__(self, name, concurrency, queue_size, max_wait, priority):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.priority = priority
+        self.in_flight = 0
+        self._waiters = collections.deque()
+        # Exponentially weighted average of how long a request holds a slot
+        self.avg_service_seconds = 0.0
+        self.admitted = 0
+        self.rejected = collections.Counter()
+
+    @property
+    def queue_depth(self):
+        return len(self._waiters)
+
+    def estimated_wait(self, position):
+        """Expected seconds until the request at queue position (0-based) gets a slot"""
+        return (position // self.concurrency + 1) * self.avg_service_seconds
+
+    def reject(self, reason, wait=None):
+        self.rejected[reason] += 1
+        retry_after = max(1, math.ceil(wait if wait is not None else self.max_wait))
+        raise Overloaded(reason, retry_after)
+
+    async def acquire(self):
+        """Wait for a slot; returns seconds spent queued or raises Overloaded"""
+        if self.in_flight < self.concurrency and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return 0.0
+        if len(self._waiters) >= self.queue_size:
+            self.reject("queue_full", self.estimated_wait(len(self._waiters)))
+        expected = self.estimated_wait(len(self._waiters))
+        if expected > self.max_wait:
+            # Would not start within budget anyway; answer now instead of after max_wait
+            self.reject("deadline", expected)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            self.reject("deadline")
+        except asyncio.CancelledError:
+            # Client went away while queued
+            self._abandon(waiter)
+            raise
+        self.admitted += 1
+        return time.perf_counter() - start
+
+    def _abandon(self, waiter):
+        if waiter.done() and not waiter.cancelled():
+            # The slot was handed over just as the waiter gave up; pass it on
+            self.release(None)
+        else:
+            waiter.cancel()
+            self._waiters.remove(waiter)
+
+    def release(self, service_seconds):
+        """Free a slot, handing it straight to the oldest live waiter if there is one"""
+        if service_seconds is not None:
+            self.avg_service_seconds += 0.1 * (service_seconds - self.avg_service_seconds) if self.avg_service_seconds else service_seconds
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # in_flight stays the same: the slot moves to the waiter
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self):
+        return {
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "max_wait_seconds": self.max_wait,
+            "priority": self.priority,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "avg_service_seconds": self.avg_service_seconds,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+        }
+
+
+class AdmissionControl:
+    """
+    Bounds how many requests of each route class run at once. Excess requests
+    wait in a bounded FIFO queue for at most the class's max_wait; a request
+    that cannot start in time (queue full, predicted wait over budget, or
+    deadline reached) gets an immediate 503 with Retry-After. While a class
+    has a queue, classes with a higher priority number are shed outright, so
+    /model-info gives way before /predict. Routes outside every class
+    (/metrics, /admin/*) are never limited.
+    """
+
+    def __init__(self, limits, route_classes=None, priorities=None, on_wait=None, on_reject=None):
+        route_classes = route_classes or DEFAULT_ROUTE_CLASSES
+        priorities = priorities or DEFAULT_PRIORITIES
+        self.classes = {
+            name: RouteClass(name, *limits[name], priority=priorities.get(name, 0))
+            for name in route_classes if name in limits
+        }
+        self._exact = {}
+        self._prefixes = []
+        for name, paths in route_classes.items():
+            if name not in self.classes:
+                continue
+            for path in paths:
+                if path.endswith("/"):
+                    self._prefixes.append((path, name))
+                else:
+                    self._exact[path] = name
+        self.on_wait = on_wait
+        self.on_reject = on_reject
+
+    def classify(self, path):
+        name = self._exact.get(path)
+        if name is None:
+            name = next((name for prefix, name in self._prefixes if path.startswith(prefix)), None)
+        return self.classes.get(name) if name is not None else None
+
+    async def admit(self, route_class):
+        """Take a slot in route_class, or raise Overloaded"""
+        try:
+            if any(other.priority < route_class.priority and other.queue_depth for other in self.classes.values()):
+                route_class.reject("shed")
+            waited = await route_class.acquire()
+        except Overloaded as e:
+            if self.on_reject is not None:
+                self.on_reject(route_class.name, e.reason)
+            raise
+        if self.on_wait is not None:
+            self.on_wait(route_class.name, waited)
+
+    def stats(self):
+        return {name: route_class.stats() for name, route_class in self.classes.items()}
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying an AdmissionControl to every HTTP request"""
+
+    def __init__(self, app, control):
+        self.app = app
+        self.control = control
+
+    async def __call__(self, scope, receive, send):
+        route_class = self.control.classify(scope["path"]) if scope["type"] == "http" else None
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.control.admit(route_class)
+        except Overloaded as e:
+            await self._overloaded(send, e)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route_class.release(time.perf_counter() - start)
+
+    @staticmethod
+    async def _overloaded(send, error):
+        body = json.dumps({"detail": f"Server overloaded ({error.reason}), retry later"}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+                (b"retry-after", str(error.retry_after).encode("ascii")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from forest_engine import CompiledForest
+from training_frame import downcast_numeric
+
+logger = logging.getLogger(__name__)
+
+# Text columns stored as integer codes plus a vocabulary instead of Python strings
+CATEGORICAL_COLUMNS = ['country', 'origin', 'procedure_type']
+
+
+def content_hash(path, chunk_size=1 << 20):
+    """SHA-256 of a file's bytes"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _entry_dir(cache_dir, kind, source_hash):
+    return os.path.join(cache_dir, kind, source_hash[:32])
+
+
+def _entry_source(entry_dir):
+    """The source path recorded in a cache entry, or None for entries written before sources were recorded"""
+    try:
+        with open(os.path.join(entry_dir, "source.json")) as f:
+            return json.load(f)["source"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _publish(tmp_dir, final_dir, source):
+    """
+    Move a fully written cache entry into place and drop the entries of the same
+    kind built from earlier contents of the same source, so every model version
+    directory keeps its own entry
+    """
+    source = os.path.abspath(source)
+    with open(os.path.join(tmp_dir, "source.json"), 'w') as f:
+        json.dump({"source": source}, f)
+    kind_dir = os.path.dirname(final_dir)
+    try:
+        os.replace(tmp_dir, final_dir)
+    except OSError:
+        # Another process published the same entry first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    for name in os.listdir(kind_dir):
+        path = os.path.join(kind_dir, name)
+        if path != final_dir and not name.startswith('.tmp') and _entry_source(path) in (source, None):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _write_training_data(df, entry_dir, source):
+    kind_dir = os.path.dirname(entry_dir)
+    os.makedirs(kind_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='.tmp', dir=kind_dir)
+
+    columns = []
+    for position, name in enumerate(df.columns):
+        file_stem = f"col{position}"
+        series = df[name]
+        if name in CATEGORICAL_COLUMNS or series.dtype == object:
+            codes, vocabulary = pd.factorize(series, use_na_sentinel=True)
+            np.save(os.path.join(tmp_dir, f"{file_stem}.npy"), codes.astype(np.int32))
+            with open(os.path.join(tmp_dir, f"{file_stem}.vocab.json"), 'w') as f:
+                json.dump(vocabulary.tolist(), f)
+            columns.append({"name": name, "file": file_stem, "kind": "categorical"})
+        else:
+            np.save(os.path.join(tmp_dir, f"{file_stem}.npy"), series.to_numpy())
+            columns.append({"name": name, "file": file_stem, "kind": "numeric"})
+
+    with open(os.path.join(tmp_dir, "columns.json"), 'w') as f:
+        json.dump({"rows": len(df), "columns": columns}, f)
+    _publish(tmp_dir, entry_dir, source)
+
+
+def _read_training_data(entry_dir, categorical=False):
+    with open(os.path.join(entry_dir, "columns.json")) as f:
+        header = json.load(f)
+
+    data = {}
+    for column in header["columns"]:
+        values = np.load(os.path.join(entry_dir, f"{column['file']}.npy"), mmap_mode='r')
+        if column["kind"] == "categorical":
+            with open(os.path.join(entry_dir, f"{column['file']}.vocab.json")) as f:
+                vocabulary = np.array(json.load(f), dtype=object)
+            if categorical:
+                data[column["name"]] = pd.Categorical.from_codes(values, vocabulary)
+            else:
+                # Same object-dtype strings read_csv produces, rebuilt with one vectorized take
+                data[column["name"]] = np.asarray(pd.Categorical.from_codes(values, vocabulary), dtype=object)
+        else:
+            data[column["name"]] = values
+    return pd.DataFrame(data)
+
+
+def load_training_data(csv_path, cache_dir, compact=False):
+    """
+    Load training data from the columnar cache, building the cache from csv_path
+    the first time and whenever the CSV's content hash changes. With compact,
+    text columns come back as categoricals and integer columns are stored downcast.
+    """
+    kind = "training_data_compact" if compact else "training_data"
+    entry_dir = _entry_dir(cache_dir, kind, content_hash(csv_path))
+    if os.path.exists(os.path.join(entry_dir, "columns.json")):
+        try:
+            return _read_training_data(entry_dir, categorical=compact)
+        except Exception as e:
+            logger.warning(f"Columnar cache for {csv_path} is unreadable, rebuilding: {e}")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+
+    df = pd.read_csv(csv_path)
+    if compact:
+        df = downcast_numeric(df)
+    try:
+        _write_training_data(df, entry_dir, csv_path)
+        logger.info(f"Built columnar cache for {csv_path} in {entry_dir}")
+    except Exception as e:
+        logger.warning(f"Could not write columnar cache for {csv_path}: {e}")
+    return df
+
+
+def load_cached_frame(kind, key, cache_dir):
+    """A frame stored by store_cached_frame under (kind, key), or None if there is none"""
+    entry_dir = _entry_dir(cache_dir, kind, key)
+    if not os.path.exists(os.path.join(entry_dir, "columns.json")):
+        return None
+    try:
+        return _read_training_data(entry_dir)
+    except Exception as e:
+        logger.warning(f"Cached {kind} frame is unreadable, rebuilding: {e}")
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        return None
+
+
+def store_cached_frame(df, kind, key, cache_dir, source):
+    """Cache an intermediate frame built from the file at source, replacing older entries built from it"""
+    try:
+        _write_training_data(df, _entry_dir(cache_dir, kind, key), source)
+    except Exception as e:
+        logger.warning(f"Could not cache {kind} frame: {e}")
+
+
+def load_compiled_forest(model_path, cache_dir):
+    """Memory-map the cached compiled forest for model_path, or return None if there is none for its current content"""
+    entry_dir = _entry_dir(cache_dir, "forest", content_hash(model_path))
+    if not os.path.exists(os.path.join(entry_dir, "forest.json")):
+        return None
+    try:
+        return CompiledForest.load(entry_dir, mmap_mode='r')
+    except Exception as e:
+        logger.warning(f"Compiled forest cache for {model_path} is unreadable: {e}")
+        return None
+
+
+def store_compiled_forest(compiled, model_path, cache_dir):
+    """Cache a compiled forest that has been verified against the model in model_path"""
+    entry_dir = _entry_dir(cache_dir, "forest", content_hash(model_path))
+    kind_dir = os.path.dirname(entry_dir)
+    try:
+        os.makedirs(kind_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp', dir=kind_dir)
+        compiled.save(tmp_dir)
+        _publish(tmp_dir, entry_dir, model_path)
+        logger.info(f"Cached compiled forest for {model_path} in {entry_dir}")
+    except Exception as e:
+        logger.warning(f"Could not cache compiled forest for {model_path}: {e}")
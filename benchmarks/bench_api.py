@@ -0,0 +1,334 @@
+"""
+End-to-end latency and throughput of the FastAPI app on synthetic artifacts.
+
+    python benchmarks/bench_api.py --rows 100000 --concurrency 1 8 32 --output baseline.json
+    python benchmarks/bench_api.py --rows 100000 --concurrency 1 8 32 --baseline baseline.json
+
+Writes a synthetic model, scaler, label encoders and training_data.csv of
+--rows rows (seeded, so every run sees the same data) into --artifact-dir,
+imports main.py from there and drives the ASGI app in-process through httpx,
+without a network or server. A seeded request mix covers /predict with known
+and unknown categories, /predict/batch, /historical-data with exact years,
+closest-year fallbacks and unknown pairs, and /model-info. Each concurrency
+level reports p50/p95/p99 latency per scenario, throughput and peak RSS.
+
+Environment variables read by main.py (MICRO_BATCH_ENABLED, INFERENCE_ENGINE,
+...) pass through, so configurations can be compared against the same
+baseline. The prediction cache is off unless --cache-size is given, so
+repeated requests measure the pipeline rather than cache hits. With
+--baseline, the exit status is 1 when any p95 latency or throughput is worse
+than the baseline by more than --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import sys
+import time
+import warnings
+
+import numpy as np
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+warnings.filterwarnings("ignore")
+
+FEATURE_COLUMNS = [
+    'country_encoded', 'origin_encoded', 'procedure_encoded', 'Year', 'Applied during year',
+    'Tota pending start-year', 'of which UNHCR-assisted(start-year)', 'decisions_other'
+]
+PROCEDURES = ["G / AR", "G / BL", "G / EO", "G / FA", "G / FI", "G / IN", "G / JR", "G / NA", "G / RA", "U / AR", "U / FI", "U / RA"]
+YEARS = (2000, 2016)
+
+# Scenario name -> relative weight in the request mix
+SCENARIO_WEIGHTS = {
+    "predict_known": 40,
+    "predict_unknown": 10,
+    "predict_batch": 5,
+    "historical_exact": 20,
+    "historical_fallback": 15,
+    "historical_missing": 5,
+    "model_info": 5,
+}
+
+
+def write_synthetic_artifacts(directory, rows, trees, seed):
+    """Write the artifact set main.py loads; the model is trained on at most 5000 rows to keep setup fast"""
+    import joblib
+    import pandas as pd
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+    rng = np.random.default_rng(seed)
+    countries = np.array([f"Country {i:03d}" for i in range(60)])
+    origins = np.array([f"Origin {i:03d}" for i in range(200)])
+    procedures = np.array(PROCEDURES)
+
+    training_data = pd.DataFrame({
+        "country": countries[rng.integers(0, len(countries), rows)],
+        "origin": origins[rng.integers(0, len(origins), rows)],
+        "procedure_type": procedures[rng.integers(0, len(procedures), rows)],
+        "year": rng.integers(YEARS[0], YEARS[1] + 1, rows),
+        "applied_during_year": rng.integers(0, 5000, rows),
+        "pending_start": rng.integers(0, 8000, rows),
+        "unhcr_assisted_start": rng.integers(0, 2000, rows),
+        "decisions_other": rng.integers(0, 300, rows),
+    })
+    training_data["acceptance_rate"] = rng.random(rows)
+
+    label_encoders = {
+        "country": LabelEncoder().fit(countries),
+        "origin": LabelEncoder().fit(origins),
+        "procedure": LabelEncoder().fit(procedures),
+    }
+    sample = training_data.iloc[:min(rows, 5000)]
+    features = pd.DataFrame(np.column_stack([
+        label_encoders["country"].transform(sample["country"]),
+        label_encoders["origin"].transform(sample["origin"]),
+        label_encoders["procedure"].transform(sample["procedure_type"]),
+        sample["year"], sample["applied_during_year"], sample["pending_start"],
+        sample["unhcr_assisted_start"], sample["decisions_other"],
+    ]).astype(float), columns=FEATURE_COLUMNS)
+    scaler = StandardScaler().fit(features)
+    model = RandomForestRegressor(n_estimators=trees, random_state=seed).fit(scaler.transform(features), sample["acceptance_rate"])
+
+    os.makedirs(directory, exist_ok=True)
+    joblib.dump(model, os.path.join(directory, "best_model.pkl"))
+    joblib.dump(scaler, os.path.join(directory, "scaler.pkl"))
+    joblib.dump(label_encoders, os.path.join(directory, "label_encoders.pkl"))
+    joblib.dump(FEATURE_COLUMNS, os.path.join(directory, "feature_columns.pkl"))
+    training_data.to_csv(os.path.join(directory, "training_data.csv"), index=False)
+    with open(os.path.join(directory, "synthetic.json"), "w") as f:
+        json.dump({"rows": rows, "trees": trees, "seed": seed}, f)
+
+
+def artifacts_match(directory, rows, trees, seed):
+    try:
+        with open(os.path.join(directory, "synthetic.json")) as f:
+            return json.load(f) == {"rows": rows, "trees": trees, "seed": seed}
+    except (OSError, ValueError):
+        return False
+
+
+def build_requests(training_data, count, seed):
+    """Seeded list of (scenario, method, path, body) drawn from SCENARIO_WEIGHTS"""
+    rng = random.Random(seed)
+    pairs = training_data.groupby(["country", "origin"])["year"].agg(lambda years: sorted(set(years)))
+    pair_keys = list(pairs.index)
+    pair_years = list(pairs.items())
+    # Pairs missing at least one in-range year exercise the closest-year fallback
+    gapped = [(pair, years) for pair, years in pairs.items() if len(years) < YEARS[1] - YEARS[0] + 1]
+
+    def prediction_body(country, origin):
+        return {
+            "country": country,
+            "origin": origin,
+            "procedure_type": rng.choice(PROCEDURES),
+            "year": rng.randint(*YEARS),
+            "applied_during_year": rng.randint(0, 5000),
+            "pending_start": rng.randint(0, 8000),
+            "unhcr_assisted_start": rng.randint(0, 2000),
+            "decisions_other": rng.randint(0, 300),
+        }
+
+    def make(scenario):
+        if scenario == "predict_known":
+            return "POST", "/predict", prediction_body(*rng.choice(pair_keys))
+        if scenario == "predict_unknown":
+            country, origin = rng.choice(pair_keys)
+            body = prediction_body(country, f"Unseen origin {rng.randint(0, 999)}")
+            if rng.random() < 0.5:
+                body["procedure_type"] = "X / ZZ"
+            return "POST", "/predict", body
+        if scenario == "predict_batch":
+            return "POST", "/predict/batch", {"inputs": [prediction_body(*rng.choice(pair_keys)) for _ in range(32)]}
+        if scenario == "historical_exact":
+            (country, origin), years = rng.choice(pair_years)
+            return "POST", "/historical-data", {"country": country, "origin": origin, "year": int(rng.choice(years))}
+        if scenario == "historical_fallback":
+            if gapped:
+                (country, origin), years = rng.choice(gapped)
+                year = rng.choice([y for y in range(YEARS[0], YEARS[1] + 1) if y not in years])
+            else:
+                (country, origin), _ = rng.choice(pair_years)
+                year = YEARS[1] + rng.randint(1, 5)
+            return "POST", "/historical-data", {"country": country, "origin": origin, "year": year}
+        if scenario == "historical_missing":
+            return "POST", "/historical-data", {"country": "Unseen country", "origin": rng.choice(pair_keys)[1], "year": rng.randint(*YEARS)}
+        return "GET", "/model-info", None
+
+    scenarios = list(SCENARIO_WEIGHTS)
+    weights = [SCENARIO_WEIGHTS[s] for s in scenarios]
+    return [(scenario,) + make(scenario) for scenario in rng.choices(scenarios, weights=weights, k=count)]
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed):
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "throughput_rps": round(len(values) / elapsed, 1),
+    }
+
+
+async def replay(client, requests, concurrency):
+    """Send every request with `concurrency` clients; returns per-scenario latencies, error count and wall time"""
+    queue = iter(requests)
+    latencies = {}
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        for scenario, method, path, body in queue:
+            start = time.perf_counter()
+            response = await client.request(method, path, json=body)
+            latencies.setdefault(scenario, []).append(time.perf_counter() - start)
+            if response.status_code >= 500:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return latencies, errors, time.perf_counter() - start
+
+
+async def run_levels(app, requests, concurrency_levels, warmup):
+    import httpx
+
+    # httpx logs every request at INFO, which main.py's logging config would print
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        await replay(client, requests[:warmup], 1)
+        for concurrency in concurrency_levels:
+            latencies, errors, elapsed = await replay(client, requests, concurrency)
+            all_latencies = [value for values in latencies.values() for value in values]
+            results[str(concurrency)] = {
+                "overall": dict(summarize(all_latencies, elapsed), errors=errors),
+                "scenarios": {scenario: summarize(values, elapsed) for scenario, values in sorted(latencies.items())},
+            }
+    return results
+
+
+def peak_rss_mb():
+    # ru_maxrss is KB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def compare(run, baseline, tolerance):
+    """Print current vs baseline; returns the list of regressions beyond tolerance"""
+    regressions = []
+    print(f"\nvs baseline (tolerance {tolerance:.0%})")
+    print(f"{'conc':>5} {'scenario':<20} {'p95 ms':>9} {'base':>9} {'rps':>9} {'base':>9}")
+    for concurrency, level in run["results"].items():
+        base_level = baseline.get("results", {}).get(concurrency)
+        if base_level is None:
+            continue
+        rows = [("overall", level["overall"], base_level["overall"])]
+        rows += [(name, stats, base_level["scenarios"].get(name)) for name, stats in level["scenarios"].items()]
+        for name, stats, base in rows:
+            if base is None:
+                continue
+            flags = []
+            if stats["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+                flags.append("p95")
+            # Per-scenario throughput is a share of the mix; only the overall figure is compared
+            if name == "overall" and stats["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+                flags.append("throughput")
+            marker = f"  REGRESSION ({', '.join(flags)})" if flags else ""
+            print(f"{concurrency:>5} {name:<20} {stats['p95_ms']:>9.2f} {base['p95_ms']:>9.2f} "
+                  f"{stats['throughput_rps']:>9.0f} {base['throughput_rps']:>9.0f}{marker}")
+            regressions.extend(f"concurrency {concurrency} {name}: {flag}" for flag in flags)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000, help="training_data.csv rows (10k-10M)")
+    parser.add_argument("--trees", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache-size", type=int, default=0, help="PREDICTION_CACHE_SIZE for the run")
+    parser.add_argument("--artifact-dir", default=".bench_artifacts", help="reused when it already holds the same --rows/--trees/--seed")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+
+    artifact_dir = os.path.abspath(args.artifact_dir)
+    # Resolved now because the run changes into artifact_dir
+    args.output = args.output and os.path.abspath(args.output)
+    args.baseline = args.baseline and os.path.abspath(args.baseline)
+    if not artifacts_match(artifact_dir, args.rows, args.trees, args.seed):
+        print(f"Writing synthetic artifacts ({args.rows} rows, {args.trees} trees) to {artifact_dir}")
+        write_synthetic_artifacts(artifact_dir, args.rows, args.trees, args.seed)
+
+    # main.py loads its artifacts from the working directory at import time
+    os.environ["PREDICTION_CACHE_SIZE"] = str(args.cache_size)
+    os.environ.setdefault("MODEL_REGISTRY_DIR", os.path.join(artifact_dir, "models"))
+    os.environ.setdefault("ARTIFACT_CACHE_DIR", os.path.join(artifact_dir, ".artifact_cache"))
+    os.chdir(artifact_dir)
+    sys.path.insert(0, REPO_DIR)
+    import main as api
+
+    bundle = api.registry.active
+    if bundle is None:
+        sys.exit(f"Model failed to load: {api.registry.last_error}")
+    requests = build_requests(bundle.training_data, args.requests, args.seed)
+    results = asyncio.run(run_levels(api.app, requests, sorted(set(args.concurrency)), args.warmup))
+
+    run = {
+        "config": {
+            "rows": args.rows, "trees": args.trees, "requests": args.requests, "seed": args.seed,
+            "cache_size": args.cache_size, "inference_engine": bundle.inference_engine,
+            "micro_batch": api.MICRO_BATCH_ENABLED, "executor": api.INFERENCE_EXECUTOR,
+        },
+        "environment": {"python": platform.python_version(), "cpus": os.cpu_count(), "machine": platform.machine()},
+        "model_load_seconds": round(bundle.load_seconds, 3),
+        "peak_rss_mb": peak_rss_mb(),
+        "results": results,
+    }
+
+    print(f"\n{args.rows} rows, {args.requests} requests per level, model load {run['model_load_seconds']}s, peak RSS {run['peak_rss_mb']} MB")
+    print(f"{'conc':>5} {'scenario':<20} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rps':>9}")
+    for concurrency, level in results.items():
+        for name, stats in [("overall", level["overall"])] + list(level["scenarios"].items()):
+            print(f"{concurrency:>5} {name:<20} {stats['count']:>6} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} "
+                  f"{stats['p99_ms']:>9.2f} {stats['throughput_rps']:>9.0f}")
+        if level["overall"]["errors"]:
+            print(f"{concurrency:>5} {level['overall']['errors']} responses with status >= 500")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("config", {}).get("rows") != args.rows:
+            print(f"Warning: baseline was recorded with {baseline.get('config', {}).get('rows')} rows")
+        regressions = compare(run, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Compare sklearn RandomForestRegressor.predict with the compiled forest engine.
+
+    python benchmarks/bench_forest_engine.py                  # synthetic forest shaped like the notebook's
+    python benchmarks/bench_forest_engine.py --model best_model.pkl
+
+Also times the /predict route end to end with each engine when the API's
+artifacts are present in the working directory.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import warnings
+
+import joblib
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from forest_engine import CompiledForest, verify_compiled_forest  # noqa: E402
+
+warnings.filterwarnings("ignore")
+
+
+def synthetic_forest(n_rows, n_estimators, seed=0):
+    from sklearn.ensemble import RandomForestRegressor
+
+    rng = np.random.default_rng(seed)
+    X = rng.standard_normal((n_rows, 8))
+    y = np.clip(0.5 + 0.2 * np.sin(X[:, 0] * 3) + 0.1 * X[:, 3] + 0.1 * rng.standard_normal(n_rows), 0, 1)
+    return RandomForestRegressor(n_estimators=n_estimators, random_state=seed).fit(X, y)
+
+
+def time_call(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def bench_model(model, compiled, repeats):
+    rng = np.random.default_rng(1)
+    print(f"{'rows':>6} {'sklearn ms':>12} {'compiled ms':>12} {'speedup':>8}")
+    for n_rows in (1, 8, 32, 128, 512):
+        X = rng.standard_normal((n_rows, compiled.n_features))
+        sk = time_call(lambda: model.predict(X), repeats)
+        cf = time_call(lambda: compiled.predict(X), repeats)
+        print(f"{n_rows:>6} {sk:>12.3f} {cf:>12.3f} {sk / cf:>7.1f}x")
+
+
+def bench_route(repeats):
+    if not os.path.exists("best_model.pkl"):
+        print("\nbest_model.pkl not in working directory, skipping /predict timing")
+        return
+
+    from fastapi.testclient import TestClient
+    import main
+
+    if main.compiled_forest is None:
+        print("\nCompiled engine not active in main, skipping /predict timing")
+        return
+
+    client = TestClient(main.app)
+    classes = {name: table.classes for name, table in main.category_encoder.tables.items()}
+    payload = {
+        "country": classes["country"][0],
+        "origin": classes["origin"][0],
+        "procedure_type": classes["procedure"][0],
+        "year": 2015,
+        "applied_during_year": 500,
+        "pending_start": 200,
+        "unhcr_assisted_start": 50,
+        "decisions_other": 10
+    }
+
+    compiled = main.compiled_forest
+    results = {}
+    for engine in ("sklearn", "compiled"):
+        main.compiled_forest = compiled if engine == "compiled" else None
+        client.post("/predict", json=payload)
+        results[engine] = time_call(lambda: client.post("/predict", json=payload), repeats)
+    main.compiled_forest = compiled
+
+    print("\n/predict median latency")
+    for engine, ms in results.items():
+        print(f"  {engine:<9} {ms:.3f} ms")
+    print(f"  speedup   {results['sklearn'] / results['compiled']:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help="Pickled forest to benchmark (default: train a synthetic one)")
+    parser.add_argument("--train-rows", type=int, default=10000)
+    parser.add_argument("--estimators", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+
+    model = joblib.load(args.model) if args.model else synthetic_forest(args.train_rows, args.estimators)
+
+    start = time.perf_counter()
+    compiled = CompiledForest.from_sklearn(model)
+    print(f"Compiled {compiled.n_trees} trees / {compiled.n_nodes} nodes "
+          f"(max depth {compiled.max_depth}) in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    max_diff = verify_compiled_forest(compiled, model)
+    print(f"Max |compiled - sklearn| over 2000 rows: {max_diff}\n")
+
+    bench_model(model, compiled, args.repeats)
+    bench_route(args.repeats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Throughput of single-row predictions through the process-pool executor.
+
+    python benchmarks/bench_inference_pool.py --workers 1 2 4 8
+
+Run from the directory holding scaler.pkl and best_model.pkl. Compares the
+in-process threadpool path with InferencePool at each worker count.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import warnings
+
+import joblib
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from forest_engine import CompiledForest  # noqa: E402
+from inference_pool import InferencePool  # noqa: E402
+
+warnings.filterwarnings("ignore")
+
+
+async def drive(predict, rows, concurrency):
+    """Push every row through predict with at most `concurrency` calls outstanding"""
+    queue = iter(rows)
+
+    async def client():
+        for row in queue:
+            await predict(row)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return len(rows) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    scaler = joblib.load("scaler.pkl")
+    model = joblib.load("best_model.pkl")
+    compiled = CompiledForest.from_sklearn(model)
+
+    rng = np.random.default_rng(0)
+    rows = [np.atleast_2d(scaler.mean_ + rng.standard_normal(len(scaler.mean_)) * scaler.scale_) for _ in range(args.requests)]
+
+    async def in_process(row):
+        return await asyncio.to_thread(lambda: compiled.predict(scaler.transform(row)))
+
+    print(f"{os.cpu_count()} CPUs, {args.requests} single-row requests, concurrency {args.concurrency}\n")
+    print(f"{'executor':<14} {'req/s':>10}")
+    print(f"{'threadpool':<14} {asyncio.run(drive(in_process, rows, args.concurrency)):>10.0f}")
+
+    for workers in sorted(set(args.workers)):
+        pool = InferencePool(workers=workers, compiled_forest=compiled)
+        try:
+            pool.warmup()
+            throughput = asyncio.run(drive(pool.predict, rows, args.concurrency))
+        finally:
+            pool.shutdown()
+        print(f"{f'process x{workers}':<14} {throughput:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
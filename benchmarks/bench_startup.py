@@ -0,0 +1,89 @@
+"""
+Artifact load time: pickles + read_csv versus the columnar/memory-mapped cache.
+
+    python benchmarks/bench_startup.py --repeats 5
+
+Run from the directory holding the API artifacts. Each measurement runs in a
+fresh interpreter so nothing is reused between runs; library imports are
+excluded from the timings and from the reported RSS growth.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+LOAD_PATHS = {
+    "pickle + read_csv": """
+import joblib, pandas as pd
+start = time.perf_counter()
+joblib.load("best_model.pkl"); joblib.load("scaler.pkl"); joblib.load("label_encoders.pkl"); joblib.load("feature_columns.pkl")
+pd.read_csv("training_data.csv")
+""",
+    "columnar cache": """
+import joblib
+from artifact_cache import load_training_data, load_compiled_forest
+start = time.perf_counter()
+joblib.load("scaler.pkl"); joblib.load("label_encoders.pkl"); joblib.load("feature_columns.pkl")
+assert load_compiled_forest("best_model.pkl", CACHE_DIR) is not None
+load_training_data("training_data.csv", CACHE_DIR)
+""",
+}
+
+RUNNER = """
+import json, sys, time, warnings
+warnings.filterwarnings("ignore")
+# Unpickling imports these lazily; import them up front so only artifact loading is timed
+import pandas, sklearn.ensemble, sklearn.preprocessing
+import os, resource
+def rss_kb():
+    try:
+        return int(open("/proc/self/statm").read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+baseline_rss_kb = rss_kb()
+sys.path.insert(0, {repo!r})
+CACHE_DIR = {cache_dir!r}
+{body}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "rss_growth_kb": rss_kb() - baseline_rss_kb}}))
+"""
+
+
+def run(body, cache_dir):
+    script = RUNNER.format(repo=REPO_DIR, cache_dir=cache_dir, body=body)
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def build_cache(cache_dir):
+    sys.path.insert(0, REPO_DIR)
+    import joblib
+    from artifact_cache import load_training_data, store_compiled_forest
+    from forest_engine import CompiledForest
+
+    store_compiled_forest(CompiledForest.from_sklearn(joblib.load("best_model.pkl")), "best_model.pkl", cache_dir)
+    load_training_data("training_data.csv", cache_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        build_cache(cache_dir)
+        print(f"{'load path':<20} {'median s':>10} {'RSS growth MB':>14}")
+        for name, body in LOAD_PATHS.items():
+            runs = [run(body, cache_dir) for _ in range(args.repeats)]
+            seconds = statistics.median(r["seconds"] for r in runs)
+            rss = max(r["rss_growth_kb"] for r in runs) / 1024
+            print(f"{name:<20} {seconds:>10.3f} {rss:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
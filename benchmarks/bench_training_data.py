@@ -0,0 +1,156 @@
+"""
+Memory and filtering speed of training_data: read_csv's string columns versus
+the compact layout (category codes over the label encoders' classes,
+downcast integers) the API uses by default, loaded from the CSV and from
+the columnar artifact cache.
+
+    python benchmarks/bench_training_data.py --rows 1000000 --lookups 200
+
+Writes a seeded synthetic training_data.csv of --rows rows and matching
+label_encoders.pkl to a temporary directory. Each layout is then loaded in a
+fresh interpreter, which reports RSS growth and the frame's own memory, the
+time of a (country, origin) equality filter (by string, and for the compact
+layout also by code with the request strings translated once up front), a
+groupby-mean over the pairs and the historical index build.
+"""
+import argparse
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import LabelEncoder
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+LAYOUTS = {
+    "read_csv": "df = pd.read_csv(csv_path)",
+    "compact": "df = compact_training_data(pd.read_csv(csv_path), label_encoders)",
+    # What the API does once the columnar cache exists: codes are read straight into categoricals
+    "cached": "df = compact_training_data(load_training_data(csv_path, cache_dir, compact=True), label_encoders)",
+}
+
+RUNNER = """
+import gc, json, os, pickle, resource, sys, time, warnings
+warnings.filterwarnings("ignore")
+import numpy as np, pandas as pd
+sys.path.insert(0, {repo!r})
+from artifact_cache import load_training_data
+from historical_index import build_historical_index
+from training_frame import compact_training_data, memory_report
+def rss_kb():
+    try:
+        return int(open("/proc/self/statm").read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+csv_path = {csv_path!r}
+cache_dir = {cache_dir!r}
+with open({encoders_path!r}, "rb") as f:
+    label_encoders = pickle.load(f)
+pairs = {pairs!r}
+gc.collect()
+baseline_rss_kb = rss_kb()
+start = time.perf_counter()
+{body}
+load_seconds = time.perf_counter() - start
+gc.collect()
+result = {{"load_seconds": load_seconds, "rss_growth_mb": (rss_kb() - baseline_rss_kb) / 1024,
+           "frame_mb": memory_report([df])["total_bytes"] / 2 ** 20}}
+
+start = time.perf_counter()
+for country, origin in pairs:
+    matches = df[(df['country'] == country) & (df['origin'] == origin)]
+result["filter_by_string_ms"] = (time.perf_counter() - start) / len(pairs) * 1000
+
+if isinstance(df['country'].dtype, pd.CategoricalDtype):
+    country_codes, origin_codes = df['country'].cat.codes.to_numpy(), df['origin'].cat.codes.to_numpy()
+    start = time.perf_counter()
+    for country, origin in pairs:
+        # Request strings translated to codes once, then integer comparisons over the columns
+        code_pair = (df['country'].cat.categories.get_loc(country), df['origin'].cat.categories.get_loc(origin))
+        matches = df[(country_codes == code_pair[0]) & (origin_codes == code_pair[1])]
+    result["filter_by_code_ms"] = (time.perf_counter() - start) / len(pairs) * 1000
+
+start = time.perf_counter()
+df.groupby(['country', 'origin'], observed=True, sort=False)['acceptance_rate'].mean()
+result["groupby_mean_ms"] = (time.perf_counter() - start) * 1000
+
+start = time.perf_counter()
+build_historical_index(df)
+result["index_build_s"] = time.perf_counter() - start
+print(json.dumps(result))
+"""
+
+
+def write_synthetic_data(directory, rows, seed):
+    """Seeded training_data.csv with roughly the real data's vocabulary sizes, plus label_encoders.pkl"""
+    rng = np.random.default_rng(seed)
+    vocabularies = {
+        'country': [f"Country {i:02d}" for i in range(54)],
+        'origin': [f"Origin {i:03d}" for i in range(190)],
+        'procedure': [f"{kind} / {level}" for kind in "GUJ" for level in ("AR", "FA", "FI", "RA")],
+    }
+    frame = pd.DataFrame({
+        'country': np.array(vocabularies['country'], dtype=object)[rng.integers(0, 54, rows)],
+        'origin': np.array(vocabularies['origin'], dtype=object)[rng.zipf(1.3, rows) % 190],
+        'procedure_type': np.array(vocabularies['procedure'], dtype=object)[rng.integers(0, 12, rows)],
+        'year': rng.integers(2000, 2017, rows),
+        'applied_during_year': rng.integers(0, 20000, rows),
+        'pending_start': rng.integers(0, 20000, rows),
+        'unhcr_assisted_start': rng.integers(0, 5000, rows),
+        'decisions_other': rng.integers(0, 2000, rows),
+        'acceptance_rate': rng.random(rows),
+    })
+    csv_path = os.path.join(directory, "training_data.csv")
+    frame.to_csv(csv_path, index=False)
+
+    encoders_path = os.path.join(directory, "label_encoders.pkl")
+    with open(encoders_path, "wb") as f:
+        pickle.dump({name: LabelEncoder().fit(values) for name, values in vocabularies.items()}, f)
+
+    pairs = frame[['country', 'origin']].sample(n=min(rows, 10_000), random_state=seed).drop_duplicates()
+    return csv_path, encoders_path, [tuple(pair) for pair in pairs.to_numpy().tolist()]
+
+
+def run(body, csv_path, encoders_path, pairs, cache_dir):
+    script = RUNNER.format(repo=REPO_DIR, csv_path=csv_path, encoders_path=encoders_path, pairs=pairs,
+                           cache_dir=cache_dir, body=body)
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=200, help="(country, origin) pairs filtered per layout")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path, encoders_path, pairs = write_synthetic_data(directory, args.rows, args.seed)
+        pairs = pairs[:args.lookups]
+        cache_dir = os.path.join(directory, "cache")
+        sys.path.insert(0, REPO_DIR)
+        from artifact_cache import load_training_data
+        load_training_data(csv_path, cache_dir, compact=True)
+        results = {name: run(body, csv_path, encoders_path, pairs, cache_dir) for name, body in LAYOUTS.items()}
+
+    columns = ["load_seconds", "rss_growth_mb", "frame_mb", "filter_by_string_ms", "filter_by_code_ms", "groupby_mean_ms", "index_build_s"]
+    print(f"{args.rows:,} rows")
+    print(f"{'layout':<10} " + " ".join(f"{column:>20}" for column in columns))
+    for name, result in results.items():
+        print(f"{name:<10} " + " ".join(
+            f"{result[column]:>20.2f}" if column in result else f"{'-':>20}" for column in columns
+        ))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"rows": args.rows, "lookups": len(pairs), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
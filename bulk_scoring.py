@@ -0,0 +1,148 @@
+import csv
+import json
+
+from pydantic import ValidationError
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+
+FORMATS = ("csv", "ndjson")
+
+
+# Longest line iter_lines buffers; a longer row is skipped and reported as an error
+MAX_LINE_BYTES = 64 * 1024
+
+
+async def iter_lines(byte_chunks, max_line_bytes=MAX_LINE_BYTES):
+    """
+    Split an async stream of byte chunks into decoded lines. Only each new
+    chunk is scanned for newlines, and at most max_line_bytes of a partial
+    line are buffered: a longer line is dropped up to its newline and
+    yielded as None.
+    """
+    partial = bytearray()
+    overlong = False
+    first = True
+
+    def decode(line):
+        nonlocal first
+        text = line.decode("utf-8", errors="replace").rstrip("\r")
+        if first:
+            text = text.lstrip("\ufeff")
+            first = False
+        return text
+
+    async for chunk in byte_chunks:
+        start = 0
+        while (end := chunk.find(b"\n", start)) >= 0:
+            if overlong or len(partial) + end - start > max_line_bytes:
+                first = False
+                yield None
+            else:
+                partial += chunk[start:end]
+                yield decode(partial)
+            partial.clear()
+            overlong = False
+            start = end + 1
+        if not overlong:
+            if len(partial) + len(chunk) - start > max_line_bytes:
+                overlong = True
+                partial.clear()
+            else:
+                partial += chunk[start:]
+    if overlong:
+        yield None
+    elif partial:
+        yield decode(partial)
+
+
+async def iter_records(byte_chunks, input_format, max_line_bytes=MAX_LINE_BYTES):
+    """
+    Yield (row_number, fields, error) for every non-blank data row. CSV input
+    needs a header line; each record has to fit on one line of at most
+    max_line_bytes in both formats.
+    """
+    header = None
+    row_number = 0
+    async for line in iter_lines(byte_chunks, max_line_bytes):
+        if line is None:
+            row_number += 1
+            if input_format == "csv" and header is None:
+                yield row_number, None, f"header line longer than {max_line_bytes} bytes"
+                return
+            yield row_number, None, f"line longer than {max_line_bytes} bytes"
+            continue
+        if not line.strip():
+            continue
+        if input_format == "csv":
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [name.strip() for name in values]
+                continue
+            row_number += 1
+            if len(values) != len(header):
+                yield row_number, None, f"expected {len(header)} columns, got {len(values)}"
+                continue
+            yield row_number, dict(zip(header, values)), None
+        else:
+            row_number += 1
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield row_number, None, f"invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield row_number, None, "expected a JSON object"
+                continue
+            yield row_number, record, None
+
+
+async def iter_chunks(records, chunk_size):
+    """Group an async iterator into lists of at most chunk_size items"""
+    chunk = []
+    async for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def validation_message(error):
+    return "; ".join(
+        f"{'.'.join(str(part) for part in detail['loc']) or 'row'}: {detail['msg']}"
+        for detail in error.errors()
+    )
+
+
+def validate_chunk(chunk, model_class):
+    """Turn (row_number, fields, error) records into (row_number, model instance or None, error)"""
+    validated = []
+    for row_number, fields, error in chunk:
+        if error is None:
+            try:
+                validated.append((row_number, model_class.model_validate(fields), None))
+                continue
+            except ValidationError as e:
+                error = validation_message(e)
+        validated.append((row_number, None, error))
+    return validated
+
+
+class BodyStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse whose body iterator itself reads the request body.
+    Starlette's StreamingResponse listens for client disconnects by calling
+    receive() alongside the iterator, which would swallow the body messages
+    the iterator is waiting for. Here the iterator is the only reader; a
+    disconnect surfaces as ClientDisconnect from request.stream() or as an
+    OSError from send.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
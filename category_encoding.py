@@ -0,0 +1,209 @@
+import logging
+import threading
+from types import MappingProxyType
+
+import numpy as np
+import pandas as pd
+
+from category_matching import CategoryMatch, CategoryMatcher
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_POLICIES = ('most_frequent', 'sentinel', 'reject')
+
+# label_encoders.pkl key -> training_data column holding the raw values
+TRAINING_COLUMNS = {
+    'country': 'country',
+    'origin': 'origin',
+    'procedure': 'procedure_type',
+}
+
+
+class CategoryTable:
+    """
+    Immutable string -> code lookup built once from a fitted LabelEncoder.
+    Codes are the positions in encoder.classes_, i.e. exactly what encoder.transform returns.
+    """
+
+    def __init__(self, name, classes, fallback_code):
+        self.name = name
+        self.classes = tuple(classes)
+        self.codes = MappingProxyType({value: code for code, value in enumerate(self.classes)})
+        self.fallback_code = fallback_code
+        self._index = pd.Index(self.classes, dtype=object)
+        # Normalized-name, alias and trigram index for resolving values that aren't exact classes
+        self.matcher = CategoryMatcher(self.classes)
+
+    def __len__(self):
+        return len(self.classes)
+
+    def lookup(self, value):
+        """Code for value, or None if it was not seen during training"""
+        return self.codes.get(value)
+
+    def lookup_many(self, values):
+        """Codes for an array of values in one hashed pass, -1 where a value is unknown"""
+        return self._index.get_indexer(np.asarray(values, dtype=object))
+
+
+class UnknownCategoryError(ValueError):
+    """Raised under the 'reject' policy for a value with no match at or above the minimum score"""
+
+    def __init__(self, name, value, closest=None):
+        self.name = name
+        self.value = value
+        self.closest = closest
+        message = f"Unknown {name} '{value}'"
+        if closest is not None:
+            message += f" (closest known value '{closest.category}' scores {closest.score:.2f})"
+        super().__init__(message)
+
+
+class UnknownCategoryCounter:
+    """Thread-safe unknown-hit counters, tracking at most max_tracked distinct values per field"""
+
+    def __init__(self, max_tracked=100):
+        self.max_tracked = max_tracked
+        self._lock = threading.Lock()
+        self._totals = {}
+        self._values = {}
+
+    def record(self, field, value, hits=1):
+        """Count hits for value; returns True the first time this value is tracked"""
+        with self._lock:
+            self._totals[field] = self._totals.get(field, 0) + hits
+            seen = self._values.setdefault(field, {})
+            if value in seen:
+                seen[value] += hits
+                return False
+            if len(seen) < self.max_tracked:
+                seen[value] = hits
+                return True
+            return False
+
+    def totals(self):
+        with self._lock:
+            return dict(self._totals)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                field: {
+                    "unknown_hits": total,
+                    "tracked_values": dict(self._values.get(field, {}))
+                }
+                for field, total in self._totals.items()
+            }
+
+
+class CategoryEncoder:
+    """
+    Encodes the categorical PredictionInput fields with precomputed lookup tables.
+
+    Values never seen during training are first resolved by fuzzy matching
+    (normalized name, alias, trigram similarity) when that is enabled and the
+    match scores at least min_match_score. Otherwise they go through a bounded
+    fallback policy: 'most_frequent' uses the code of the most common training
+    value for that field (computed once at load), 'sentinel' uses a fixed
+    sentinel code and 'reject' raises UnknownCategoryError.
+    The fitted encoders are never modified.
+    """
+
+    def __init__(self, label_encoders, training_data=None, policy='most_frequent', sentinel_code=-1, max_tracked_unknowns=100,
+                 fuzzy_matching=True, min_match_score=0.75):
+        if policy not in FALLBACK_POLICIES:
+            raise ValueError(f"Unknown category policy '{policy}', expected one of {FALLBACK_POLICIES}")
+
+        self.policy = policy
+        self.sentinel_code = sentinel_code
+        self.fuzzy_matching = fuzzy_matching
+        self.min_match_score = min_match_score
+        self.unknowns = UnknownCategoryCounter(max_tracked_unknowns)
+        self.tables = {}
+
+        for name, encoder in label_encoders.items():
+            classes = encoder.classes_.tolist()
+            if policy != 'most_frequent':
+                fallback_code = sentinel_code
+            else:
+                fallback_code = self._most_frequent_code(name, classes, training_data)
+            self.tables[name] = CategoryTable(name, classes, fallback_code)
+
+        logger.info(
+            f"Category encoder ready (policy={policy}): "
+            + ", ".join(f"{name}={len(table)} classes, fallback {table.fallback_code}" for name, table in self.tables.items())
+        )
+
+    @staticmethod
+    def _most_frequent_code(name, classes, training_data):
+        column = TRAINING_COLUMNS.get(name)
+        if training_data is not None and column in training_data.columns:
+            modes = training_data[column].mode()
+            if len(modes) > 0 and modes[0] in classes:
+                return classes.index(modes[0])
+        # Same ultimate fallback the API has always used
+        return 0
+
+    def _record_unknown(self, name, value, match, hits=1):
+        if self.unknowns.record(name, value, hits):
+            if match.method == "fallback":
+                logger.warning(f"Unknown {name}: '{value}' not in training data, using fallback code {match.code}")
+            else:
+                logger.info(f"Unknown {name}: '{value}' resolved to '{match.category}' ({match.method}, score {match.score})")
+
+    def resolve(self, name, value):
+        """
+        CategoryMatch for a value of field name: exact for training values,
+        otherwise the fuzzy match or the fallback code (method 'fallback',
+        score None). Raises UnknownCategoryError under the 'reject' policy.
+        """
+        table = self.tables[name]
+        code = table.lookup(value)
+        if code is not None:
+            return CategoryMatch(code, value, 1.0, "exact")
+        match = table.matcher.match(value) if self.fuzzy_matching else None
+        if match is not None and match.score >= self.min_match_score:
+            return match
+        if self.policy == 'reject':
+            raise UnknownCategoryError(name, value, match)
+        category = table.classes[table.fallback_code] if 0 <= table.fallback_code < len(table) else None
+        return CategoryMatch(table.fallback_code, category, None, "fallback")
+
+    def canonical(self, name, value):
+        """The training value a value stands for: itself, or its fuzzy match; values that fell back are returned as given"""
+        match = self.resolve(name, value)
+        return match.category if match.method not in ("exact", "fallback") else value
+
+    def encode(self, name, value):
+        """Encode one value of field name"""
+        table = self.tables[name]
+        code = table.lookup(value)
+        if code is None:
+            match = self.resolve(name, value)
+            self._record_unknown(name, value, match)
+            return match.code
+        return code
+
+    def encode_column(self, name, values):
+        """Encode a whole column of values for field name, returning an int64 array"""
+        table = self.tables[name]
+        codes = table.lookup_many(values).astype(np.int64)
+        unknown = codes < 0
+        if unknown.any():
+            unknown_values, inverse, counts = np.unique(
+                np.asarray(values, dtype=object)[unknown].astype(str), return_inverse=True, return_counts=True
+            )
+            # Each distinct unknown value is resolved once
+            matches = [self.resolve(name, value) for value in unknown_values.tolist()]
+            for value, match, hits in zip(unknown_values.tolist(), matches, counts.tolist()):
+                self._record_unknown(name, value, match, hits)
+            codes[unknown] = np.array([match.code for match in matches], dtype=np.int64)[inverse.ravel()]
+        return codes
+
+    def stats(self):
+        return {
+            "policy": self.policy,
+            "fallback_codes": {name: table.fallback_code for name, table in self.tables.items()},
+            "fuzzy_matching": {"enabled": self.fuzzy_matching, "min_score": self.min_match_score},
+            "unknown_categories": self.unknowns.snapshot()
+        }
@@ -0,0 +1,139 @@
+import re
+import unicodedata
+from collections import Counter, namedtuple
+
+# How a value was resolved to a known category: its code, the category, a 0-1 similarity and the method used
+CategoryMatch = namedtuple("CategoryMatch", ["code", "category", "score", "method"])
+
+# Words spelled out, and words dropped, before comparing names, so "Dem. Rep. of the Congo" == "Democratic Republic Congo"
+ABBREVIATIONS = {"rep": "republic", "dem": "democratic", "st": "saint", "fed": "federation"}
+STOPWORDS = frozenset(["the", "of", "and"])
+
+# Common alternative names, keyed by the UNHCR name used in the training data; only names a table contains are indexed
+ALIASES = {
+    "Dem. Rep. of the Congo": ["DR Congo", "DRC", "Congo (Kinshasa)", "Congo-Kinshasa", "Zaire"],
+    "Congo": ["Congo (Brazzaville)", "Congo-Brazzaville", "Republic of the Congo"],
+    "Côte d'Ivoire": ["Ivory Coast"],
+    "Central African Rep.": ["CAR"],
+    "Dem. People's Rep. of Korea": ["North Korea", "DPRK"],
+    "Rep. of Korea": ["South Korea", "Korea"],
+    "Syrian Arab Rep.": ["Syria"],
+    "Iran (Islamic Rep. of)": ["Iran"],
+    "Lao People's Dem. Rep.": ["Laos", "Lao PDR"],
+    "Rep. of Moldova": ["Moldova"],
+    "United Rep. of Tanzania": ["Tanzania"],
+    "United States of America": ["USA", "US", "United States"],
+    "United Kingdom": ["UK", "Great Britain", "Britain"],
+    "Russian Federation": ["Russia"],
+    "Viet Nam": ["Vietnam"],
+    "Bolivia (Plurinational State of)": ["Bolivia"],
+    "Venezuela (Bolivarian Republic of)": ["Venezuela"],
+    "Czech Rep.": ["Czechia"],
+    "The former Yugoslav Republic of Macedonia": ["North Macedonia", "Macedonia", "FYROM"],
+    "Swaziland": ["Eswatini"],
+    "Serbia and Kosovo (S/RES/1244 (1999))": ["Serbia", "Kosovo"],
+    "Palestinian": ["Palestine", "State of Palestine"],
+    "Cabo Verde": ["Cape Verde"],
+    "Timor-Leste": ["East Timor"],
+    "United Arab Emirates": ["UAE"],
+    "Myanmar": ["Burma"],
+    "China, Macao SAR": ["Macao", "Macau"],
+    "Various/Unknown": ["Unknown", "Various"],
+}
+
+# Resolved values remembered per table; cleared when full
+MEMO_SIZE = 4096
+
+# How far a trigram match must score above the best other class; closer calls are too ambiguous to use
+TRIGRAM_MIN_MARGIN = 0.1
+
+
+def normalize(value):
+    """Accent-, case- and punctuation-insensitive form of a category name with abbreviations spelled out"""
+    text = unicodedata.normalize("NFKD", str(value)).encode("ascii", "ignore").decode("ascii")
+    text = text.casefold().replace("&", " and ").replace("'", "")
+    words = (ABBREVIATIONS.get(word, word) for word in re.findall(r"[a-z0-9]+", text))
+    return " ".join(word for word in words if word not in STOPWORDS)
+
+
+def trigrams(normalized):
+    """Character trigrams of each word padded with two leading spaces and one trailing, as in pg_trgm"""
+    grams = set()
+    for word in normalized.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class CategoryMatcher:
+    """
+    Resolves a name that isn't one of a LabelEncoder's classes to the class it
+    most likely means: first by normalized name, then by known alias, then by
+    character-trigram similarity (Jaccard over trigram sets, 0-1). Trigrams
+    are looked up in an inverted index, so only classes sharing at least one
+    trigram with the value are scored. A trigram match is only made when it
+    scores at least min_margin above the best other class.
+    """
+
+    def __init__(self, classes, min_margin=TRIGRAM_MIN_MARGIN):
+        self.classes = tuple(classes)
+        self.min_margin = min_margin
+        self._names = {}
+        for code, value in enumerate(self.classes):
+            self._names.setdefault(normalize(value), code)
+        positions = {value: code for code, value in enumerate(self.classes)}
+        self._aliases = {}
+        for canonical, aliases in ALIASES.items():
+            if canonical in positions:
+                for alias in aliases:
+                    self._aliases.setdefault(normalize(alias), positions[canonical])
+
+        # One entry per class name and alias, each (code, trigram count), with trigram -> entry postings
+        self._entries = []
+        self._postings = {}
+        for name, code in list(self._names.items()) + list(self._aliases.items()):
+            grams = trigrams(name)
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(len(self._entries))
+            self._entries.append((code, len(grams)))
+        self._memo = {}
+
+    def match(self, value):
+        """Best CategoryMatch for value, or None if it shares nothing with any class or the best is ambiguous"""
+        match = self._memo.get(value)
+        if match is None and value not in self._memo:
+            match = self._match(value)
+            if len(self._memo) >= MEMO_SIZE:
+                self._memo.clear()
+            self._memo[value] = match
+        return match
+
+    def _match(self, value):
+        key = normalize(value)
+        if not key:
+            return None
+        if key in self._names:
+            code = self._names[key]
+            return CategoryMatch(code, self.classes[code], 1.0, "normalized")
+        if key in self._aliases:
+            code = self._aliases[key]
+            return CategoryMatch(code, self.classes[code], 1.0, "alias")
+
+        grams = trigrams(key)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._postings.get(gram, ()))
+        # Best score per class over its name and aliases
+        scores = {}
+        for entry, count in shared.items():
+            code, size = self._entries[entry]
+            scores[code] = max(scores.get(code, 0.0), count / (len(grams) + size - count))
+        if not scores:
+            return None
+        # Highest similarity wins, ties going to the lower code
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        code, score = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        if score - runner_up < self.min_margin:
+            return None
+        return CategoryMatch(code, self.classes[code], round(score, 4), "trigram")
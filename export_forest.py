@@ -0,0 +1,235 @@
+"""
+Export best_model.pkl as a compact forest file the API memory-maps instead
+of unpickling the model.
+
+    python export_forest.py --artifacts models/2024-09-15
+    python export_forest.py --artifacts models/2024-09-15 --tolerance 0.002
+    python export_forest.py --max-trees 50 --max-depth 16 --output /tmp/small.forest
+
+Writes <artifacts>/best_model.forest (forest_engine.CompactForest: float32
+thresholds and node values, narrow integer indices, one stored child per
+split) and forest_export_report.json. Without pruning options every tree is
+kept whole and predictions differ from the pickle's only by the float32
+node values. --max-trees keeps the first N trees and --max-depth cuts trees
+off at that depth; with --tolerance the export searches every depth cut and
+tree count within those caps and keeps the combination with the fewest
+nodes whose mean absolute difference from the pickle's predictions on the
+evaluation rows stays within the tolerance. Evaluation rows are sampled
+from training_data.csv, encoded and scaled as the API does, or drawn from a
+standard normal when there is no training data.
+
+The report compares the pickle and the exported file: size on disk, load
+time and RSS growth (each measured in a fresh interpreter), and prediction
+error against the pickle on the evaluation rows.
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from artifact_cache import content_hash
+from category_encoding import CategoryEncoder
+from feature_pipeline import ENCODED_ORDER, FEATURE_SOURCES, NUMERIC_ORDER
+from forest_engine import CompactForest
+
+logger = logging.getLogger(__name__)
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Load a model in a fresh interpreter; imports are excluded from the timing and the RSS growth
+LOADERS = {
+    "pickle": "import joblib\nstart = time.perf_counter()\nmodel = joblib.load(PATH)",
+    "compact": "from forest_engine import CompactForest\nstart = time.perf_counter()\nmodel = CompactForest.load(PATH)",
+}
+
+RUNNER = """
+import json, os, resource, sys, time, warnings
+warnings.filterwarnings("ignore")
+import numpy, sklearn.ensemble
+sys.path.insert(0, {repo!r})
+def rss_kb():
+    try:
+        return int(open("/proc/self/statm").read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+baseline_rss_kb = rss_kb()
+PATH = {path!r}
+{body}
+seconds = time.perf_counter() - start
+loaded_rss_kb = rss_kb()
+model.predict(numpy.random.default_rng(0).standard_normal((1000, {n_features})))
+print(json.dumps({{"seconds": seconds, "rss_growth_kb": loaded_rss_kb - baseline_rss_kb,
+                  "rss_growth_after_predict_kb": rss_kb() - baseline_rss_kb}}))
+"""
+
+
+def evaluation_rows(artifacts, scaler, label_encoders, n_features, n_rows, seed):
+    """Scaled feature rows sampled from training_data.csv, or standard-normal rows without it"""
+    rng = np.random.default_rng(seed)
+    path = os.path.join(artifacts, "training_data.csv")
+    if not os.path.exists(path):
+        logger.warning(f"{path} not found, evaluating on standard-normal rows")
+        return rng.standard_normal((n_rows, n_features))
+
+    frame = pd.read_csv(path)
+    if len(frame) > n_rows:
+        frame = frame.iloc[np.sort(rng.choice(len(frame), n_rows, replace=False))]
+    encoder = CategoryEncoder(label_encoders, frame, fuzzy_matching=False)
+    fields = {encoder_name: field for field, encoder_name in FEATURE_SOURCES.values() if encoder_name is not None}
+    columns = [encoder.encode_column(name, frame[fields[name]].astype(str).to_numpy(dtype=object)) for name in ENCODED_ORDER]
+    columns += [frame[field].to_numpy(dtype=np.float64) for field in NUMERIC_ORDER]
+    features = np.column_stack(columns)
+    return scaler.transform(features[~np.isnan(features).any(axis=1)])
+
+
+def pruning_candidates(forest, X, reference):
+    """
+    Mean absolute difference from reference and node count of every depth
+    cut and tree prefix of forest, each an array of shape (max_depth + 1,
+    n_trees): entry [d, k - 1] is the forest of the first k trees cut off at
+    depth d. One walk down the trees covers every depth, since a tree cut at
+    depth d predicts the value of the node a row has reached after d steps.
+    """
+    depths = forest.node_depths()
+    tree_of_node = np.repeat(np.arange(forest.n_trees), np.diff(np.append(forest.roots.astype(np.int64), forest.n_nodes)))
+    nodes = np.zeros((forest.max_depth + 1, forest.n_trees), dtype=np.int64)
+    np.add.at(nodes, (depths, tree_of_node), 1)
+    # Nodes at depth <= d in each tree, summed over the first k trees
+    nodes = np.cumsum(np.cumsum(nodes, axis=0), axis=1)
+
+    X = np.asarray(X, dtype=np.float32)
+    row_offsets = np.arange(len(X), dtype=np.int64) * forest.n_features
+    node = np.repeat(forest.roots.astype(np.int64)[:, None], len(X), axis=1)
+    errors = np.empty((forest.max_depth + 1, forest.n_trees))
+    tree_counts = np.arange(1, forest.n_trees + 1)[:, None]
+    for depth in range(forest.max_depth + 1):
+        prefix_means = np.cumsum(forest.value[node].astype(np.float64), axis=0) / tree_counts
+        errors[depth] = np.abs(prefix_means - reference).mean(axis=1)
+        child = forest.left[node].astype(np.int64)
+        go_right = ~(X.ravel()[row_offsets + forest.feature[node]] <= forest.threshold[node]) & (child != node)
+        node = child + go_right
+    return errors, nodes
+
+
+def choose_pruning(forest, X, reference, tolerance, max_trees=None, max_depth=None):
+    """(n_trees, max_depth) of the smallest forest within tolerance, or None if even the whole forest is not"""
+    errors, nodes = pruning_candidates(forest, X, reference)
+    errors = errors[:None if max_depth is None else max_depth + 1, :max_trees]
+    nodes = nodes[:errors.shape[0], :errors.shape[1]]
+    within = errors <= tolerance
+    if not within.any():
+        return None
+    # Fewest nodes first, then lowest error
+    candidates = np.flatnonzero(within)
+    best = candidates[np.lexsort((errors.ravel()[candidates], nodes.ravel()[candidates]))[0]]
+    depth, trees = np.unravel_index(best, errors.shape)
+    return int(trees) + 1, int(depth)
+
+
+def prediction_error(expected, actual):
+    diff = np.abs(expected - actual)
+    if not len(diff):
+        return {"mae": 0.0, "rmse": 0.0, "p99_abs": 0.0, "max_abs": 0.0}
+    return {
+        "mae": float(diff.mean()),
+        "rmse": float(np.sqrt(np.mean(diff ** 2))),
+        "p99_abs": float(np.quantile(diff, 0.99)),
+        "max_abs": float(diff.max()),
+    }
+
+
+def measure_load(kind, path, n_features, repeats):
+    """Median load seconds and largest RSS growth in MB over repeats fresh interpreters"""
+    script = RUNNER.format(repo=REPO_DIR, path=os.path.abspath(path), body=LOADERS[kind], n_features=n_features)
+    runs = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        "seconds": statistics.median(run["seconds"] for run in runs),
+        "rss_growth_mb": max(run["rss_growth_kb"] for run in runs) / 1024,
+        "rss_growth_after_predict_mb": max(run["rss_growth_after_predict_kb"] for run in runs) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--artifacts", default=".", help="directory holding best_model.pkl, scaler.pkl, ...")
+    parser.add_argument("--output", help="compact forest file to write (default: <artifacts>/best_model.forest)")
+    parser.add_argument("--max-trees", type=int, help="keep at most the first N trees")
+    parser.add_argument("--max-depth", type=int, help="cut trees off at this depth")
+    parser.add_argument("--tolerance", type=float,
+                        help="prune to the fewest nodes whose mean absolute difference from the pickle stays within this")
+    parser.add_argument("--eval-rows", type=int, default=5000, help="rows the pruning search and the error report use")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=3, help="fresh-interpreter load measurements per format")
+    parser.add_argument("--no-benchmark", action="store_true", help="skip the load time and RSS measurements")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logging.getLogger('category_encoding').setLevel(logging.ERROR)
+    model_path = os.path.join(args.artifacts, "best_model.pkl")
+    output = args.output or os.path.join(args.artifacts, "best_model.forest")
+
+    model = joblib.load(model_path)
+    X = evaluation_rows(args.artifacts, joblib.load(os.path.join(args.artifacts, "scaler.pkl")),
+                        joblib.load(os.path.join(args.artifacts, "label_encoders.pkl")),
+                        int(model.n_features_in_), args.eval_rows, args.seed)
+    reference = model.predict(X)
+
+    full = CompactForest.from_sklearn(model)
+    n_trees, max_depth = args.max_trees, args.max_depth
+    if args.tolerance is not None:
+        chosen = choose_pruning(full, X, reference, args.tolerance, args.max_trees, args.max_depth)
+        if chosen is None:
+            raise SystemExit(f"No forest within --max-trees/--max-depth stays within tolerance {args.tolerance}")
+        n_trees, max_depth = chosen
+    forest = full if n_trees is None and max_depth is None else CompactForest.from_sklearn(model, n_trees, max_depth)
+
+    stat = os.stat(model_path)
+    error = prediction_error(reference, forest.predict(X))
+    forest.header = {
+        # Lets the API tell an export of the current best_model.pkl from a stale one
+        "source": {"file": "best_model.pkl", "sha256": content_hash(model_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns},
+        "pruning": {"n_trees": n_trees, "max_depth": max_depth, "tolerance": args.tolerance},
+        "error_vs_pickle": dict(error, eval_rows=len(X)),
+    }
+    forest.save(output)
+
+    report = {
+        "output": output,
+        "eval_rows": len(X),
+        "trees": {"pickle": full.n_trees, "compact": forest.n_trees},
+        "max_depth": {"pickle": full.max_depth, "compact": forest.max_depth},
+        "nodes": {"pickle": full.n_nodes, "compact": forest.n_nodes},
+        "size_bytes": {"pickle": stat.st_size, "compact": os.path.getsize(output)},
+        "error_vs_pickle": error,
+        # The unpruned export, so the share of the error that pruning adds is visible
+        "quantization_error_vs_pickle": prediction_error(reference, full.predict(X)) if forest is not full else error,
+    }
+    if not args.no_benchmark:
+        report["load"] = {kind: measure_load(kind, path, forest.n_features, args.repeats)
+                          for kind, path in (("pickle", model_path), ("compact", output))}
+    with open(os.path.join(os.path.dirname(os.path.abspath(output)), "forest_export_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{forest.n_trees}/{full.n_trees} trees, depth {forest.max_depth}/{full.max_depth}, "
+          f"{forest.n_nodes:,}/{full.n_nodes:,} nodes -> {output}")
+    print(f"error vs pickle on {len(X):,} rows: MAE {error['mae']:.2e}, RMSE {error['rmse']:.2e}, "
+          f"p99 {error['p99_abs']:.2e}, max {error['max_abs']:.2e}")
+    print(f"\n{'':<10} {'size MB':>9} {'load s':>8} {'RSS MB':>8} {'RSS after predict MB':>21}")
+    for kind in ("pickle", "compact"):
+        load = report.get("load", {}).get(kind)
+        timings = f"{load['seconds']:>8.3f} {load['rss_growth_mb']:>8.1f} {load['rss_growth_after_predict_mb']:>21.1f}" if load else ""
+        print(f"{kind:<10} {report['size_bytes'][kind] / 1e6:>9.1f} {timings}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import logging
+from types import SimpleNamespace
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# feature_columns.pkl name -> (PredictionInput field, label encoder name or None for numeric columns)
+FEATURE_SOURCES = {
+    'country_encoded': ('country', 'country'),
+    'origin_encoded': ('origin', 'origin'),
+    'procedure_encoded': ('procedure_type', 'procedure'),
+    'Year': ('year', None),
+    'Applied during year': ('applied_during_year', None),
+    'Tota pending start-year': ('pending_start', None),
+    'of which UNHCR-assisted(start-year)': ('unhcr_assisted_start', None),
+    'decisions_other': ('decisions_other', None),
+}
+
+# Column order of the unscaled feature array the API has always built
+ENCODED_ORDER = ('country', 'origin', 'procedure')
+NUMERIC_ORDER = ('year', 'applied_during_year', 'pending_start', 'unhcr_assisted_start', 'decisions_other')
+
+
+class _CategoricalColumn:
+    __slots__ = ('position', 'field', 'encoder_name', 'scaled')
+
+    def __init__(self, position, field, encoder_name, scaled):
+        self.position = position
+        self.field = field
+        self.encoder_name = encoder_name
+        # Scaled value of every known code, with the fallback code's scaled value appended last
+        self.scaled = scaled
+
+    def lookup(self, codes):
+        # Codes come from CategoryEncoder, so anything outside the known range is the fallback code
+        known = len(self.scaled) - 1
+        return self.scaled[np.where((codes >= 0) & (codes < known), codes, known)]
+
+    def lookup_one(self, code):
+        known = len(self.scaled) - 1
+        return self.scaled[code if 0 <= code < known else known]
+
+
+class FusedFeaturePipeline:
+    """
+    LabelEncoder + StandardScaler folded into one step. StandardScaler is a
+    fixed affine map, so the scaled value of every category code is computed
+    once at load time and a categorical column becomes a single array lookup;
+    numeric columns are scaled in place with the scaler's own arithmetic
+    ((x - mean) / scale, not a multiply-add, so results are bit-identical to
+    scaler.transform). Output goes straight into one allocated feature matrix
+    in feature_columns order, with no intermediate unscaled array.
+    """
+
+    def __init__(self, category_encoder, scaler, feature_columns):
+        self.category_encoder = category_encoder
+        self.n_features = len(feature_columns)
+        self.mean = np.asarray(scaler.mean_, dtype=np.float64) if scaler.with_mean else None
+        self.scale = np.asarray(scaler.scale_, dtype=np.float64) if scaler.with_std else None
+        self.categorical = []
+        self.numeric = []
+
+        for position, name in enumerate(feature_columns):
+            field, encoder_name = FEATURE_SOURCES[name]
+            if encoder_name is None:
+                self.numeric.append((position, field))
+                continue
+            table = category_encoder.tables[encoder_name]
+            codes = np.arange(len(table) + 1, dtype=np.float64)
+            codes[-1] = table.fallback_code
+            self.categorical.append(_CategoricalColumn(position, field, encoder_name, self._scale_column(codes, position)))
+
+        self.numeric_positions = np.array([position for position, _ in self.numeric], dtype=np.intp)
+        # Contiguous numeric columns (the usual layout) are scaled through a view instead of a gathered copy
+        contiguous = len(self.numeric) > 0 and np.array_equal(
+            self.numeric_positions, np.arange(self.numeric_positions[0], self.numeric_positions[0] + len(self.numeric))
+        )
+        self.numeric_columns = slice(self.numeric_positions[0], self.numeric_positions[-1] + 1) if contiguous else self.numeric_positions
+        self.numeric_mean = self.mean[self.numeric_positions] if self.mean is not None else None
+        self.numeric_scale = self.scale[self.numeric_positions] if self.scale is not None else None
+
+    def _scale_column(self, values, position):
+        if self.mean is not None:
+            values = values - self.mean[position]
+        if self.scale is not None:
+            values = values / self.scale[position]
+        return values
+
+    def transform_one(self, input_data):
+        """Returns ((country, origin, procedure) codes, scaled 1 x n_features row) for one PredictionInput"""
+        out = np.empty((1, self.n_features))
+        row = out[0]
+        codes = {}
+        for column in self.categorical:
+            code = self.category_encoder.encode(column.encoder_name, getattr(input_data, column.field))
+            codes[column.encoder_name] = code
+            row[column.position] = column.lookup_one(code)
+        for i, (position, field) in enumerate(self.numeric):
+            value = float(getattr(input_data, field))
+            if self.numeric_mean is not None:
+                value -= self.numeric_mean[i]
+            if self.numeric_scale is not None:
+                value /= self.numeric_scale[i]
+            row[position] = value
+        return tuple(codes[name] for name in ENCODED_ORDER), out
+
+    def transform_columns(self, columns, out=None):
+        """
+        Encode and scale column-wise input (field -> sequence of values) into out
+        (allocated when not given). Returns (codes by encoder name, out).
+        """
+        codes = {
+            column.encoder_name: self.category_encoder.encode_column(column.encoder_name, columns[column.field])
+            for column in self.categorical
+        }
+        return codes, self.transform_codes(codes, columns, out)
+
+    def transform_codes(self, codes, columns, out=None):
+        """Scale already-encoded category codes and raw numeric columns into out"""
+        n = len(next(iter(codes.values())))
+        if out is None:
+            out = np.empty((n, self.n_features))
+        for column in self.categorical:
+            out[:, column.position] = column.lookup(codes[column.encoder_name])
+
+        numeric = out[:, self.numeric_columns]
+        for i, (_, field) in enumerate(self.numeric):
+            numeric[:, i] = columns[field]
+        if self.numeric_mean is not None:
+            numeric -= self.numeric_mean
+        if self.numeric_scale is not None:
+            numeric /= self.numeric_scale
+        if isinstance(self.numeric_columns, np.ndarray):
+            out[:, self.numeric_columns] = numeric
+        return out
+
+    def transform_many(self, inputs, out=None):
+        """Batch version of transform_one over a list of PredictionInputs"""
+        fields = [column.field for column in self.categorical] + [field for _, field in self.numeric]
+        columns = {field: [getattr(item, field) for item in inputs] for field in fields}
+        return self.transform_columns(columns, out)
+
+
+def verify_feature_pipeline(pipeline, scaler, training_data=None, samples=1000, seed=0):
+    """
+    Max absolute difference between the pipeline and the two-step path
+    (encoded codes stacked in the API's column order, then scaler.transform)
+    over every known code, every fallback code and sample numeric rows.
+    """
+    rng = np.random.default_rng(seed)
+    tables = pipeline.category_encoder.tables
+    rows = max(samples, max(len(tables[name]) + 1 for name in ENCODED_ORDER))
+
+    codes = {}
+    for name in ENCODED_ORDER:
+        table = tables[name]
+        known = np.append(np.arange(len(table), dtype=np.int64), table.fallback_code)
+        codes[name] = np.resize(known, rows)
+
+    numeric = {}
+    for field in NUMERIC_ORDER:
+        if training_data is not None and field in training_data.columns:
+            values = training_data[field].dropna().to_numpy(dtype=np.float64)
+            numeric[field] = rng.choice(values, rows) if len(values) else rng.integers(0, 10000, rows).astype(np.float64)
+        else:
+            numeric[field] = rng.integers(0, 10000, rows).astype(np.float64)
+
+    fused = pipeline.transform_codes(codes, numeric)
+    two_step = scaler.transform(np.column_stack([codes[name] for name in ENCODED_ORDER] + [numeric[field] for field in NUMERIC_ORDER]))
+    max_diff = float(np.max(np.abs(fused - two_step))) if not np.array_equal(fused, two_step) else 0.0
+
+    # The single-row path, on a sample of rows whose categories are all known
+    fields = {column.encoder_name: column.field for column in pipeline.categorical}
+    for i in range(0, rows, max(1, rows // 50)):
+        if not all(0 <= codes[name][i] < len(tables[name]) for name in ENCODED_ORDER):
+            continue
+        values = {fields[name]: tables[name].classes[codes[name][i]] for name in ENCODED_ORDER}
+        values.update({field: numeric[field][i] for field in NUMERIC_ORDER})
+        _, row = pipeline.transform_one(SimpleNamespace(**values))
+        if not np.array_equal(row[0], two_step[i]):
+            max_diff = max(max_diff, float(np.max(np.abs(row[0] - two_step[i]))))
+    return max_diff
+
+
+def build_feature_pipeline(category_encoder, scaler, feature_columns, training_data=None):
+    """Build the fused pipeline, keeping it only if it reproduces encode + scaler.transform exactly"""
+    try:
+        unknown = [name for name in feature_columns if name not in FEATURE_SOURCES]
+        if unknown:
+            logger.warning(f"Fused preprocessing disabled, unrecognized feature columns: {unknown}")
+            return None
+        pipeline = FusedFeaturePipeline(category_encoder, scaler, feature_columns)
+        max_diff = verify_feature_pipeline(pipeline, scaler, training_data)
+        if max_diff != 0.0:
+            logger.warning(f"Fused preprocessing differs from scaler.transform (max diff {max_diff}), using the two-step path")
+            return None
+        return pipeline
+    except Exception as e:
+        logger.error(f"Error building fused preprocessing: {e}")
+        return None
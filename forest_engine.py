@@ -0,0 +1,395 @@
+import json
+import logging
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ARRAY_NAMES = ('feature', 'threshold', 'left', 'right', 'value', 'roots')
+
+# Compact forest file: magic, little-endian uint32 header length, JSON header, then the arrays at aligned offsets
+COMPACT_MAGIC = b"RFC1"
+COMPACT_ARRAY_NAMES = ('feature', 'threshold', 'left', 'value', 'roots')
+COMPACT_ALIGNMENT = 64
+
+
+class CompiledForest:
+    """
+    Tree-ensemble regressor flattened into packed NumPy arrays.
+
+    Every node of every tree lives in one set of arrays (feature, threshold,
+    left, right, value). Leaves point at themselves, so all trees can be walked
+    in lockstep with vectorized indexing until every row has reached a leaf.
+    Predictions follow sklearn exactly: inputs are compared as float32 and
+    per-tree values are summed in tree order before dividing by the tree count.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth, n_features):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.n_features = n_features
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Flatten a fitted RandomForestRegressor, ExtraTreesRegressor or DecisionTreeRegressor"""
+        estimators = getattr(model, 'estimators_', None)
+        if estimators is None:
+            if not hasattr(model, 'tree_'):
+                raise TypeError(f"Cannot compile {type(model).__name__}: not a tree ensemble")
+            estimators = [model]
+        if getattr(model, 'n_outputs_', 1) != 1:
+            raise TypeError("Only single-output regressors can be compiled")
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in estimators:
+            tree = estimator.tree_
+            node_ids = np.arange(tree.node_count, dtype=np.int64)
+            is_leaf = tree.children_left < 0
+
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.int64))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold).astype(np.float64))
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+            values.append(tree.value[:, 0, 0].astype(np.float64))
+            roots.append(offset)
+
+            offset += tree.node_count
+            max_depth = max(max_depth, int(tree.max_depth))
+
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            left=np.concatenate(lefts),
+            right=np.concatenate(rights),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.int64),
+            max_depth=max_depth,
+            n_features=int(model.n_features_in_)
+        )
+
+    def save(self, directory):
+        """Write the packed arrays as .npy files plus a small JSON header"""
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAY_NAMES:
+            np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(getattr(self, name)))
+        with open(os.path.join(directory, "forest.json"), "w") as f:
+            json.dump({"max_depth": self.max_depth, "n_features": self.n_features}, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """
+        Load arrays written by save(). With mmap_mode='r' the arrays are memory-mapped
+        read-only, so processes loading the same directory share one copy in the page cache.
+        """
+        with open(os.path.join(directory, "forest.json")) as f:
+            header = json.load(f)
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode) for name in ARRAY_NAMES}
+        return cls(max_depth=header["max_depth"], n_features=header["n_features"], **arrays)
+
+    def apply(self, X):
+        """Leaf node index reached in every tree, shape (n_trees, n_rows)"""
+        # sklearn trees evaluate splits on float32 inputs
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"X has {X.shape[1]} features, but the forest expects {self.n_features}")
+
+        n_rows = X.shape[0]
+        X_flat = X.ravel()
+        row_offsets = np.arange(n_rows, dtype=np.int64) * self.n_features
+        node = np.repeat(self.roots[:, None], n_rows, axis=1)
+
+        for _ in range(self.max_depth):
+            go_left = X_flat[row_offsets + self.feature[node]] <= self.threshold[node]
+            next_node = np.where(go_left, self.left[node], self.right[node])
+            if np.array_equal(next_node, node):
+                break
+            node = next_node
+        return node
+
+    def predict_trees(self, X):
+        """Per-tree predictions, shape (n_trees, n_rows)"""
+        return self.value[self.apply(X)]
+
+    def predict(self, X):
+        return tree_mean(self.predict_trees(X))
+
+
+def _float32_floor(values):
+    """Largest float32 <= each float64 value: a float32 input is <= the result exactly when it is <= the value"""
+    rounded = values.astype(np.float32)
+    above = rounded.astype(np.float64) > values
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+
+def _aligned(n_bytes):
+    return -(-n_bytes // COMPACT_ALIGNMENT) * COMPACT_ALIGNMENT
+
+
+def _index_dtype(n_values):
+    """Narrowest unsigned integer type holding 0..n_values-1"""
+    return next(dtype for dtype in (np.uint8, np.uint16, np.uint32, np.uint64) if n_values <= np.iinfo(dtype).max + 1)
+
+
+def _breadth_first(tree, max_depth=None):
+    """
+    Node ids of an sklearn tree in breadth-first order, two children of a
+    split always next to each other, and whether each node stays a split when
+    the tree is cut off at max_depth
+    """
+    children_left, children_right = tree.children_left, tree.children_right
+    order, splits = [], []
+    level = np.zeros(1, dtype=np.int64)
+    depth = 0
+    while len(level):
+        split = children_left[level] >= 0
+        if max_depth is not None and depth >= max_depth:
+            split[:] = False
+        order.append(level)
+        splits.append(split)
+        parents = level[split]
+        level = np.column_stack([children_left[parents], children_right[parents]]).ravel()
+        depth += 1
+    return np.concatenate(order), np.concatenate(splits), depth - 1
+
+
+class CompactForest(CompiledForest):
+    """
+    Reduced-precision CompiledForest stored in a single memory-mappable file.
+
+    Thresholds and node values are float32 and feature and child indices use
+    the narrowest unsigned type that fits. Nodes are renumbered breadth-first
+    so the children of a split are adjacent: only the left child is stored
+    and the right one is left + 1. Thresholds are rounded down to float32,
+    which sends every float32 input down the same branch as the float64
+    threshold, so only the float32 node values move predictions, by about
+    1e-7 relative. Trees can also be dropped (the first n_trees are kept) or
+    cut off at max_depth, with each cut node predicting its training mean.
+    """
+
+    def __init__(self, feature, threshold, left, value, roots, max_depth, n_features, header=None, path=None):
+        super().__init__(feature, threshold, left, None, value, roots, max_depth, n_features)
+        # JSON header of the file this forest was loaded from or is to be saved with
+        self.header = header or {}
+        self.path = path
+
+    @classmethod
+    def from_sklearn(cls, model, n_trees=None, max_depth=None):
+        """Pack a fitted forest, keeping its first n_trees trees cut off at max_depth (None keeps everything)"""
+        estimators = getattr(model, 'estimators_', None)
+        if estimators is None:
+            if not hasattr(model, 'tree_'):
+                raise TypeError(f"Cannot compile {type(model).__name__}: not a tree ensemble")
+            estimators = [model]
+        if getattr(model, 'n_outputs_', 1) != 1:
+            raise TypeError("Only single-output regressors can be compiled")
+        estimators = list(estimators)[:n_trees]
+
+        features, thresholds, lefts, values, roots = [], [], [], [], []
+        offset = 0
+        forest_depth = 0
+        for estimator in estimators:
+            tree = estimator.tree_
+            order, split, depth = _breadth_first(tree, max_depth)
+            position = np.empty(tree.node_count, dtype=np.int64)
+            position[order] = np.arange(len(order)) + offset
+            # Split children sit in pairs after the nodes above them, in the order of their parents
+            first_child = np.cumsum(split) * 2 - 1 + offset
+
+            features.append(np.where(split, tree.feature[order], 0))
+            thresholds.append(np.where(split, tree.threshold[order], np.inf))
+            lefts.append(np.where(split, first_child, position[order]))
+            values.append(tree.value[order, 0, 0])
+            roots.append(offset)
+            offset += len(order)
+            forest_depth = max(forest_depth, depth)
+
+        n_features = int(model.n_features_in_)
+        return cls(
+            feature=np.concatenate(features).astype(_index_dtype(n_features)),
+            threshold=_float32_floor(np.concatenate(thresholds)),
+            left=np.concatenate(lefts).astype(_index_dtype(offset)),
+            value=np.concatenate(values).astype(np.float32),
+            roots=np.asarray(roots, dtype=_index_dtype(offset)),
+            max_depth=forest_depth,
+            n_features=n_features
+        )
+
+    def save(self, path):
+        """Write the forest to path as one file, replacing it atomically"""
+        arrays = {name: np.ascontiguousarray(getattr(self, name)) for name in COMPACT_ARRAY_NAMES}
+        header = dict(self.header, format=1, n_features=self.n_features, max_depth=self.max_depth,
+                      n_trees=self.n_trees, n_nodes=self.n_nodes, arrays={})
+        header.pop("header_bytes", None)
+        # Offsets count from the first aligned position after the header
+        offset = 0
+        for name, array in arrays.items():
+            header["arrays"][name] = {"dtype": array.dtype.str, "length": len(array), "offset": offset}
+            offset += _aligned(array.nbytes)
+        encoded = json.dumps(header).encode()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(COMPACT_MAGIC + struct.pack('<I', len(encoded)) + encoded)
+                data_start = _aligned(8 + len(encoded))
+                for name, array in arrays.items():
+                    f.seek(data_start + header["arrays"][name]["offset"])
+                    f.write(array.tobytes())
+            # mkstemp creates the file 0600; a server running as another user must be able to map it
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_path, 0o644 & ~umask)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self.header, self.path = header, path
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map a file written by save(); processes loading the same file share one copy in the page cache"""
+        header = read_compact_header(path)
+        data_start = _aligned(8 + header["header_bytes"])
+        data = np.memmap(path, dtype=np.uint8, mode='r')
+        arrays = {}
+        for name in COMPACT_ARRAY_NAMES:
+            entry = header["arrays"][name]
+            dtype = np.dtype(entry["dtype"])
+            start = data_start + entry["offset"]
+            arrays[name] = data[start:start + entry["length"] * dtype.itemsize].view(dtype)
+        return cls(max_depth=header["max_depth"], n_features=header["n_features"], header=header, path=path, **arrays)
+
+    def apply(self, X):
+        """Leaf node index reached in every tree, shape (n_trees, n_rows)"""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"X has {X.shape[1]} features, but the forest expects {self.n_features}")
+
+        n_rows = X.shape[0]
+        X_flat = X.ravel()
+        row_offsets = np.arange(n_rows, dtype=np.int64) * self.n_features
+        node = np.repeat(self.roots.astype(np.int64)[:, None], n_rows, axis=1)
+
+        for _ in range(self.max_depth):
+            child = self.left[node].astype(np.int64)
+            # Leaves point at themselves; a split goes to its right child, left + 1, when the test fails
+            go_right = ~(X_flat[row_offsets + self.feature[node]] <= self.threshold[node]) & (child != node)
+            next_node = child + go_right
+            if np.array_equal(next_node, node):
+                break
+            node = next_node
+        return node
+
+    def predict_trees(self, X):
+        """Per-tree predictions, shape (n_trees, n_rows), as float64 so the tree mean is summed at full precision"""
+        return self.value[self.apply(X)].astype(np.float64)
+
+    def node_depths(self):
+        """Depth of every node, the roots being at depth 0"""
+        depths = np.zeros(self.n_nodes, dtype=np.int64)
+        level = self.roots.astype(np.int64)
+        depth = 0
+        while len(level):
+            depths[level] = depth
+            child = self.left[level].astype(np.int64)
+            parents = child != level
+            level = np.column_stack([child[parents], child[parents] + 1]).ravel()
+            depth += 1
+        return depths
+
+
+def read_compact_header(path):
+    """The JSON header of a compact forest file, without mapping its arrays"""
+    with open(path, 'rb') as f:
+        prefix = f.read(8)
+        if len(prefix) < 8 or prefix[:4] != COMPACT_MAGIC:
+            raise ValueError(f"{path} is not a compact forest file")
+        (length,) = struct.unpack('<I', prefix[4:])
+        header = json.loads(f.read(length))
+    header["header_bytes"] = length
+    return header
+
+
+def tree_mean(per_tree):
+    """Forest prediction from per-tree predictions, shape (n_trees, n_rows)"""
+    # A running sum adds the trees strictly in order, as sklearn does; np.sum may use pairwise summation
+    return np.cumsum(per_tree, axis=0)[-1] / len(per_tree)
+
+
+def tree_predictions(model, X):
+    """
+    Per-tree predictions, shape (n_trees, n_rows), of a CompiledForest or a
+    fitted sklearn forest; None for any other model.
+    """
+    if isinstance(model, CompiledForest):
+        return model.predict_trees(X)
+    estimators = getattr(model, 'estimators_', None)
+    if estimators is None or getattr(model, 'n_outputs_', 1) != 1:
+        return None
+    # The float32 conversion sklearn's forest.predict does once before calling each tree
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    return np.stack([estimator.predict(X, check_input=False) for estimator in estimators])
+
+
+def predict_with_uncertainty(model, X, interval):
+    """
+    Predictions equal to model.predict(X) plus the spread of the individual
+    trees, from a single pass over the forest: (predictions, (std, lower,
+    upper)) where lower/upper bound the central `interval` of the per-tree
+    predictions. The spread is None for models that are not forests.
+    """
+    per_tree = tree_predictions(model, X)
+    if per_tree is None or len(per_tree) < 2:
+        return model.predict(X), None
+    mean = tree_mean(per_tree)
+    # Summed in tree order like the mean, so a row's std does not depend on the batch it came in
+    std = np.sqrt(tree_mean((per_tree - mean) ** 2))
+    alpha = (1.0 - interval) / 2
+    lower, upper = np.quantile(per_tree, [alpha, 1.0 - alpha], axis=0)
+    return mean, (std, lower, upper)
+
+
+def compile_forest(model):
+    """Compile model, or return None if it is not a supported tree ensemble"""
+    try:
+        return CompiledForest.from_sklearn(model)
+    except (TypeError, AttributeError) as e:
+        logger.warning(f"Compiled inference unavailable: {e}")
+        return None
+
+
+def verify_compiled_forest(compiled, model, X=None, n_samples=2000, seed=0):
+    """
+    Check compiled predictions against model.predict.
+    Uses X if given, otherwise standard-normal rows (the scaled feature space).
+    Returns the largest absolute difference.
+    """
+    if X is None:
+        X = np.random.default_rng(seed).standard_normal((n_samples, compiled.n_features))
+    expected = model.predict(X)
+    actual = compiled.predict(X)
+    return float(np.max(np.abs(expected - actual))) if len(X) else 0.0
@@ -0,0 +1,187 @@
+import bisect
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+RECORD_FIELDS = ['applied_during_year', 'pending_start', 'unhcr_assisted_start', 'decisions_other']
+
+
+def _nanmean(values):
+    """NaN-skipping mean computed the same way as pandas Series.mean, so summaries match a DataFrame scan exactly"""
+    mask = np.isnan(values)
+    count = len(values) - mask.sum()
+    if count == 0:
+        return float('nan')
+    return float(np.where(mask, 0.0, values).sum() / count)
+
+
+class _PairEntry:
+    """Year-sorted view of every training row for one (country, origin) pair"""
+
+    __slots__ = ('years', 'first_pos', 'last_pos', 'rates', 'summary')
+
+    def __init__(self, years, first_pos, last_pos, rates, summary):
+        self.years = years
+        self.first_pos = first_pos
+        self.last_pos = last_pos
+        # acceptance_rate of every row of the pair in row order, kept so appends can recompute the mean exactly
+        self.rates = rates
+        self.summary = summary
+
+
+class HistoricalIndex:
+    """
+    Hash index from (country, origin) to year-sorted row positions in training_data,
+    with the similar-case summary (count, mean acceptance_rate, years) pre-aggregated.
+
+    append() adds rows after the existing ones and rebuilds only the entries
+    of the pairs they touch. Entries are replaced, never modified, so lookups
+    need no lock while an append is running.
+    """
+
+    def __init__(self, training_data):
+        self._year_values = training_data['year'].to_numpy()
+        self._record_columns = {
+            field: training_data[field].to_numpy() if field in training_data.columns else None
+            for field in RECORD_FIELDS
+        }
+        self._base_rows = len(training_data)
+        self._appended_records = {field: [] for field in RECORD_FIELDS}
+        self._append_lock = threading.Lock()
+        self.row_count = len(training_data)
+
+        rates = training_data['acceptance_rate'].to_numpy(dtype=np.float64) if 'acceptance_rate' in training_data.columns else None
+        self._has_rates = rates is not None
+        grouped = training_data.groupby(['country', 'origin'], sort=False, observed=True)
+
+        self._pairs = {}
+        for key, positions in grouped.indices.items():
+            row_count = len(positions)
+            pair_rates = rates[positions] if rates is not None else np.full(row_count, np.nan)
+            avg_rate = _nanmean(pair_rates) if rates is not None else None
+            years = self._year_values[positions]
+            valid = ~pd.isna(years)
+            positions, years = positions[valid], years[valid]
+            unique_years, first_idx = np.unique(years, return_index=True)
+            # np.unique keeps the first occurrence, so reverse to find the last row per year
+            _, last_idx = np.unique(years[::-1], return_index=True)
+            self._pairs[key] = _PairEntry(
+                years=unique_years.tolist(),
+                first_pos=positions[first_idx].tolist(),
+                last_pos=positions[len(positions) - 1 - last_idx].tolist(),
+                rates=pair_rates,
+                summary={
+                    "count": row_count,
+                    "avg_acceptance_rate": avg_rate,
+                    "years_available": unique_years.tolist()
+                }
+            )
+
+        logger.info(f"Historical index built: {len(self._pairs)} (country, origin) pairs")
+
+    def append(self, records):
+        """
+        Add rows (a DataFrame with the training_data columns) after the existing
+        ones. The result is the same index a full build over the combined rows gives.
+        """
+        with self._append_lock:
+            start = self.row_count
+            years = records['year'].tolist()
+            if 'acceptance_rate' in records.columns:
+                self._has_rates = True
+                rates = records['acceptance_rate'].to_numpy(dtype=np.float64)
+            else:
+                rates = np.full(len(records), np.nan)
+            # Row values first, so a published entry never points at a row that isn't stored yet
+            for field in RECORD_FIELDS:
+                values = records[field].tolist() if field in records.columns else [0] * len(records)
+                self._appended_records[field].extend(values)
+
+            offsets_by_pair = {}
+            for offset, key in enumerate(zip(records['country'], records['origin'])):
+                offsets_by_pair.setdefault(key, []).append(offset)
+            for key, offsets in offsets_by_pair.items():
+                self._pairs[key] = self._extended_entry(self._pairs.get(key), start, offsets, years, rates)
+            self.row_count = start + len(records)
+            return len(offsets_by_pair)
+
+    def _extended_entry(self, entry, start, offsets, years, rates):
+        if entry is None:
+            pair_years, first_pos, last_pos, pair_rates, count = [], [], [], np.empty(0), 0
+        else:
+            pair_years, first_pos, last_pos = list(entry.years), list(entry.first_pos), list(entry.last_pos)
+            pair_rates, count = entry.rates, entry.summary["count"]
+
+        for offset in offsets:
+            year, position = years[offset], start + offset
+            if pd.isna(year):
+                continue
+            i = bisect.bisect_left(pair_years, year)
+            if i < len(pair_years) and pair_years[i] == year:
+                last_pos[i] = position
+            else:
+                pair_years.insert(i, year)
+                first_pos.insert(i, position)
+                last_pos.insert(i, position)
+
+        pair_rates = np.concatenate([pair_rates, rates[offsets]])
+        return _PairEntry(
+            years=pair_years,
+            first_pos=first_pos,
+            last_pos=last_pos,
+            rates=pair_rates,
+            summary={
+                "count": count + len(offsets),
+                "avg_acceptance_rate": _nanmean(pair_rates) if self._has_rates else None,
+                "years_available": list(pair_years)
+            }
+        )
+
+    def summary(self, country, origin):
+        """Pre-aggregated similar-case summary for a pair, or None if the pair is unseen"""
+        entry = self._pairs.get((country, origin))
+        return entry.summary if entry is not None else None
+
+    def find(self, country, origin, year):
+        """
+        Locate the row /historical-data should return.
+        Returns (row_position, matched_year, exact) or None when the pair has no data.
+        An exact year returns its last row; otherwise the closest year wins,
+        ties going to whichever row appears first in training_data.
+        """
+        entry = self._pairs.get((country, origin))
+        if entry is None or not entry.years:
+            return None
+
+        years = entry.years
+        i = bisect.bisect_left(years, year)
+        if i < len(years) and years[i] == year:
+            return entry.last_pos[i], years[i], True
+
+        candidates = [j for j in (i - 1, i) if 0 <= j < len(years)]
+        best = min(candidates, key=lambda j: (abs(years[j] - year), entry.first_pos[j]))
+        return entry.first_pos[best], years[best], False
+
+    def record(self, position):
+        """Numeric fields of one training row, as returned by /historical-data"""
+        if position >= self._base_rows:
+            return {field: int(values[position - self._base_rows]) for field, values in self._appended_records.items()}
+        return {
+            field: int(values[position]) if values is not None else 0
+            for field, values in self._record_columns.items()
+        }
+
+
+def build_historical_index(training_data):
+    """Build the index, or return None if training_data lacks the columns it needs"""
+    if training_data is None:
+        return None
+    missing = [column for column in ('country', 'origin', 'year') if column not in training_data.columns]
+    if missing:
+        logger.warning(f"Historical index not built, training data is missing columns: {missing}")
+        return None
+    return HistoricalIndex(training_data)
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+
+from forest_engine import CompactForest, CompiledForest, predict_with_uncertainty
+
+logger = logging.getLogger(__name__)
+
+# Per-worker state, populated once by _init_worker
+_worker_scaler = None
+_worker_model = None
+
+
+def _init_worker(artifact_dir, shared_forest_dir, compact_forest_path=None):
+    """Load the artifacts once when a worker process starts"""
+    global _worker_scaler, _worker_model
+    _worker_scaler = joblib.load(os.path.join(artifact_dir, "scaler.pkl"))
+    if compact_forest_path is not None:
+        _worker_model = CompactForest.load(compact_forest_path)
+    elif shared_forest_dir is not None:
+        # Memory-mapped read-only: every worker shares the parent's exported arrays
+        _worker_model = CompiledForest.load(shared_forest_dir, mmap_mode='r')
+    else:
+        _worker_model = joblib.load(os.path.join(artifact_dir, "best_model.pkl"))
+
+
+def _worker_predict(features_array, interval=None):
+    """
+    Scale unscaled feature rows and predict them inside a worker; with an
+    interval, returns (predictions, per-tree spread) as predict_with_uncertainty does
+    """
+    features_scaled = _worker_scaler.transform(features_array)
+    if interval is None:
+        return _worker_model.predict(features_scaled)
+    return predict_with_uncertainty(_worker_model, features_scaled, interval)
+
+
+def _worker_ping():
+    return os.getpid()
+
+
+class InferencePool:
+    """
+    Process pool for CPU-bound scaling and forest inference.
+
+    Categorical encoding stays in the request process (it is a dict lookup and
+    owns the unknown-category counters); workers receive encoded, unscaled
+    feature rows. Each worker loads scaler.pkl once. When a compiled forest is
+    given, its packed arrays are exported once to a temporary directory and
+    memory-mapped by every worker instead of each worker unpickling its own
+    copy of best_model.pkl; a compact forest is already a single file, which
+    the workers map directly. At most max_in_flight predictions are submitted
+    at a time; further callers wait their turn.
+    """
+
+    def __init__(self, workers=None, max_in_flight=None, artifact_dir=".", compiled_forest=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or 4 * self.workers
+        self._shared_forest_dir = None
+        self._compact_forest_path = None
+        if isinstance(compiled_forest, CompactForest) and compiled_forest.path is not None:
+            self._compact_forest_path = os.path.abspath(compiled_forest.path)
+        elif compiled_forest is not None:
+            self._shared_forest_dir = tempfile.mkdtemp(prefix="forest-")
+            compiled_forest.save(self._shared_forest_dir)
+
+        # spawn avoids forking a process that already runs the server's threads
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(os.path.abspath(artifact_dir), self._shared_forest_dir, self._compact_forest_path)
+        )
+        self._semaphore = None
+        self._stats_lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.errors = 0
+
+    def warmup(self):
+        """Start every worker now so the first requests don't pay for process start-up"""
+        pids = {future.result() for future in [self._executor.submit(_worker_ping) for _ in range(self.workers)]}
+        logger.info(f"Inference pool ready: {self.workers} workers ({len(pids)} started), max {self.max_in_flight} in flight")
+
+    def _acquire_semaphore(self):
+        # Created lazily so it binds to the server's running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._semaphore
+
+    async def predict(self, features_array, interval=None):
+        """Scale and predict unscaled feature rows in a worker process (with their spread when interval is given)"""
+        semaphore = self._acquire_semaphore()
+        with self._stats_lock:
+            self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            with self._stats_lock:
+                self.waiting -= 1
+
+        with self._stats_lock:
+            self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            predictions = await loop.run_in_executor(self._executor, _worker_predict, np.asarray(features_array), interval)
+        except Exception:
+            with self._stats_lock:
+                self.errors += 1
+            raise
+        finally:
+            semaphore.release()
+            with self._stats_lock:
+                self.in_flight -= 1
+
+        with self._stats_lock:
+            self.completed += 1
+        return predictions
+
+    def shutdown(self, cancel_pending=True):
+        self._executor.shutdown(wait=True, cancel_futures=cancel_pending)
+        if self._shared_forest_dir is not None:
+            shutil.rmtree(self._shared_forest_dir, ignore_errors=True)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "enabled": True,
+                "workers": self.workers,
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "completed": self.completed,
+                "errors": self.errors,
+                "shared_forest_arrays": self._shared_forest_dir is not None or self._compact_forest_path is not None
+            }
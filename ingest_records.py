@@ -0,0 +1,100 @@
+"""
+Add new historical records to a model version without retraining or a
+full reload.
+
+    python ingest_records.py new_rows.csv --url http://localhost:8000 --token $ADMIN_TOKEN
+    python ingest_records.py new_rows.ndjson --artifacts models/2024-09-15
+    python ingest_records.py --artifacts models/2024-09-15 --compact
+
+With --url the records are posted to /admin/ingest of a running API, which
+appends them to the active version's log and serves them immediately.
+Without it they are appended to the ingestion log in --artifacts directly
+and picked up the next time that version is loaded. --compact merges the
+log into training_data.csv (through /admin/compact when --url is given).
+Invalid rows are reported and skipped; --strict aborts before writing
+anything instead.
+"""
+import argparse
+import json
+import sys
+import urllib.error
+import urllib.request
+
+import pandas as pd
+
+from ingestion import HistoricalRecord, IngestionLog, validate_records
+
+BATCH_SIZE = 10_000
+
+
+def read_records(path):
+    """Rows of a CSV (with header) or NDJSON file as dicts; blanks become None so validation reports them"""
+    if path.endswith(('.ndjson', '.jsonl')):
+        frame = pd.read_json(path, lines=True, dtype=False)
+    else:
+        text_fields = {'country': object, 'origin': object, 'procedure_type': object}
+        frame = pd.read_csv(path, dtype=text_fields)
+    missing = [field for field in HistoricalRecord.model_fields if field not in frame.columns]
+    if missing:
+        raise SystemExit(f"{path} is missing columns: {missing}")
+    frame = frame[list(HistoricalRecord.model_fields)].astype(object)
+    return frame.where(frame.notna(), None).to_dict('records')
+
+
+def post(url, path, token, payload=None):
+    request = urllib.request.Request(
+        url.rstrip('/') + path,
+        data=json.dumps(payload or {}).encode('utf-8'),
+        headers={'Content-Type': 'application/json', **({'X-Admin-Token': token} if token else {})},
+        method='POST'
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        raise SystemExit(f"POST {path} failed with {e.code}: {e.read().decode('utf-8', errors='replace')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", nargs="?", help="CSV with a header row, or NDJSON (.ndjson/.jsonl), with the training_data.csv columns")
+    parser.add_argument("--artifacts", default=".", help="model version directory holding training_data.csv")
+    parser.add_argument("--url", help="base URL of a running API to ingest through")
+    parser.add_argument("--token", help="admin token for --url")
+    parser.add_argument("--compact", action="store_true", help="merge the ingestion log into training_data.csv")
+    parser.add_argument("--strict", action="store_true", help="abort if any row is invalid")
+    args = parser.parse_args()
+    if not args.input and not args.compact:
+        parser.error("give an input file, --compact, or both")
+
+    if args.input:
+        valid, errors = validate_records(read_records(args.input))
+        for index, message in errors[:20]:
+            # +2: one for the header line, one for 1-based numbering
+            print(f"row {index + 2}: {message}", file=sys.stderr)
+        if len(errors) > 20:
+            print(f"... and {len(errors) - 20} more invalid rows", file=sys.stderr)
+        if errors and args.strict:
+            raise SystemExit(f"{len(errors)} invalid rows, nothing ingested")
+
+        if args.url:
+            for start in range(0, len(valid), BATCH_SIZE):
+                status = post(args.url, "/admin/ingest", args.token, {"records": valid[start:start + BATCH_SIZE]})
+            if valid:
+                print(f"Ingested {len(valid)} records into model {status['model_version']} "
+                      f"({status['pending_records']} pending compaction), skipped {len(errors)}", file=sys.stderr)
+        else:
+            IngestionLog(args.artifacts).append(valid)
+            print(f"Appended {len(valid)} records to the ingestion log in {args.artifacts}, skipped {len(errors)}; "
+                  f"a running API picks them up on its next reload", file=sys.stderr)
+
+    if args.compact:
+        if args.url:
+            merged = post(args.url, "/admin/compact", args.token)["compacted"]
+        else:
+            merged = IngestionLog(args.artifacts).compact()
+        print(f"Compacted {merged} records into training_data.csv", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
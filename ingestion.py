@@ -0,0 +1,159 @@
+import csv
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+import pandas as pd
+from pydantic import BaseModel, Field, ValidationError
+
+from artifact_cache import content_hash
+from bulk_scoring import validation_message
+
+logger = logging.getLogger(__name__)
+
+# Append-only log kept next to training_data.csv in each model version directory
+INGEST_LOG_FILE = "training_data.ingest.jsonl"
+
+
+class HistoricalRecord(BaseModel):
+    """One row of training_data.csv"""
+    country: str = Field(..., min_length=1)
+    origin: str = Field(..., min_length=1)
+    procedure_type: str = Field(..., min_length=1)
+    year: int = Field(..., ge=1900, le=2100)
+    applied_during_year: int = Field(..., ge=0)
+    pending_start: int = Field(..., ge=0)
+    unhcr_assisted_start: int = Field(..., ge=0)
+    decisions_other: int = Field(..., ge=0)
+    acceptance_rate: float = Field(..., ge=0.0, le=1.0)
+
+
+def validate_records(raw_records):
+    """Returns (valid records as dicts, [(index, error message)]) for a list of raw dicts"""
+    valid, errors = [], []
+    for index, raw in enumerate(raw_records):
+        try:
+            valid.append(HistoricalRecord.model_validate(raw).model_dump())
+        except ValidationError as e:
+            errors.append((index, validation_message(e)))
+    return valid, errors
+
+
+def records_frame(records):
+    return pd.DataFrame(records, columns=list(HistoricalRecord.model_fields))
+
+
+class IngestionLog:
+    """
+    Append-only NDJSON log of records added on top of training_data.csv.
+
+    The first line names the content hash of the CSV it extends. A log whose
+    base hash no longer matches has already been merged by compact() (which
+    rewrites the CSV before removing the log), so it is ignored rather than
+    replayed twice if the process died in between.
+    """
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, INGEST_LOG_FILE)
+        self.base_path = os.path.join(directory, "training_data.csv")
+        self._lock = threading.Lock()
+        self._base_hash = None
+
+    def _current_base_hash(self, refresh=False):
+        if self._base_hash is None or refresh:
+            self._base_hash = content_hash(self.base_path) if os.path.exists(self.base_path) else ""
+        return self._base_hash
+
+    def read(self):
+        """Records in the log, in append order; [] when there is no current log"""
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, encoding="utf-8") as f:
+            header = f.readline()
+            try:
+                base_hash = json.loads(header).get("base")
+            except ValueError:
+                base_hash = None
+            if base_hash != self._current_base_hash():
+                logger.warning(f"Ignoring {self.path}: it extends a different training_data.csv (already compacted?)")
+                return []
+            records = []
+            for line in f:
+                # A torn final line from a crash mid-append is dropped
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    logger.warning(f"Skipping unreadable line in {self.path}")
+            return records
+
+    def append(self, records):
+        """Durably append validated records (one write, then fsync)"""
+        if not records:
+            return
+        with self._lock:
+            lines = []
+            if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+                # A new log: hash the CSV as it is now, in case it was compacted by another process
+                lines.append(json.dumps({"base": self._current_base_hash(refresh=True)}))
+            lines.extend(json.dumps(record) for record in records)
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, ("\n".join(lines) + "\n").encode("utf-8"))
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def compact(self):
+        """
+        Merge the log into training_data.csv: write base rows + log rows to a
+        temporary file, swap it in atomically, then remove the log.
+        Returns the number of records merged.
+        """
+        with self._lock:
+            records = self.read()
+            if not records:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                return 0
+
+            directory = os.path.dirname(os.path.abspath(self.base_path))
+            fd, tmp_path = tempfile.mkstemp(prefix=".training_data.", suffix=".csv", dir=directory)
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+                    if os.path.exists(self.base_path):
+                        with open(self.base_path, encoding="utf-8", newline="") as base:
+                            header = base.readline()
+                            f.write(header if header.endswith("\n") else header + "\n")
+                            columns = next(csv.reader([header]))
+                            # Copied as is; only the new rows are formatted
+                            last = "\n"
+                            for chunk in iter(lambda: base.read(1 << 20), ""):
+                                f.write(chunk)
+                                last = chunk[-1]
+                            if last != "\n":
+                                f.write("\n")
+                    else:
+                        columns = list(HistoricalRecord.model_fields)
+                        f.write(",".join(columns) + "\n")
+                    records_frame(records).reindex(columns=columns).to_csv(f, header=False, index=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+                # mkstemp creates the file 0600; keep training_data.csv readable by whoever could read it before
+                if os.path.exists(self.base_path):
+                    shutil.copymode(self.base_path, tmp_path)
+                else:
+                    umask = os.umask(0)
+                    os.umask(umask)
+                    os.chmod(tmp_path, 0o666 & ~umask)
+                os.replace(tmp_path, self.base_path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            self._base_hash = None
+            os.remove(self.path)
+            logger.info(f"Compacted {len(records)} ingested records into {self.base_path}")
+            return len(records)
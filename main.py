@@ -1,181 +1,398 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field
+from fastapi import FastAPI, HTTPException, Header, Response, Request, Query
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Literal, Optional
 from fastapi.middleware.cors import CORSMiddleware
-import joblib
+from starlette.concurrency import run_in_threadpool
 import numpy as np
 import uvicorn
 import pickle
-import pandas as pd
-from sklearn.preprocessing import LabelEncoder
+import hmac
+import json
+import math
 import logging
+import os
+import threading
+import time
+from prediction_cache import PredictionCache
+from micro_batcher import MicroBatcher
+from inference_pool import InferencePool
+from model_registry import BundleSettings, ModelRegistry
+from model_info import ModelInfo, etag_matches
+from ingestion import HistoricalRecord
+from prediction_input import PredictionInput, field_bounds
+from category_encoding import TRAINING_COLUMNS as CATEGORY_FIELDS, UnknownCategoryError
+from rollups import LEVELS as ROLLUP_LEVELS, METRICS as ROLLUP_METRICS
+from bulk_scoring import FORMATS as STREAM_FORMATS, MAX_LINE_BYTES as MAX_STREAM_LINE_BYTES, BodyStreamingResponse, iter_records, iter_chunks, validate_chunk
+from admission import DEFAULT_LIMITS as DEFAULT_ADMISSION_LIMITS, AdmissionControl, AdmissionMiddleware, parse_limits
+from profiling import ProfilingMiddleware, RequestProfiler, record_stage
+from metrics import MetricsRegistry, MetricsMiddleware, CONTENT_TYPE as METRICS_CONTENT_TYPE
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Unknown category fallback: "most_frequent" training value, a fixed "sentinel" code, or "reject" with a 422
+UNKNOWN_CATEGORY_POLICY = os.getenv("UNKNOWN_CATEGORY_POLICY", "most_frequent")
+UNKNOWN_CATEGORY_SENTINEL = int(os.getenv("UNKNOWN_CATEGORY_SENTINEL", "-1"))
+# Unknown names are first resolved to the closest known category (normalized name, alias, then character-trigram
+# similarity); matches scoring below FUZZY_MATCH_MIN_SCORE, or trigram matches too close to the next-best category,
+# go to the fallback policy instead
+FUZZY_CATEGORY_MATCHING = os.getenv("FUZZY_CATEGORY_MATCHING", "1") == "1"
+FUZZY_MATCH_MIN_SCORE = float(os.getenv("FUZZY_MATCH_MIN_SCORE", "0.75"))
+
+# Inference engine: "compiled" walks a flattened copy of the forest, "sklearn" calls model.predict
+INFERENCE_ENGINE = os.getenv("INFERENCE_ENGINE", "compiled")
+# Above this many rows sklearn's Cython predict beats the vectorized traversal
+COMPILED_FOREST_MAX_ROWS = int(os.getenv("COMPILED_FOREST_MAX_ROWS", "128"))
+# "1" serves a version's best_model.forest (written by export_forest.py) memory-mapped, without unpickling best_model.pkl
+COMPACT_FOREST = os.getenv("COMPACT_FOREST", "1") == "1"
+# "1" folds label encoding and scaling into precomputed lookup tables (verified against scaler.transform at load)
+FUSED_PREPROCESSING = os.getenv("FUSED_PREPROCESSING", "1") == "1"
+# "1" keeps training_data's text columns as category codes over the label encoders' classes and downcasts integers
+COMPACT_TRAINING_DATA = os.getenv("COMPACT_TRAINING_DATA", "1") == "1"
+
+# /predict response cache: max entries (0 disables) and optional time-to-live in seconds (0 = no expiry)
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "10000"))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", "0"))
+
+# Micro-batching of concurrent /predict calls: flush after MAX_SIZE rows or MAX_WAIT_MS, whichever comes first
+MICRO_BATCH_ENABLED = os.getenv("MICRO_BATCH_ENABLED", "0") == "1"
+MICRO_BATCH_MAX_SIZE = int(os.getenv("MICRO_BATCH_MAX_SIZE", "64"))
+MICRO_BATCH_MAX_WAIT_MS = float(os.getenv("MICRO_BATCH_MAX_WAIT_MS", "2"))
+
+# Where /predict runs scaling and inference: "thread" (in-process) or "process" (worker pool)
+INFERENCE_EXECUTOR = os.getenv("INFERENCE_EXECUTOR", "thread")
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(os.cpu_count() or 1)))
+INFERENCE_MAX_IN_FLIGHT = int(os.getenv("INFERENCE_MAX_IN_FLIGHT", "0")) or 4 * INFERENCE_WORKERS
+
+# Columnar/memory-mapped cache of training data and compiled forest, rebuilt when a source file's content hash changes
+ARTIFACT_CACHE_ENABLED = os.getenv("ARTIFACT_CACHE", "1") == "1"
+ARTIFACT_CACHE_DIR = os.getenv("ARTIFACT_CACHE_DIR", ".artifact_cache")
+
+# Versioned artifacts live in MODEL_REGISTRY_DIR/<version>/; without it the working directory is served as "default"
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", "models")
+MODEL_VERSION = os.getenv("MODEL_VERSION") or None
+# Poll MODEL_REGISTRY_DIR for new versions every N seconds (0 disables); admin endpoints need ADMIN_TOKEN when set,
+# and /admin/ingest and /admin/compact are disabled without it
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", "0"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# How long a replaced version's worker processes stay up for requests that started on it
+MODEL_RETIRE_GRACE_SECONDS = float(os.getenv("MODEL_RETIRE_GRACE_SECONDS", "30"))
+
+# Rows parsed, scored and streamed back together by /predict/stream
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "1000"))
+# Longest /predict/stream input line; a longer one becomes a row error instead of being buffered
+STREAM_MAX_LINE_BYTES = int(os.getenv("STREAM_MAX_LINE_BYTES", str(MAX_STREAM_LINE_BYTES)))
+
+# How long clients may reuse /model-info without revalidating; the ETag changes with the model version
+MODEL_INFO_MAX_AGE = int(os.getenv("MODEL_INFO_MAX_AGE", "300"))
+
+# Largest grid /predict/sweep scores in one request
+SWEEP_MAX_POINTS = int(os.getenv("SWEEP_MAX_POINTS", "10000"))
+# Upper bound on swept values of the count fields, which PredictionInput leaves unbounded
+SWEEP_MAX_VALUE = int(os.getenv("SWEEP_MAX_VALUE", str(10**9)))
+
+# Central share of the forest's per-tree predictions reported as each prediction's interval
+PREDICTION_INTERVAL = float(os.getenv("PREDICTION_INTERVAL", "0.9"))
+if not 0 < PREDICTION_INTERVAL < 1:
+    # Caught here rather than as a quantile error while warming up every model version
+    raise ValueError(f"PREDICTION_INTERVAL must be between 0 and 1 (exclusive), got {PREDICTION_INTERVAL}")
+
+# Seconds between merges of ingested records into training_data.csv; 0 only compacts on POST /admin/compact
+INGEST_COMPACT_INTERVAL = float(os.getenv("INGEST_COMPACT_INTERVAL", "0"))
+
+# Per route class concurrency, queue size and longest queue wait ("name=concurrency:queue:max_wait,...");
+# requests that cannot start in time get 503 + Retry-After, and /model-info-style routes are shed before /predict
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "1") == "1"
+ADMISSION_LIMITS = parse_limits(os.getenv("ADMISSION_LIMITS", DEFAULT_ADMISSION_LIMITS))
+
+# Request profiling, switchable at runtime via POST /admin/profiling: share of requests whose stacks are sampled,
+# latency above which a request's stage breakdown is captured (0 disables), captures kept, sampling interval
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "0"))
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "100"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+
 app = FastAPI()
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+# Prometheus metrics; recording is a few additions per request, rendering only happens when /metrics is scraped
+metrics = MetricsRegistry()
+STAGE_LATENCY = metrics.histogram(
+    "prediction_stage_seconds", "Latency of each prediction pipeline stage", ["pipeline", "stage"]
+)
+REQUEST_LATENCY = metrics.histogram("http_request_duration_seconds", "HTTP request latency by route", ["route"])
+REQUESTS_TOTAL = metrics.counter("http_requests_total", "HTTP requests by route, method and status", ["route", "method", "status"])
+REQUEST_ERRORS = metrics.counter("http_request_errors_total", "HTTP requests that ended in a 5xx response", ["route"])
+ADMISSION_REJECTIONS = metrics.counter(
+    "admission_rejections_total", "Requests turned away with 503 by admission control", ["route_class", "reason"]
+)
+ADMISSION_QUEUE_WAIT = metrics.histogram(
+    "admission_queue_wait_seconds", "Time admitted requests spent queued for a slot", ["route_class"]
 )
 
+def observe_stage(pipeline, stage, start):
+    """Record the time since start for one pipeline stage and return the current time"""
+    now = time.perf_counter()
+    STAGE_LATENCY.observe(now - start, pipeline, stage)
+    record_stage(pipeline, stage, now - start)
+    return now
+
+server_started = False
+
+def warmup_bundle(bundle):
+    """Run synthetic predictions through a freshly loaded bundle before it takes traffic"""
+    encoder = bundle.category_encoder
+    codes = [min(i, len(encoder.tables[name]) - 1) for i, name in enumerate(['country', 'origin', 'procedure'])]
+    numeric = bundle.scaler.mean_[3:] if hasattr(bundle.scaler, 'mean_') else [2015, 0, 0, 0, 0]
+    row = np.array([codes + list(numeric)], dtype=float)
+    for n_rows in (1, bundle.compiled_max_rows + 1):
+        predictions, _ = bundle.score_with_uncertainty(np.repeat(row, n_rows, axis=0), PREDICTION_INTERVAL)
+        if not np.all(np.isfinite(predictions)):
+            raise ValueError(f"Warmup produced non-finite predictions for model {bundle.version}")
+    if bundle.historical_index is not None and bundle.training_data is not None and len(bundle.training_data):
+        first = bundle.training_data.iloc[0]
+        bundle.historical_index.find(first['country'], first['origin'], first['year'])
+
+def attach_serving_resources(bundle):
+    """Give a bundle its /model-info payload, its own micro-batcher and, once the server runs, its own worker pool"""
+    bundle.model_info = ModelInfo(bundle)
+    if MICRO_BATCH_ENABLED:
+        # Coalesces concurrent /predict calls into one scaler + model pass
+        bundle.micro_batcher = MicroBatcher(
+            lambda features_array: score_rows(bundle, features_array),
+            max_batch_size=MICRO_BATCH_MAX_SIZE,
+            max_wait_ms=MICRO_BATCH_MAX_WAIT_MS
+        )
+    if INFERENCE_EXECUTOR == "process" and server_started:
+        try:
+            pool = InferencePool(
+                workers=INFERENCE_WORKERS,
+                max_in_flight=INFERENCE_MAX_IN_FLIGHT,
+                artifact_dir=bundle.directory,
+                compiled_forest=bundle.compiled_forest
+            )
+            pool.warmup()
+            bundle.inference_pool = pool
+        except Exception as e:
+            logger.error(f"Could not start inference pool for model {bundle.version}, predicting in-process: {e}")
+
+def retire_bundle(bundle):
+    """Drop cached responses and stop the old version's workers once in-flight requests had time to finish"""
+    prediction_cache.clear()
+    if bundle.inference_pool is not None:
+        timer = threading.Timer(MODEL_RETIRE_GRACE_SECONDS, bundle.inference_pool.shutdown, kwargs={"cancel_pending": False})
+        timer.daemon = True
+        timer.start()
+
 # Load model components
-try:
-    model = joblib.load("best_model.pkl")
-    scaler = joblib.load("scaler.pkl")
-    label_encoders = joblib.load("label_encoders.pkl")
-    feature_columns = joblib.load("feature_columns.pkl")
-    logger.info("Model components loaded successfully")
-except Exception as e:
-    logger.error(f"Error loading model components: {e}")
-    model = scaler = label_encoders = feature_columns = None
-
-# Load training data
-try:
-    training_data = pd.read_csv("training_data.csv")
-    logger.info(f"Training data loaded: {len(training_data)} records")
-except Exception as e:
-    logger.warning(f"Could not load training data: {e}")
-    training_data = None
-
-class PredictionInput(BaseModel):
-    country: str = Field(..., description="Country / territory of asylum/residence")
-    origin: str = Field(..., description="Country of origin of asylum seeker")
-    procedure_type: str = Field(..., description="RSD procedure type / level")
-    year: int = Field(..., ge=2000, le=2030, description="Year of application")
-    applied_during_year: int = Field(..., ge=0, description="Number of applications during year")
-    pending_start: int = Field(..., ge=0, description="Total pending start-year")
-    unhcr_assisted_start: int = Field(..., ge=0, description="UNHCR-assisted at start-year")
-    decisions_other: int = Field(..., ge=0, description="Other decisions made")
+registry = ModelRegistry(
+    MODEL_REGISTRY_DIR,
+    BundleSettings(
+        inference_engine=INFERENCE_ENGINE,
+        compiled_max_rows=COMPILED_FOREST_MAX_ROWS,
+        compact_forest=COMPACT_FOREST,
+        artifact_cache_dir=ARTIFACT_CACHE_DIR if ARTIFACT_CACHE_ENABLED else None,
+        unknown_policy=UNKNOWN_CATEGORY_POLICY,
+        unknown_sentinel=UNKNOWN_CATEGORY_SENTINEL,
+        fuzzy_matching=FUZZY_CATEGORY_MATCHING,
+        min_match_score=FUZZY_MATCH_MIN_SCORE,
+        fused_preprocessing=FUSED_PREPROCESSING,
+        compact_training_data=COMPACT_TRAINING_DATA
+    ),
+    warmup=warmup_bundle,
+    prepare=attach_serving_resources,
+    retire=retire_bundle
+)
+
+# Cached /predict responses, keyed by model version and dropped automatically when the active artifacts change on disk
+prediction_cache = PredictionCache(
+    max_size=PREDICTION_CACHE_SIZE,
+    ttl=PREDICTION_CACHE_TTL or None,
+    version_fn=registry.fingerprint
+)
+
+# With `python main.py`, spawned inference workers re-import this file as __mp_main__; they only need
+# scaler.pkl and the forest, which _init_worker loads, so they skip the bundle and the background threads
+IS_SPAWNED_WORKER = __name__ == "__mp_main__"
+
+if not IS_SPAWNED_WORKER:
+    registry.load_initial(MODEL_VERSION)
+    registry.watch(MODEL_WATCH_INTERVAL)
+
+def compact_periodically(interval):
+    """Merge the active version's ingestion log into training_data.csv every interval seconds"""
+    if interval <= 0:
+        return
+
+    def run():
+        while True:
+            time.sleep(interval)
+            bundle = registry.active
+            if bundle is None or not bundle.ingested_frames:
+                continue
+            try:
+                bundle.compact_ingested()
+            except Exception as e:
+                logger.error(f"Compaction of ingested records for model {bundle.version} failed: {e}")
+
+    threading.Thread(target=run, name="ingest-compactor", daemon=True).start()
+
+if not IS_SPAWNED_WORKER:
+    compact_periodically(INGEST_COMPACT_INTERVAL)
+
+def collect_model_metrics():
+    """Scrape-time view of values the bundle and cache already track"""
+    bundle = registry.active
+    cache_stats = prediction_cache.stats()
+    families = [
+        ("prediction_cache_hits_total", "counter", "Prediction cache hits", [({}, cache_stats["hits"])]),
+        ("prediction_cache_misses_total", "counter", "Prediction cache misses", [({}, cache_stats["misses"])]),
+        ("prediction_cache_size", "gauge", "Entries in the prediction cache", [({}, cache_stats["size"])]),
+    ]
+    if bundle is not None:
+        unknown_totals = bundle.category_encoder.unknowns.totals()
+        families.append((
+            "unknown_category_total", "counter", "Inputs with a category not seen during training, by field",
+            [({"field": field}, unknown_totals.get(field, 0)) for field in bundle.category_encoder.tables]
+        ))
+        families.append((
+            "model_load_seconds", "gauge", "Time taken to load the active model version",
+            [({"version": bundle.version}, bundle.load_seconds or 0.0)]
+        ))
+    return families
+
+metrics.add_collector(collect_model_metrics)
+
+def record_admission_wait(route_class, waited):
+    ADMISSION_QUEUE_WAIT.observe(waited, route_class)
+    if waited:
+        # Shows up in a slow request's stage breakdown as ("admission", route_class)
+        record_stage("admission", route_class, waited)
+
+admission = AdmissionControl(
+    ADMISSION_LIMITS,
+    on_wait=record_admission_wait,
+    on_reject=lambda route_class, reason: ADMISSION_REJECTIONS.inc(route_class, reason)
+) if ADMISSION_CONTROL else None
+
+def collect_admission_metrics():
+    if admission is None:
+        return []
+    stats = admission.stats()
+    return [
+        ("admission_queue_depth", "gauge", "Requests waiting for a slot, by route class",
+         [({"route_class": name}, entry["queue_depth"]) for name, entry in stats.items()]),
+        ("admission_in_flight", "gauge", "Requests holding a slot, by route class",
+         [({"route_class": name}, entry["in_flight"]) for name, entry in stats.items()]),
+    ]
+
+metrics.add_collector(collect_admission_metrics)
+
+class BatchPredictionInput(BaseModel):
+    inputs: List[PredictionInput] = Field(..., min_length=1, max_length=10000, description="Scenarios to score in one pass")
+
+SWEEP_FIELDS = ("year", "applied_during_year", "pending_start", "unhcr_assisted_start", "decisions_other")
+
+class SweepRange(BaseModel):
+    field: Literal[SWEEP_FIELDS] = Field(..., description="Numeric PredictionInput field to vary")
+    start: Optional[int] = Field(None, description="First value, used with stop")
+    stop: Optional[int] = Field(None, description="Last value (inclusive)")
+    step: int = Field(1, ge=1, description="Increment between start and stop")
+    values: Optional[List[int]] = Field(None, min_length=1, description="Explicit values instead of start/stop/step")
+
+    @model_validator(mode="after")
+    def check_range(self):
+        if (self.values is None) == (self.start is None or self.stop is None):
+            raise ValueError("give either values or both start and stop")
+        if self.values is None and self.stop < self.start:
+            raise ValueError("stop must not be less than start")
+        low, high = field_bounds(self.field)
+        high = SWEEP_MAX_VALUE if high is None else high
+        values = self.values if self.values is not None else (self.start, self.stop)
+        if (low is not None and min(values) < low) or max(values) > high:
+            raise ValueError(f"{self.field} values must be within [{low}, {high}]")
+        if self.size() > SWEEP_MAX_POINTS:
+            raise ValueError(f"{self.field} has {self.size()} values, more than the limit of {SWEEP_MAX_POINTS}")
+        return self
+
+    def size(self):
+        """Number of values on this axis, counted without building the range"""
+        return len(self.values) if self.values is not None else (self.stop - self.start) // self.step + 1
+
+    def grid_values(self):
+        return self.values if self.values is not None else range(self.start, self.stop + 1, self.step)
+
+class SweepRequest(BaseModel):
+    base: PredictionInput = Field(..., description="Scenario held fixed apart from the swept fields")
+    ranges: List[SweepRange] = Field(..., min_length=1, max_length=2, description="One or two fields to vary; the grid is their cross product")
+
+    @model_validator(mode="after")
+    def check_grid(self):
+        if len({sweep.field for sweep in self.ranges}) != len(self.ranges):
+            raise ValueError("each field can only be swept once")
+        # Python ints, which cannot wrap around the way an int64 product does
+        points = math.prod(sweep.size() for sweep in self.ranges)
+        if points > SWEEP_MAX_POINTS:
+            raise ValueError(f"grid has {points} points, more than the limit of {SWEEP_MAX_POINTS}")
+        return self
 
 class HistoricalDataRequest(BaseModel):
     country: str = Field(..., description="Country / territory of asylum/residence")
     origin: str = Field(..., description="Country of origin of asylum seeker")
     year: int = Field(..., ge=2000, le=2030, description="Year of application")
 
-def handle_unknown_category(encoder, value, category_name):
-    """
-    Handle unknown categories by either adding them to the encoder or using a fallback strategy
-    """
-    try:
-        # Try to transform the value
-        return encoder.transform([value])[0]
-    except ValueError:
-        # Value not seen during training
-        logger.warning(f"Unknown {category_name}: '{value}' not in training data")
-        
-        # Strategy 1: Add the unknown category to the encoder
-        # This expands the encoder's classes but may not work well with the trained model
-        try:
-            # Get current classes
-            current_classes = encoder.classes_.tolist()
-            
-            # Add the new category
-            new_classes = current_classes + [value]
-            encoder.classes_ = np.array(new_classes)
-            
-            # Transform with the expanded encoder
-            encoded_value = encoder.transform([value])[0]
-            logger.info(f"Added new {category_name} '{value}' to encoder with value {encoded_value}")
-            return encoded_value
-            
-        except Exception as e:
-            logger.error(f"Could not add new category to encoder: {e}")
-            
-            # Strategy 2: Use most frequent category as fallback
-            if training_data is not None:
-                try:
-                    if category_name == 'country':
-                        most_frequent = training_data['country'].mode()[0]
-                    elif category_name == 'origin':
-                        most_frequent = training_data['origin'].mode()[0]
-                    elif category_name == 'procedure':
-                        most_frequent = training_data['procedure_type'].mode()[0]
-                    else:
-                        most_frequent = current_classes[0]
-                    
-                    fallback_value = encoder.transform([most_frequent])[0]
-                    logger.info(f"Using most frequent {category_name} '{most_frequent}' as fallback (value: {fallback_value})")
-                    return fallback_value
-                except:
-                    pass
-            
-            # Strategy 3: Use the first class as ultimate fallback
-            fallback_value = 0
-            logger.info(f"Using default fallback value {fallback_value} for {category_name}")
-            return fallback_value
+def get_active_bundle():
+    """The model version serving this request; raises 503 if none could be loaded"""
+    bundle = registry.active
+    if bundle is None:
+        error = registry.last_error["error"] if registry.last_error else "no model version loaded"
+        raise HTTPException(status_code=503, detail=f"Model components not properly loaded: {error}")
+    return bundle
 
-def get_similar_cases(input_data):
+def get_similar_cases(input_data, bundle):
     """
     Find similar cases in training data for better prediction context
     """
-    if training_data is None:
+    if bundle.historical_index is None:
         return None
     
-    # Find cases with same country and origin
-    similar_cases = training_data[
-        (training_data['country'] == input_data.country) &
-        (training_data['origin'] == input_data.origin)
-    ]
-    
-    if len(similar_cases) > 0:
-        return {
-            "count": len(similar_cases),
-            "avg_acceptance_rate": similar_cases.get('acceptance_rate', pd.Series()).mean() if 'acceptance_rate' in similar_cases.columns else None,
-            "years_available": sorted(similar_cases['year'].unique().tolist()) if 'year' in similar_cases.columns else []
-        }
-    
-    return None
+    # Cases with same country and origin (as resolved, so "DR Congo" finds "Dem. Rep. of the Congo"), pre-aggregated when the data was loaded
+    category_encoder = bundle.category_encoder
+    return bundle.historical_index.summary(
+        category_encoder.canonical('country', input_data.country),
+        category_encoder.canonical('origin', input_data.origin)
+    )
+
+def category_matches(input_data, bundle):
+    """How each categorical field that isn't exactly a training value was resolved; None when all are exact"""
+    category_encoder = bundle.category_encoder
+    matches = {}
+    for name, field in CATEGORY_FIELDS.items():
+        value = getattr(input_data, field)
+        if category_encoder.tables[name].lookup(value) is None:
+            match = category_encoder.resolve(name, value)
+            matches[field] = {"input": value, "resolved": match.category, "score": match.score, "method": match.method}
+    return matches or None
 
 @app.post("/historical-data")
 def get_historical_data(request: HistoricalDataRequest):
     try:
-        if training_data is not None:
-            filtered_data = training_data[
-                (training_data['country'] == request.country) &
-                (training_data['origin'] == request.origin) &
-                (training_data['year'] == request.year)
-            ]
+        bundle = registry.active
+        if bundle is not None and bundle.historical_index is not None:
+            historical_index = bundle.historical_index
+            start = time.perf_counter()
+            match = historical_index.find(request.country, request.origin, request.year)
+            observe_stage("historical", "lookup", start)
             
-            if not filtered_data.empty:
-                if len(filtered_data) == 1:
-                    record = filtered_data.iloc[0]
-                else:
-                    record = filtered_data.iloc[-1]  
-                
-                return {
+            if match is not None:
+                position, matched_year, exact = match
+                response = {
                     "success": True,
-                    "data": {
-                        "applied_during_year": int(record.get('applied_during_year', 0)),
-                        "pending_start": int(record.get('pending_start', 0)),
-                        "unhcr_assisted_start": int(record.get('unhcr_assisted_start', 0)),
-                        "decisions_other": int(record.get('decisions_other', 0))
-                    }
+                    "data": historical_index.record(position)
                 }
-            else:
-                similar_data = training_data[
-                    (training_data['country'] == request.country) &
-                    (training_data['origin'] == request.origin)
-                ]
-                
-                if not similar_data.empty:
-                    similar_data['year_diff'] = abs(similar_data['year'] - request.year)
-                    closest_record = similar_data.loc[similar_data['year_diff'].idxmin()]
-                    
-                    return {
-                        "success": True,
-                        "data": {
-                            "applied_during_year": int(closest_record.get('applied_during_year', 0)),
-                            "pending_start": int(closest_record.get('pending_start', 0)),
-                            "unhcr_assisted_start": int(closest_record.get('unhcr_assisted_start', 0)),
-                            "decisions_other": int(closest_record.get('decisions_other', 0))
-                        },
-                        "note": f"Data from closest available year: {closest_record['year']}"
-                    }
+                if not exact:
+                    response["note"] = f"Data from closest available year: {matched_year}"
+                return response
         
         return {
             "success": False,
@@ -190,130 +407,693 @@ def get_historical_data(request: HistoricalDataRequest):
             "data": None
         }
 
+def prediction_cache_key(input_data, bundle):
+    """Normalized cache key: the model version plus the PredictionInput field values in declaration order"""
+    return (bundle.version,) + tuple(getattr(input_data, field) for field in PredictionInput.model_fields)
+
+def uncertainty_fields(spread, n_rows):
+    """Per-row "uncertainty" response objects from a (std, lower, upper) spread; all None without one"""
+    if spread is None:
+        return [None] * n_rows
+    std, lower, upper = spread
+    lower, upper = np.clip(lower, 0.0, 1.0).tolist(), np.clip(upper, 0.0, 1.0).tolist()
+    return [
+        {"std": value, "interval": PREDICTION_INTERVAL, "lower": lower[i], "upper": upper[i]}
+        for i, value in enumerate(std.tolist())
+    ]
+
+def score_rows(bundle, features_array):
+    """(prediction, uncertainty) per unscaled feature row; the micro-batcher's scoring function"""
+    predictions, spread = bundle.score_with_uncertainty(features_array, PREDICTION_INTERVAL)
+    return list(zip(predictions, uncertainty_fields(spread, len(predictions))))
+
+def build_prediction_response(prediction, country_encoded, origin_encoded, procedure_encoded, similar_cases, uncertainty=None,
+                              matches=None):
+    """
+    Build the /predict response body for one scored row
+    """
+    # Ensure prediction is within valid range
+    prediction = float(max(0.0, min(1.0, prediction)))
+
+    response = {
+        "predicted_acceptance_rate": prediction,
+        "prediction_percentage": f"{prediction * 100:.2f}%",
+        "encoded_features": {
+            "country_encoded": int(country_encoded),
+            "origin_encoded": int(origin_encoded),
+            "procedure_encoded": int(procedure_encoded)
+        }
+    }
+
+    # Spread of the forest's individual trees around the prediction
+    if uncertainty is not None:
+        response["uncertainty"] = uncertainty
+
+    # Inputs that were not exact training values, with the category each resolved to
+    if matches is not None:
+        response["category_matches"] = matches
+
+    # Add similar cases information if available
+    if similar_cases:
+        response["similar_cases_info"] = similar_cases
+
+        # Add confidence indicator based on historical data availability
+        if similar_cases["count"] > 5:
+            response["confidence"] = "High"
+        elif similar_cases["count"] > 0:
+            response["confidence"] = "Medium"
+        else:
+            response["confidence"] = "Low"
+    else:
+        response["confidence"] = "Low"
+        response["note"] = "No similar historical cases found. Prediction based on general model patterns."
+
+    return response
+
+def encode_prediction_input(input_data, bundle):
+    """
+    Encode one input into its categorical codes and unscaled 1x8 feature array
+    """
+    category_encoder = bundle.category_encoder
+    
+    # Encode categoricals via lookup tables; unknown values use the configured fallback
+    country_encoded = category_encoder.encode('country', input_data.country)
+    origin_encoded = category_encoder.encode('origin', input_data.origin)
+    procedure_encoded = category_encoder.encode('procedure', input_data.procedure_type)
+    
+    # Create feature array
+    features_array = np.array([[
+        country_encoded,
+        origin_encoded, 
+        procedure_encoded,
+        input_data.year,
+        input_data.applied_during_year,
+        input_data.pending_start,
+        input_data.unhcr_assisted_start,
+        input_data.decisions_other
+    ]])
+    
+    return (country_encoded, origin_encoded, procedure_encoded), features_array
+
+@app.on_event("startup")
+def start_inference_pool():
+    """Worker processes can only be spawned once the server runs, so the initial bundle gets its pool here"""
+    global server_started
+    server_started = True
+    bundle = registry.active
+    if bundle is not None and bundle.inference_pool is None:
+        attach_serving_resources(bundle)
+
+@app.on_event("shutdown")
+def stop_inference_pool():
+    bundle = registry.active
+    if bundle is not None and bundle.inference_pool is not None:
+        bundle.inference_pool.shutdown()
+
+def lookup_cached_prediction(input_data, bundle):
+    """Returns (cache_key, cached_response); both None when the cache is disabled"""
+    if not prediction_cache.enabled:
+        return None, None
+    cache_key = prediction_cache_key(input_data, bundle)
+    return cache_key, prediction_cache.get(cache_key)
+
+def complete_prediction(input_data, bundle, prediction, uncertainty, encoded, cache_key):
+    """Attach similar-case context to a raw prediction and cache the response"""
+    # Get confidence information from similar cases
+    start = time.perf_counter()
+    similar_cases = get_similar_cases(input_data, bundle)
+    observe_stage("single", "similar_cases", start)
+    
+    response = build_prediction_response(prediction, *encoded, similar_cases, uncertainty, category_matches(input_data, bundle))
+    
+    if cache_key is not None:
+        prediction_cache.put(cache_key, response)
+    
+    return response
+
+def predict_single(input_data, bundle):
+    """Synchronous /predict pipeline, run on the threadpool"""
+    cache_key, cached_response = lookup_cached_prediction(input_data, bundle)
+    if cached_response is not None:
+        return cached_response
+    
+    start = time.perf_counter()
+    if bundle.feature_pipeline is not None:
+        # Encoding and scaling in one step, straight into the scaled feature row
+        encoded, features_scaled = bundle.feature_pipeline.transform_one(input_data)
+        start = observe_stage("single", "encode_scale", start)
+    else:
+        encoded, features_array = encode_prediction_input(input_data, bundle)
+        start = observe_stage("single", "encode", start)
+        features_scaled = bundle.scaler.transform(features_array)
+        start = observe_stage("single", "scale", start)
+    predictions, spread = bundle.predict_with_uncertainty(features_scaled, PREDICTION_INTERVAL)
+    observe_stage("single", "predict", start)
+    return complete_prediction(input_data, bundle, predictions[0], uncertainty_fields(spread, 1)[0], encoded, cache_key)
+
 @app.post("/predict")
-def predict_acceptance_rate(input_data: PredictionInput):
+async def predict_acceptance_rate(input_data: PredictionInput):
     try:
-        if model is None or scaler is None or label_encoders is None:
-            raise HTTPException(status_code=500, detail="Model components not properly loaded")
+        bundle = get_active_bundle()
         
-        # Handle categorical encoding with unknown category management
-        country_encoded = handle_unknown_category(
-            label_encoders.get('country', LabelEncoder()), 
-            input_data.country, 
-            'country'
-        )
+        if bundle.inference_pool is None and bundle.micro_batcher is None:
+            return await run_in_threadpool(predict_single, input_data, bundle)
         
-        origin_encoded = handle_unknown_category(
-            label_encoders.get('origin', LabelEncoder()), 
-            input_data.origin, 
-            'origin'
-        )
+        cache_key, cached_response = lookup_cached_prediction(input_data, bundle)
+        if cached_response is not None:
+            return cached_response
         
-        procedure_encoded = handle_unknown_category(
-            label_encoders.get('procedure', LabelEncoder()), 
-            input_data.procedure_type, 
-            'procedure'
+        start = time.perf_counter()
+        encoded, features_array = encode_prediction_input(input_data, bundle)
+        start = observe_stage("single", "encode", start)
+        if bundle.inference_pool is not None:
+            # Scaling and model prediction run in a worker process
+            predictions, spread = await bundle.inference_pool.predict(features_array, PREDICTION_INTERVAL)
+            prediction, uncertainty = predictions[0], uncertainty_fields(spread, 1)[0]
+            observe_stage("single", "worker_scale_predict", start)
+        else:
+            # Scaling and model prediction happen in a shared batch with concurrent requests
+            prediction, uncertainty = await bundle.micro_batcher.submit(features_array[0])
+            observe_stage("single", "micro_batch_scale_predict", start)
+        return complete_prediction(input_data, bundle, prediction, uncertainty, encoded, cache_key)
+    
+    except HTTPException:
+        raise
+    except UnknownCategoryError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        logger.error(f"Prediction error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+
+def score_inputs(inputs, bundle, pipeline):
+    """Score PredictionInputs with one encoding pass per column, one scaler pass and one model pass"""
+    start = time.perf_counter()
+    if bundle.feature_pipeline is not None:
+        # Encoding and scaling in one step, straight into one scaled feature matrix
+        codes, features_scaled = bundle.feature_pipeline.transform_many(inputs)
+        country_encoded, origin_encoded, procedure_encoded = codes['country'], codes['origin'], codes['procedure']
+        start = observe_stage(pipeline, "encode_scale", start)
+    else:
+        category_encoder = bundle.category_encoder
+        country_encoded = category_encoder.encode_column(
+            'country',
+            [item.country for item in inputs]
         )
-        
-        # Create feature array
-        features_array = np.array([[
+
+        origin_encoded = category_encoder.encode_column(
+            'origin',
+            [item.origin for item in inputs]
+        )
+
+        procedure_encoded = category_encoder.encode_column(
+            'procedure',
+            [item.procedure_type for item in inputs]
+        )
+
+        # Create feature matrix, one row per input
+        features_array = np.column_stack([
             country_encoded,
-            origin_encoded, 
+            origin_encoded,
             procedure_encoded,
-            input_data.year,
-            input_data.applied_during_year,
-            input_data.pending_start,
-            input_data.unhcr_assisted_start,
-            input_data.decisions_other
-        ]])
-        
-        # Scale features
-        features_scaled = scaler.transform(features_array)
-        
-        # Make prediction
-        prediction = model.predict(features_scaled)[0]
-        
-        # Ensure prediction is within valid range
-        prediction = float(max(0.0, min(1.0, prediction)))
-        
-        # Get confidence information from similar cases
-        similar_cases = get_similar_cases(input_data)
-        
-        # Prepare response
+            [item.year for item in inputs],
+            [item.applied_during_year for item in inputs],
+            [item.pending_start for item in inputs],
+            [item.unhcr_assisted_start for item in inputs],
+            [item.decisions_other for item in inputs]
+        ])
+
+        start = observe_stage(pipeline, "encode", start)
+
+        # Scale the whole matrix at once
+        features_scaled = bundle.scaler.transform(features_array)
+        start = observe_stage(pipeline, "scale", start)
+
+    predictions, spread = bundle.predict_with_uncertainty(features_scaled, PREDICTION_INTERVAL)
+    uncertainties = uncertainty_fields(spread, len(predictions))
+    start = observe_stage(pipeline, "predict", start)
+
+    # Similar cases only depend on (country, origin), so look each pair up once
+    similar_cases_by_pair = {}
+    results = []
+    for i, item in enumerate(inputs):
+        pair = (item.country, item.origin)
+        if pair not in similar_cases_by_pair:
+            similar_cases_by_pair[pair] = get_similar_cases(item, bundle)
+        results.append(build_prediction_response(
+            predictions[i],
+            country_encoded[i],
+            origin_encoded[i],
+            procedure_encoded[i],
+            similar_cases_by_pair[pair],
+            uncertainties[i],
+            category_matches(item, bundle)
+        ))
+
+    observe_stage(pipeline, "similar_cases", start)
+    return results
+
+@app.post("/predict/batch")
+def predict_acceptance_rate_batch(batch: BatchPredictionInput):
+    """Score many scenarios with one encoding pass per column, one scaler pass and one model pass"""
+    try:
+        bundle = get_active_bundle()
+        results = score_inputs(batch.inputs, bundle, "batch")
+        return {"count": len(results), "predictions": results}
+
+    except HTTPException:
+        raise
+    except UnknownCategoryError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        logger.error(f"Batch prediction error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Batch prediction failed: {str(e)}")
+
+def sweep_features(base, axes, bundle):
+    """Scaled feature matrix for every grid point, row-major over axes, with the categoricals encoded once"""
+    category_encoder = bundle.category_encoder
+    encoded = (
+        category_encoder.encode('country', base.country),
+        category_encoder.encode('origin', base.origin),
+        category_encoder.encode('procedure', base.procedure_type)
+    )
+    grids = dict(zip([field for field, _ in axes], np.meshgrid(*[values for _, values in axes], indexing="ij")))
+    n_points = int(np.prod([len(values) for _, values in axes]))
+    columns = {
+        field: grids[field].ravel() if field in grids else np.full(n_points, getattr(base, field))
+        for field in SWEEP_FIELDS
+    }
+    if bundle.feature_pipeline is not None:
+        codes = {name: np.full(n_points, code) for name, code in zip(('country', 'origin', 'procedure'), encoded)}
+        return encoded, bundle.feature_pipeline.transform_codes(codes, columns)
+    features_array = np.column_stack(
+        [np.full(n_points, code) for code in encoded] + [columns[field] for field in SWEEP_FIELDS]
+    )
+    return encoded, bundle.scaler.transform(features_array)
+
+@app.post("/predict/sweep")
+def predict_acceptance_rate_sweep(request: SweepRequest):
+    """
+    Score a base scenario over a grid of one or two numeric fields in one model
+    pass. predictions (and uncertainty) are nested arrays indexed like axes:
+    predictions[i][j] is the rate with axes[0] at its i-th and axes[1] at its j-th value.
+    """
+    try:
+        bundle = get_active_bundle()
+        axes = [(sweep.field, np.asarray(sweep.grid_values(), dtype=np.int64)) for sweep in request.ranges]
+        shape = [len(values) for _, values in axes]
+
+        start = time.perf_counter()
+        encoded, features_scaled = sweep_features(request.base, axes, bundle)
+        start = observe_stage("sweep", "encode_scale", start)
+        predictions, spread = bundle.predict_with_uncertainty(features_scaled, PREDICTION_INTERVAL)
+        start = observe_stage("sweep", "predict", start)
+
         response = {
-            "predicted_acceptance_rate": prediction,
-            "prediction_percentage": f"{prediction * 100:.2f}%",
-            "encoded_features": {
-                "country_encoded": int(country_encoded),
-                "origin_encoded": int(origin_encoded),
-                "procedure_encoded": int(procedure_encoded)
-            }
+            "model_version": bundle.version,
+            "encoded_features": dict(zip(("country_encoded", "origin_encoded", "procedure_encoded"), map(int, encoded))),
+            "axes": [{"field": field, "values": values.tolist()} for field, values in axes],
+            "predictions": np.clip(predictions, 0.0, 1.0).reshape(shape).tolist()
         }
-        
-        # Add similar cases information if available
+        if spread is not None:
+            std, lower, upper = spread
+            response["uncertainty"] = {
+                "interval": PREDICTION_INTERVAL,
+                "std": std.reshape(shape).tolist(),
+                "lower": np.clip(lower, 0.0, 1.0).reshape(shape).tolist(),
+                "upper": np.clip(upper, 0.0, 1.0).reshape(shape).tolist()
+            }
+        # Similar cases depend only on (country, origin), which the sweep holds fixed
+        matches = category_matches(request.base, bundle)
+        if matches is not None:
+            response["category_matches"] = matches
+        similar_cases = get_similar_cases(request.base, bundle)
         if similar_cases:
             response["similar_cases_info"] = similar_cases
-            
-            # Add confidence indicator based on historical data availability
-            if similar_cases["count"] > 5:
-                response["confidence"] = "High"
-            elif similar_cases["count"] > 0:
-                response["confidence"] = "Medium"
-            else:
-                response["confidence"] = "Low"
-        else:
-            response["confidence"] = "Low"
-            response["note"] = "No similar historical cases found. Prediction based on general model patterns."
-        
+        observe_stage("sweep", "similar_cases", start)
         return response
-    
+
     except HTTPException:
         raise
+    except UnknownCategoryError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
-        logger.error(f"Prediction error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+        logger.error(f"Sweep prediction error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Sweep prediction failed: {str(e)}")
 
-@app.get("/model-info")
-def get_model_info():
-    """Get information about the loaded model and available categories"""
+def reject_unresolvable(validated, bundle):
+    """Turn validated rows with a category the 'reject' policy refuses into row errors, so the rest of the chunk still scores"""
+    checked = []
+    for row_number, item, error in validated:
+        if item is not None:
+            try:
+                for name, field in CATEGORY_FIELDS.items():
+                    bundle.category_encoder.resolve(name, getattr(item, field))
+            except UnknownCategoryError as e:
+                item, error = None, str(e)
+        checked.append((row_number, item, error))
+    return checked
+
+def score_stream_chunk(chunk, bundle):
+    """
+    Validate and score one chunk of parsed rows. Returns the NDJSON text for the
+    chunk, in input order, and the number of rows that failed.
+    """
+    validated = validate_chunk(chunk, PredictionInput)
+    if bundle.category_encoder.policy == 'reject':
+        validated = reject_unresolvable(validated, bundle)
+    valid_inputs = [item for _, item, _ in validated if item is not None]
     try:
-        info = {
-            "model_loaded": model is not None,
-            "scaler_loaded": scaler is not None,
-            "label_encoders_loaded": label_encoders is not None,
-            "training_data_loaded": training_data is not None
-        }
-        
-        if label_encoders:
-            info["available_categories"] = {}
-            for category, encoder in label_encoders.items():
-                info["available_categories"][category] = encoder.classes_.tolist()
-        
-        if training_data is not None:
-            info["training_data_stats"] = {
-                "total_records": len(training_data),
-                "unique_countries": training_data['country'].nunique() if 'country' in training_data.columns else 0,
-                "unique_origins": training_data['origin'].nunique() if 'origin' in training_data.columns else 0,
-                "year_range": [int(training_data['year'].min()), int(training_data['year'].max())] if 'year' in training_data.columns else []
-            }
-        
-        return info
-    
+        predictions = iter(score_inputs(valid_inputs, bundle, "stream") if valid_inputs else [])
+        scoring_error = None
     except Exception as e:
-        return {"error": f"Could not retrieve model info: {str(e)}"}
+        logger.error(f"Stream chunk scoring error: {str(e)}")
+        scoring_error = f"Prediction failed: {str(e)}"
+
+    lines = []
+    failed = 0
+    for row_number, item, error in validated:
+        if item is not None and scoring_error is None:
+            lines.append(json.dumps({"row": row_number, **next(predictions)}))
+        else:
+            failed += 1
+            lines.append(json.dumps({"row": row_number, "error": error or scoring_error}))
+    return "\n".join(lines) + "\n", failed
+
+@app.post("/predict/stream")
+async def predict_acceptance_rate_stream(request: Request, input_format: Optional[str] = Query(None, alias="format")):
+    """
+    Score a CSV (with header) or NDJSON request body of PredictionInput rows,
+    streaming one NDJSON result per row back as each chunk of STREAM_CHUNK_ROWS
+    is scored. Invalid rows get an inline {"row", "error"} line; a final
+    {"summary": ...} line reports the totals.
+    """
+    bundle = get_active_bundle()
+    if input_format is None:
+        input_format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    if input_format not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format '{input_format}', expected one of {list(STREAM_FORMATS)}")
+
+    async def generate():
+        rows = failed = 0
+        # The body is read only as fast as results are consumed, so memory stays at about one chunk
+        async for chunk in iter_chunks(iter_records(request.stream(), input_format, STREAM_MAX_LINE_BYTES), STREAM_CHUNK_ROWS):
+            text, chunk_failed = await run_in_threadpool(score_stream_chunk, chunk, bundle)
+            rows += len(chunk)
+            failed += chunk_failed
+            yield text
+        yield json.dumps({"summary": {"rows": rows, "scored": rows - failed, "failed": failed, "model_version": bundle.version}}) + "\n"
+
+    return BodyStreamingResponse(generate(), media_type="application/x-ndjson")
+
+def cached_json_response(body, etag, if_none_match):
+    """Serve a precomputed JSON body, or 304 when the client already holds this ETag"""
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={MODEL_INFO_MAX_AGE}"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/model-info")
+def get_model_info(
+    include_categories: bool = True,
+    if_none_match: Optional[str] = Header(None)
+):
+    """
+    Get information about the loaded model and available categories.
+    Built once per model version; send If-None-Match to get a 304 when unchanged,
+    or include_categories=false to skip the category lists.
+    """
+    bundle = registry.active
+    if bundle is None or bundle.model_info is None:
+        return {
+            "model_loaded": False,
+            "scaler_loaded": False,
+            "label_encoders_loaded": False,
+            "training_data_loaded": False,
+            "model_version": None,
+            "load_error": registry.last_error
+        }
+
+    model_info = bundle.model_info
+    if include_categories:
+        return cached_json_response(*model_info.full, if_none_match)
+    return cached_json_response(*model_info.summary, if_none_match)
+
+@app.get("/model-info/categories/{category}")
+def get_model_categories(
+    category: str,
+    prefix: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=10000),
+    if_none_match: Optional[str] = Header(None)
+):
+    """One page of a category list (country, origin, procedure), optionally filtered by a case-insensitive prefix"""
+    model_info = get_active_bundle().model_info
+    if category not in model_info.categories:
+        raise HTTPException(status_code=404, detail=f"Unknown category '{category}', expected one of {list(model_info.categories)}")
+
+    etag = model_info.category_page_etag(category, prefix, offset, limit)
+    if etag_matches(if_none_match, etag):
+        return cached_json_response(b"", etag, if_none_match)
+    page = model_info.category_page(category, prefix=prefix, offset=offset, limit=limit)
+    return cached_json_response(json.dumps(page, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), etag, None)
+
+def get_rollups(level, country, origin):
+    """The active version's rollups, after checking the filters apply to level"""
+    rollups = get_active_bundle().rollups
+    if rollups is None:
+        raise HTTPException(status_code=503, detail="Training data not loaded")
+    for name, value in (("country", country), ("origin", origin)):
+        if value is not None and name not in ROLLUP_LEVELS[level]:
+            raise HTTPException(status_code=422, detail=f"Level '{level}' cannot be filtered by {name}")
+    return rollups
+
+@app.get("/summary")
+def get_summary(
+    level: Literal[tuple(ROLLUP_LEVELS)] = "country",
+    country: Optional[str] = None,
+    origin: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=1000)
+):
+    """One page of precomputed aggregates for a level, in key order, optionally for one country and/or origin"""
+    rollups = get_rollups(level, country, origin)
+    total, items = rollups.page(level, country=country, origin=origin, offset=offset, limit=limit)
+    return {"level": level, "total": total, "offset": offset, "limit": limit, "items": items}
+
+@app.get("/summary/top")
+def get_summary_top(
+    level: Literal[tuple(ROLLUP_LEVELS)] = "country",
+    metric: Literal[ROLLUP_METRICS] = "avg_acceptance_rate",
+    order: Literal["desc", "asc"] = "desc",
+    country: Optional[str] = None,
+    origin: Optional[str] = None,
+    min_records: int = Query(1, ge=1, description="Skip aggregates over fewer rows than this"),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=1000)
+):
+    """Aggregates of a level ranked by metric; entries without an acceptance rate rank last"""
+    rollups = get_rollups(level, country, origin)
+    items = rollups.top(level, metric, order=order, country=country, origin=origin,
+                        min_records=min_records, offset=offset, limit=limit)
+    return {"level": level, "metric": metric, "order": order, "offset": offset, "limit": limit, "items": items}
+
+@app.get("/unknown-categories")
+def get_unknown_categories():
+    """Live unknown-category hit counters for the active model version"""
+    return get_active_bundle().category_encoder.stats()
+
+def check_admin_token(token, required=False):
+    """
+    Reject the request unless it carries ADMIN_TOKEN. Without a configured token the
+    read-only admin endpoints are open, and those that change state or expose captured
+    requests (required=True) are disabled.
+    """
+    if not ADMIN_TOKEN:
+        if required:
+            raise HTTPException(status_code=403, detail="Disabled: set ADMIN_TOKEN to enable this endpoint")
+        return
+    if token is None or not hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+class ReloadRequest(BaseModel):
+    version: Optional[str] = Field(None, description="Version directory to activate; defaults to the latest")
+
+@app.get("/admin/models")
+def get_model_versions(x_admin_token: Optional[str] = Header(None)):
+    """Available model versions, the active one and the state of the last reload"""
+    check_admin_token(x_admin_token)
+    return registry.status()
+
+@app.post("/admin/reload", status_code=202)
+def reload_model(request: Optional[ReloadRequest] = None, x_admin_token: Optional[str] = Header(None)):
+    """Load a model version in the background, warm it up and swap it in without dropping requests"""
+    check_admin_token(x_admin_token, required=True)
+    version = request.version if request is not None else None
+    if version is not None and version not in registry.versions():
+        raise HTTPException(status_code=404, detail=f"Unknown model version '{version}'")
+    if not registry.reload(version):
+        raise HTTPException(status_code=409, detail=f"Reload of version {registry.reloading_version} already in progress")
+    return {"reloading_version": registry.reloading_version or version or registry.latest_version()}
+
+class IngestRequest(BaseModel):
+    records: List[HistoricalRecord] = Field(..., min_length=1, max_length=10000)
+
+def ingestion_status(bundle):
+    return {
+        "model_version": bundle.version,
+        "pending_records": sum(len(frame) for frame in bundle.ingested_frames),
+        "total_records": bundle.historical_index.row_count if bundle.historical_index is not None else 0
+    }
+
+@app.post("/admin/ingest")
+def ingest_historical_records(request: IngestRequest, x_admin_token: Optional[str] = Header(None)):
+    """
+    Append historical records to the active version's append-only log and make
+    them visible to /historical-data and similar cases immediately. The whole
+    batch is validated first; nothing is written if any record is invalid.
+    """
+    check_admin_token(x_admin_token, required=True)
+    bundle = get_active_bundle()
+    bundle.ingest([record.model_dump() for record in request.records])
+    # Cached /predict responses carry similar-case summaries that may have changed
+    prediction_cache.clear()
+    logger.info(f"Ingested {len(request.records)} historical records into model {bundle.version}")
+    return dict(ingestion_status(bundle), ingested=len(request.records))
+
+@app.post("/admin/compact")
+def compact_historical_records(x_admin_token: Optional[str] = Header(None)):
+    """Merge the ingestion log into training_data.csv now"""
+    check_admin_token(x_admin_token, required=True)
+    bundle = get_active_bundle()
+    merged = bundle.compact_ingested()
+    return dict(ingestion_status(bundle), compacted=merged)
+
+# Profiles a request sent with an X-Profile-Request header whose value is ADMIN_TOKEN; ignored when no token is set
+profiler = RequestProfiler(
+    sample_rate=PROFILE_SAMPLE_RATE,
+    slow_threshold_ms=SLOW_REQUEST_THRESHOLD_MS,
+    buffer_size=PROFILE_BUFFER_SIZE,
+    interval_ms=PROFILE_INTERVAL_MS,
+    header_token=ADMIN_TOKEN
+)
+
+class ProfilingSettings(BaseModel):
+    sample_rate: Optional[float] = Field(None, ge=0, le=1, description="Share of requests whose stacks are sampled")
+    slow_threshold_ms: Optional[float] = Field(None, ge=0, description="Capture requests slower than this; 0 disables")
+
+@app.get("/admin/profiling")
+def get_profiling(x_admin_token: Optional[str] = Header(None)):
+    """Current profiling settings and capture counts"""
+    check_admin_token(x_admin_token)
+    return profiler.stats()
+
+@app.post("/admin/profiling")
+def configure_profiling(settings: ProfilingSettings, x_admin_token: Optional[str] = Header(None)):
+    """Change the sample rate and slow-request threshold without a restart"""
+    check_admin_token(x_admin_token, required=True)
+    profiler.configure(sample_rate=settings.sample_rate, slow_threshold_ms=settings.slow_threshold_ms)
+    logger.info(f"Profiling set to sample rate {profiler.sample_rate}, slow threshold {profiler.slow_threshold_ms}ms")
+    return profiler.stats()
+
+@app.get("/admin/profiling/captures")
+def download_profiling_captures(
+    output_format: Literal["json", "collapsed"] = Query("json", alias="format"),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    The buffered captures, oldest first, as a JSON download; format=collapsed
+    merges their stack samples into collapsed-stack text for flame graphs
+    """
+    check_admin_token(x_admin_token, required=True)
+    if output_format == "collapsed":
+        return Response(content=profiler.collapsed(), media_type="text/plain",
+                        headers={"Content-Disposition": 'attachment; filename="profiles.folded"'})
+    body = json.dumps(list(profiler.captures), separators=(",", ":"))
+    return Response(content=body, media_type="application/json",
+                    headers={"Content-Disposition": 'attachment; filename="request-captures.json"'})
+
+@app.delete("/admin/profiling/captures")
+def clear_profiling_captures(x_admin_token: Optional[str] = Header(None)):
+    check_admin_token(x_admin_token, required=True)
+    profiler.captures.clear()
+    return profiler.stats()
+
+@app.get("/batcher-stats")
+def get_batcher_stats():
+    """Queue depth and batch-size counters for the /predict micro-batcher"""
+    bundle = registry.active
+    if bundle is None or bundle.micro_batcher is None:
+        return {"enabled": False}
+    return bundle.micro_batcher.stats()
+
+@app.get("/executor-stats")
+def get_executor_stats():
+    """Worker count and in-flight counters for the /predict process pool"""
+    bundle = registry.active
+    if bundle is None or bundle.inference_pool is None:
+        return {"enabled": False, "executor": "thread"}
+    return bundle.inference_pool.stats()
+
+@app.get("/admission-stats")
+def get_admission_stats():
+    """Concurrency, queue depth and rejection counters per admission route class"""
+    if admission is None:
+        return {"enabled": False}
+    return {"enabled": True, "classes": admission.stats()}
+
+@app.get("/cache-stats")
+def get_cache_stats():
+    """Hit/miss/eviction counters for the /predict response cache"""
+    return prediction_cache.stats()
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus text-format metrics: stage and route latency, request/error counts, unknown categories, model load time"""
+    return Response(content=metrics.render(), media_type=METRICS_CONTENT_TYPE)
 
 @app.get("/")
 def read_root():
     return {
         "message": "Enhanced Refugee Acceptance Predictor API", 
-        "endpoints": ["/predict", "/historical-data", "/model-info"],
+        "endpoints": ["/predict", "/predict/batch", "/predict/stream", "/predict/sweep", "/historical-data", "/summary", "/summary/top", "/model-info", "/model-info/categories/{category}", "/unknown-categories", "/cache-stats", "/batcher-stats", "/executor-stats", "/admission-stats", "/metrics", "/admin/models", "/admin/reload", "/admin/ingest", "/admin/compact", "/admin/profiling", "/admin/profiling/captures"],
         "features": [
-            "Handles unknown categories gracefully",
+            "Resolves unknown category names by alias and trigram similarity, with a bounded fallback policy",
             "Provides confidence indicators",
+            "Reports the forest's per-tree spread as an uncertainty interval",
             "Includes similar cases analysis",
+            "Precomputed country, origin and pair summaries with top-N rankings",
+            "Vectorized batch scoring",
+            "Streaming CSV/NDJSON bulk scoring",
+            "Zero-downtime model reloads",
+            "Quantized, memory-mapped forest artifact that loads without unpickling",
+            "Admission control that sheds low-priority routes first under load",
             "Enhanced error handling and logging"
         ]
     }
 
+if admission is not None:
+    app.add_middleware(AdmissionMiddleware, control=admission)
+
+# Outside admission control, so its 503s carry CORS headers and preflight requests never take a slot
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# Outside admission control, so a capture includes time spent queued for a slot
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+# Added last so it sees every route (and the 503s admission control sends); unknown paths are recorded as "other"
+app.add_middleware(
+    MetricsMiddleware,
+    latency=REQUEST_LATENCY,
+    requests=REQUESTS_TOTAL,
+    errors=REQUEST_ERRORS,
+    routes=[route.path for route in app.routes]
+)
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,109 @@
+import asyncio
+import threading
+from collections import Counter
+
+import numpy as np
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-row predictions into one matrix call.
+
+    Rows submitted from request handlers wait until either max_batch_size rows
+    are queued or max_wait_ms has passed since the first row arrived. The batch
+    is then stacked into one matrix, scored by predict_fn in a worker thread,
+    and each waiting request gets its own row of the result back.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=64, max_wait_ms=2.0):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+        self._stats_lock = threading.Lock()
+        self._rows_in_flight = 0
+        self.batches = 0
+        self.rows = 0
+        self.size_flushes = 0
+        self.timeout_flushes = 0
+        self.errors = 0
+        self.max_queue_depth = 0
+        self._batch_sizes = Counter()
+
+    @property
+    def queue_depth(self):
+        """Rows waiting for a batch plus rows in batches currently being scored"""
+        return len(self._pending) + self._rows_in_flight
+
+    async def submit(self, row):
+        """Queue one feature row and wait for its prediction"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((row, future))
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush(loop, "size")
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush, loop, "timeout")
+
+        return await future
+
+    def _flush(self, loop, reason):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        with self._stats_lock:
+            if reason == "size":
+                self.size_flushes += 1
+            else:
+                self.timeout_flushes += 1
+            self.batches += 1
+            self.rows += len(batch)
+            self._batch_sizes[len(batch)] += 1
+
+        task = loop.create_task(self._run(loop, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, loop, batch):
+        self._rows_in_flight += len(batch)
+        try:
+            features = np.vstack([row for row, _ in batch])
+            predictions = await loop.run_in_executor(None, self.predict_fn, features)
+        except Exception as e:
+            self.errors += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), prediction in zip(batch, predictions):
+                # The request may have been cancelled while the batch was running
+                if not future.done():
+                    future.set_result(prediction)
+        finally:
+            self._rows_in_flight -= len(batch)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "enabled": True,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "batches": self.batches,
+                "rows": self.rows,
+                "avg_batch_size": self.rows / self.batches if self.batches else 0.0,
+                "size_flushes": self.size_flushes,
+                "timeout_flushes": self.timeout_flushes,
+                "errors": self.errors,
+                "batch_size_counts": dict(sorted(self._batch_sizes.items()))
+            }
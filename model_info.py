@@ -0,0 +1,151 @@
+import bisect
+import hashlib
+import json
+
+from training_frame import memory_report
+
+
+def _encode(payload):
+    """Serialize once the way FastAPI's JSONResponse does; the ETag is a hash of the bytes"""
+    body = json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+    return body, '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """True if an If-None-Match header value covers etag (weak comparison, as for GET)"""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in [candidate[2:] if candidate.startswith("W/") else candidate for candidate in candidates]
+
+
+class CategoryList:
+    """The classes of one label encoder, with case-insensitive prefix search"""
+
+    def __init__(self, classes):
+        self.values = tuple(classes)
+        # (lowercased, original) sorted by the lowercased form so a prefix is one contiguous range
+        ordered = sorted((value.lower(), value) for value in self.values)
+        self._lower = [lower for lower, _ in ordered]
+        self._by_lower = [value for _, value in ordered]
+
+    def search(self, prefix=None):
+        if not prefix:
+            return self.values
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self._lower, prefix)
+        end = bisect.bisect_left(self._lower, prefix + "\U0010ffff", lo=start)
+        return self._by_lower[start:end]
+
+
+class ModelInfo:
+    """
+    /model-info payloads for one model version, built once when the version
+    is loaded: the full payload with every category list and a summary
+    without them, each serialized with its ETag. add_records() refreshes the
+    training data stats after an ingestion without rescanning the data.
+    """
+
+    def __init__(self, bundle):
+        frames = bundle.training_frames()
+        self._payload = {
+            "model_loaded": bundle.model is not None,
+            "model_version": bundle.version,
+            "model_loaded_at": bundle.loaded_at,
+            "inference_engine": bundle.inference_engine,
+            "preprocessing": bundle.preprocessing,
+            "scaler_loaded": bundle.scaler is not None,
+            "label_encoders_loaded": bundle.label_encoders is not None,
+            "training_data_loaded": bool(frames)
+        }
+        header = getattr(bundle.compiled_forest, "header", None)
+        if header:
+            # What export_forest.py kept of the forest and how far it strays from best_model.pkl
+            self._payload["compact_forest"] = {
+                "trees": header["n_trees"],
+                "nodes": header["n_nodes"],
+                "max_depth": header["max_depth"],
+                "pruning": header.get("pruning"),
+                "error_vs_pickle": header.get("error_vs_pickle")
+            }
+
+        self.categories = {}
+        if bundle.label_encoders:
+            self.categories = {
+                category: CategoryList(encoder.classes_.tolist())
+                for category, encoder in bundle.label_encoders.items()
+            }
+
+        category_stats = bundle.category_encoder.stats()
+        self._payload["unknown_category_handling"] = {
+            "policy": category_stats["policy"],
+            "fallback_codes": category_stats["fallback_codes"],
+            "fuzzy_matching": category_stats["fuzzy_matching"]
+        }
+
+        self._total_records = 0
+        self._countries, self._origins, self._year_range = set(), set(), None
+        self._has_columns = {}
+        for frame in frames:
+            self._add_stats(frame)
+        self._memory = memory_report(frames)
+        self._publish()
+
+    def _add_stats(self, frame):
+        self._total_records += len(frame)
+        for column in ('country', 'origin', 'year'):
+            self._has_columns[column] = self._has_columns.get(column, False) or column in frame.columns
+        if 'country' in frame.columns:
+            self._countries.update(frame['country'].dropna().unique().tolist())
+        if 'origin' in frame.columns:
+            self._origins.update(frame['origin'].dropna().unique().tolist())
+        if 'year' in frame.columns and frame['year'].notna().any():
+            low, high = int(frame['year'].min()), int(frame['year'].max())
+            self._year_range = [low, high] if self._year_range is None else [min(low, self._year_range[0]), max(high, self._year_range[1])]
+
+    def _publish(self):
+        payload = dict(self._payload)
+        if self._payload["training_data_loaded"]:
+            payload["training_data_stats"] = {
+                "total_records": self._total_records,
+                "unique_countries": len(self._countries) if self._has_columns.get('country') else 0,
+                "unique_origins": len(self._origins) if self._has_columns.get('origin') else 0,
+                "year_range": (self._year_range or []) if self._has_columns.get('year') else []
+            }
+            payload["training_data_memory"] = self._memory
+        summary = _encode(payload)
+        if self.categories:
+            payload["available_categories"] = {name: list(values.values) for name, values in self.categories.items()}
+        # (body, etag) pairs, each swapped in as one object so readers never mix versions
+        self.summary, self.full = summary, _encode(payload)
+        self.version_tag = self.full[1].strip('"')
+
+    def add_records(self, records, frames):
+        """Fold newly ingested rows into training_data_stats and re-serialize; frames is the bundle's data after the append"""
+        self._payload["training_data_loaded"] = True
+        self._add_stats(records)
+        self._memory = memory_report(frames)
+        self._publish()
+
+    def update_memory(self, frames):
+        """Re-measure training_data_memory after the bundle's frames were rearranged (e.g. compacted)"""
+        self._memory = memory_report(frames)
+        self._publish()
+
+    def category_page_etag(self, category, prefix, offset, limit):
+        """Pages only change with the model version, so the tag is the version's tag hashed with the query"""
+        key = json.dumps([self.version_tag, category, prefix, offset, limit])
+        return '"' + hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + '"'
+
+    def category_page(self, category, prefix=None, offset=0, limit=None):
+        """One page of a category list, optionally narrowed to values starting with prefix"""
+        matches = self.categories[category].search(prefix)
+        end = len(matches) if limit is None else offset + limit
+        return {
+            "category": category,
+            "prefix": prefix,
+            "total": len(matches),
+            "offset": offset,
+            "limit": limit,
+            "values": list(matches[offset:end])
+        }
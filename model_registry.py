@@ -0,0 +1,454 @@
+import logging
+import os
+import threading
+import time
+
+import joblib
+import pandas as pd
+
+from artifact_cache import content_hash, load_training_data, load_compiled_forest, store_compiled_forest
+from category_encoding import CategoryEncoder
+from feature_pipeline import build_feature_pipeline
+from forest_engine import CompactForest, compile_forest, predict_with_uncertainty, read_compact_header, verify_compiled_forest
+from historical_index import build_historical_index
+from rollups import build_rollups
+from ingestion import IngestionLog, records_frame
+from prediction_cache import artifact_fingerprint
+from training_frame import compact_training_data
+
+logger = logging.getLogger(__name__)
+
+# Files every version directory must hold; training_data.csv is optional
+REQUIRED_FILES = ("best_model.pkl", "scaler.pkl", "label_encoders.pkl", "feature_columns.pkl")
+ARTIFACT_FILES = REQUIRED_FILES + ("training_data.csv",)
+# Optional output of export_forest.py, memory-mapped instead of unpickling best_model.pkl
+COMPACT_FOREST_FILE = "best_model.forest"
+
+# Version name used when artifacts sit directly in the working directory
+LEGACY_VERSION = "default"
+
+
+class BundleSettings:
+    """Load-time options shared by every model version"""
+
+    def __init__(self, inference_engine="compiled", compiled_max_rows=128, artifact_cache_dir=None,
+                 unknown_policy="most_frequent", unknown_sentinel=-1, fused_preprocessing=True, compact_training_data=True,
+                 fuzzy_matching=True, min_match_score=0.75, compact_forest=True):
+        self.inference_engine = inference_engine
+        self.compiled_max_rows = compiled_max_rows
+        self.artifact_cache_dir = artifact_cache_dir
+        self.unknown_policy = unknown_policy
+        self.unknown_sentinel = unknown_sentinel
+        self.fused_preprocessing = fused_preprocessing
+        self.compact_training_data = compact_training_data
+        self.fuzzy_matching = fuzzy_matching
+        self.min_match_score = min_match_score
+        self.compact_forest = compact_forest
+
+
+class ModelBundle:
+    """
+    Everything one model version needs to serve requests. Request handlers grab
+    the active bundle once and use it throughout, so a request that started
+    before a reload finishes on the version it started with.
+    """
+
+    def __init__(self, version, directory, model, scaler, label_encoders, feature_columns, training_data,
+                 compiled_forest, category_encoder, historical_index, compiled_max_rows=128, feature_pipeline=None,
+                 compact_training_data=False, rollups=None):
+        self.version = version
+        self.directory = directory
+        self.model = model
+        self.scaler = scaler
+        self.label_encoders = label_encoders
+        self.feature_columns = feature_columns
+        self.training_data = training_data
+        self.compiled_forest = compiled_forest
+        self.category_encoder = category_encoder
+        self.feature_pipeline = feature_pipeline
+        self.historical_index = historical_index
+        self.rollups = rollups
+        self.compiled_max_rows = compiled_max_rows
+        self.compact_training_data = compact_training_data
+        self.loaded_at = time.time()
+        self.load_seconds = None
+        # Serving resources the app attaches before the bundle goes live
+        self.micro_batcher = None
+        self.inference_pool = None
+        self.model_info = None
+        # Records ingested since training_data.csv was read, one DataFrame per ingestion, in order
+        self.ingested_frames = []
+        self.ingestion_log = IngestionLog(directory)
+        self._ingest_lock = threading.RLock()
+
+    @property
+    def inference_engine(self):
+        if isinstance(self.compiled_forest, CompactForest):
+            return "compact"
+        return "compiled" if self.compiled_forest is not None else "sklearn"
+
+    def artifact_path(self, name):
+        return os.path.join(self.directory, name)
+
+    def fingerprint(self):
+        return (self.version, artifact_fingerprint([self.artifact_path(name) for name in ARTIFACT_FILES + (COMPACT_FOREST_FILE,)]))
+
+    def predict(self, features_scaled):
+        """Predict scaled feature rows with the selected inference engine"""
+        if self.compiled_forest is not None and len(features_scaled) <= self.compiled_max_rows:
+            return self.compiled_forest.predict(features_scaled)
+        return self.model.predict(features_scaled)
+
+    def score(self, features_array):
+        """Scale unscaled feature rows and predict them in one pass"""
+        return self.predict(self.scaler.transform(features_array))
+
+    def predict_with_uncertainty(self, features_scaled, interval):
+        """predict() plus the per-tree (std, lower, upper) spread, or None for models that are not forests"""
+        if self.compiled_forest is not None and len(features_scaled) <= self.compiled_max_rows:
+            return predict_with_uncertainty(self.compiled_forest, features_scaled, interval)
+        return predict_with_uncertainty(self.model, features_scaled, interval)
+
+    def score_with_uncertainty(self, features_array, interval):
+        return self.predict_with_uncertainty(self.scaler.transform(features_array), interval)
+
+    def training_frames(self):
+        """training_data followed by every ingested batch, without concatenating them"""
+        return ([self.training_data] if self.training_data is not None else []) + list(self.ingested_frames)
+
+    def add_historical_records(self, records):
+        """
+        Make new rows (a DataFrame with the training_data columns) visible to
+        /historical-data, /summary and similar-case lookups. Only the index entries of the
+        pairs involved are rebuilt; training_data itself is not copied.
+        """
+        with self._ingest_lock:
+            if self.compact_training_data:
+                records = compact_training_data(records, self.label_encoders)
+            if self.historical_index is None:
+                self.historical_index = build_historical_index(pd.concat(self.training_frames() + [records], ignore_index=True))
+            else:
+                self.historical_index.append(records)
+            if self.rollups is None:
+                self.rollups = build_rollups(self.training_frames() + [records])
+            else:
+                self.rollups.append(records)
+            self.ingested_frames.append(records)
+            if self.model_info is not None:
+                self.model_info.add_records(records, self.training_frames())
+
+    def ingest(self, records):
+        """Durably log validated record dicts, then apply them in memory, keeping log and memory in the same order"""
+        with self._ingest_lock:
+            self.ingestion_log.append(records)
+            self.add_historical_records(records_frame(records))
+
+    def compact_ingested(self):
+        """Merge the ingestion log into training_data.csv and the ingested frames into training_data"""
+        with self._ingest_lock:
+            merged = self.ingestion_log.compact()
+            if self.ingested_frames:
+                training_data = pd.concat(self.training_frames(), ignore_index=True)
+                if self.compact_training_data:
+                    # Frames whose categories differ concatenate as plain strings
+                    training_data = compact_training_data(training_data, self.label_encoders)
+                self.training_data = training_data
+                self.ingested_frames = []
+                if self.model_info is not None:
+                    self.model_info.update_memory(self.training_frames())
+            return merged
+
+    @property
+    def preprocessing(self):
+        return "fused" if self.feature_pipeline is not None else "two_step"
+
+    def load_sklearn_model_in_background(self):
+        """Swap the full sklearn model in once it has been unpickled; large batches predict faster with it"""
+        def load():
+            try:
+                self.model = joblib.load(self.artifact_path("best_model.pkl"))
+                logger.info(f"Model {self.version}: sklearn model loaded in background")
+            except Exception as e:
+                logger.warning(f"Model {self.version}: background model load failed, compiled forest serves all predictions: {e}")
+        threading.Thread(target=load, name=f"model-loader-{self.version}", daemon=True).start()
+
+
+def compile_verified_forest(model):
+    """Compile the forest into packed arrays, keeping it only if it reproduces model.predict exactly"""
+    try:
+        compiled = compile_forest(model)
+        if compiled is None:
+            return None
+        max_diff = verify_compiled_forest(compiled, model)
+        if max_diff != 0.0:
+            logger.warning(f"Compiled forest differs from model.predict (max diff {max_diff}), using sklearn")
+            return None
+        return compiled
+    except Exception as e:
+        logger.error(f"Error compiling model: {e}")
+        return None
+
+
+def load_compact_forest(path, model_path):
+    """
+    Memory-map the compact forest exported to path, or return None if there is
+    none or it was exported from a different best_model.pkl
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        source = read_compact_header(path).get("source", {})
+        if os.path.exists(model_path):
+            stat = os.stat(model_path)
+            # Size and mtime settle it without reading the pickle; a copied file keeps its size but not its mtime
+            unchanged = stat.st_size == source.get("size") and (
+                stat.st_mtime_ns == source.get("mtime_ns") or content_hash(model_path) == source.get("sha256"))
+            if not unchanged:
+                logger.warning(f"{path} was exported from a different best_model.pkl, ignoring it; re-run export_forest.py")
+                return None
+        forest = CompactForest.load(path)
+    except Exception as e:
+        logger.warning(f"Could not load compact forest {path}: {e}")
+        return None
+    error = forest.header.get("error_vs_pickle", {})
+    logger.info(f"Compact forest {path} memory-mapped: {forest.n_trees} trees, {forest.n_nodes} nodes, "
+                f"MAE vs pickle {error.get('mae', float('nan')):.2e}")
+    return forest
+
+
+def _load_model(model_path, settings):
+    """
+    Returns (model, compiled_forest, from_cache). An exported compact forest
+    serves every prediction on its own; a cached compiled forest is
+    memory-mapped without unpickling the model, which is loaded later.
+    """
+    use_compiled = settings.inference_engine == "compiled"
+    if use_compiled and settings.compact_forest:
+        compact = load_compact_forest(os.path.join(os.path.dirname(model_path), COMPACT_FOREST_FILE), model_path)
+        if compact is not None:
+            return compact, compact, False
+    if use_compiled and settings.artifact_cache_dir:
+        compiled = load_compiled_forest(model_path, settings.artifact_cache_dir)
+        if compiled is not None:
+            return compiled, compiled, True
+
+    model = joblib.load(model_path)
+    compiled = compile_verified_forest(model) if use_compiled else None
+    if compiled is not None and settings.artifact_cache_dir:
+        store_compiled_forest(compiled, model_path, settings.artifact_cache_dir)
+    return model, compiled, False
+
+
+def load_bundle(directory, version, settings):
+    """Load and index every artifact in directory. Raises if a required artifact cannot be loaded."""
+    start = time.perf_counter()
+
+    def path(name):
+        return os.path.join(directory, name)
+
+    scaler = joblib.load(path("scaler.pkl"))
+    label_encoders = joblib.load(path("label_encoders.pkl"))
+    feature_columns = joblib.load(path("feature_columns.pkl"))
+    model, compiled_forest, forest_from_cache = _load_model(path("best_model.pkl"), settings)
+
+    try:
+        if settings.artifact_cache_dir:
+            training_data = load_training_data(path("training_data.csv"), settings.artifact_cache_dir,
+                                               compact=settings.compact_training_data)
+        else:
+            training_data = pd.read_csv(path("training_data.csv"))
+        if settings.compact_training_data:
+            # Category codes over the label encoders' vocabularies and downcast integers
+            training_data = compact_training_data(training_data, label_encoders)
+        logger.info(f"Model {version}: training data loaded, {len(training_data)} records")
+    except Exception as e:
+        logger.warning(f"Model {version}: could not load training data: {e}")
+        training_data = None
+
+    # Immutable string -> code tables, built once from the fitted label encoders
+    category_encoder = CategoryEncoder(
+        label_encoders,
+        training_data,
+        policy=settings.unknown_policy,
+        sentinel_code=settings.unknown_sentinel,
+        fuzzy_matching=settings.fuzzy_matching,
+        min_match_score=settings.min_match_score
+    )
+
+    bundle = ModelBundle(
+        version=version,
+        directory=directory,
+        model=model,
+        scaler=scaler,
+        label_encoders=label_encoders,
+        feature_columns=feature_columns,
+        training_data=training_data,
+        compiled_forest=compiled_forest,
+        category_encoder=category_encoder,
+        # Index (country, origin) -> year-sorted rows so lookups don't scan training_data
+        historical_index=build_historical_index(training_data),
+        # Country, origin, pair and pair-year aggregates served by /summary
+        rollups=build_rollups([training_data]),
+        compiled_max_rows=settings.compiled_max_rows,
+        # Encoder + scaler folded into lookup tables, verified against scaler.transform
+        feature_pipeline=build_feature_pipeline(category_encoder, scaler, feature_columns, training_data)
+        if settings.fused_preprocessing else None,
+        compact_training_data=settings.compact_training_data
+    )
+    # Records ingested since the last compaction
+    ingested = bundle.ingestion_log.read()
+    if ingested:
+        bundle.add_historical_records(records_frame(ingested))
+        logger.info(f"Model {version}: replayed {len(ingested)} ingested records")
+    if forest_from_cache:
+        bundle.load_sklearn_model_in_background()
+    bundle.load_seconds = time.perf_counter() - start
+    logger.info(f"Model {version} loaded from {directory} in {bundle.load_seconds:.2f}s ({bundle.inference_engine} engine, {bundle.preprocessing} preprocessing)")
+    return bundle
+
+
+class ModelRegistry:
+    """
+    Versioned model artifacts under root_dir, one directory per version
+    (models/<version>/best_model.pkl, scaler.pkl, ...). Versions sort by name,
+    so the latest is the last one. Without a root_dir the artifacts in the
+    working directory are served as version 'default'.
+
+    reload() loads a version on a background thread, runs warmup(bundle)
+    and prepare(bundle), then swaps it in atomically. The previous bundle is
+    handed to retire(bundle); requests still holding it finish normally.
+    """
+
+    def __init__(self, root_dir, settings, warmup=None, prepare=None, retire=None):
+        self.root_dir = root_dir
+        self.settings = settings
+        self.warmup = warmup
+        self.prepare = prepare
+        self.retire = retire
+        self._active = None
+        self._swap_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self.reloading_version = None
+        self.last_error = None
+        self.history = []
+        self._watcher = None
+
+    @property
+    def active(self):
+        return self._active
+
+    def versions(self):
+        if not self.root_dir or not os.path.isdir(self.root_dir):
+            return []
+        return sorted(
+            name for name in os.listdir(self.root_dir)
+            if all(os.path.exists(os.path.join(self.root_dir, name, f)) for f in REQUIRED_FILES)
+        )
+
+    def latest_version(self):
+        versions = self.versions()
+        return versions[-1] if versions else LEGACY_VERSION
+
+    def _directory(self, version):
+        if version == LEGACY_VERSION and version not in self.versions():
+            return "."
+        if version not in self.versions():
+            raise ValueError(f"Unknown model version '{version}', available: {self.versions()}")
+        return os.path.join(self.root_dir, version)
+
+    def fingerprint(self):
+        """Changes whenever a different version goes live or the active version's files change"""
+        bundle = self._active
+        return bundle.fingerprint() if bundle is not None else None
+
+    def _load_and_activate(self, version):
+        start = time.perf_counter()
+        bundle = load_bundle(self._directory(version), version, self.settings)
+        if self.warmup is not None:
+            self.warmup(bundle)
+        if self.prepare is not None:
+            self.prepare(bundle)
+
+        with self._swap_lock:
+            previous, self._active = self._active, bundle
+
+        self.history.append({
+            "version": version,
+            "activated_at": time.time(),
+            "load_and_warmup_seconds": round(time.perf_counter() - start, 3)
+        })
+        del self.history[:-20]
+        logger.info(f"Model {version} is now active" + (f" (replaced {previous.version})" if previous else ""))
+
+        if previous is not None and previous is not bundle and self.retire is not None:
+            self.retire(previous)
+        return bundle
+
+    def load_initial(self, version=None):
+        """Load the first version synchronously; on failure the API starts without a model"""
+        version = version or self.latest_version()
+        try:
+            return self._load_and_activate(version)
+        except Exception as e:
+            self.last_error = {"version": version, "error": str(e), "at": time.time()}
+            logger.error(f"Error loading model {version}: {e}")
+            return None
+
+    def reload(self, version=None, wait=False):
+        """
+        Load version (default: latest) and swap it in. Returns False if a reload is
+        already running. With wait=False the work happens on a background thread.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        version = version or self.latest_version()
+        self.reloading_version = version
+
+        def run():
+            try:
+                self._load_and_activate(version)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = {"version": version, "error": str(e), "at": time.time()}
+                logger.error(f"Reload of model {version} failed, keeping current version: {e}")
+            finally:
+                self.reloading_version = None
+                self._reload_lock.release()
+
+        if wait:
+            run()
+        else:
+            threading.Thread(target=run, name=f"model-reload-{version}", daemon=True).start()
+        return True
+
+    def watch(self, interval):
+        """Poll root_dir every interval seconds and reload when a newer version appears"""
+        if self._watcher is not None or interval <= 0:
+            return
+
+        def poll():
+            failed_version = None
+            while True:
+                time.sleep(interval)
+                latest = self.latest_version()
+                active = self._active
+                if latest == failed_version or (active is not None and active.version == latest):
+                    continue
+                logger.info(f"New model version {latest} detected")
+                self.reload(latest, wait=True)
+                failed_version = latest if self.last_error and self.last_error["version"] == latest else None
+
+        self._watcher = threading.Thread(target=poll, name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def status(self):
+        bundle = self._active
+        return {
+            "active_version": bundle.version if bundle is not None else None,
+            "active_directory": bundle.directory if bundle is not None else None,
+            "loaded_at": bundle.loaded_at if bundle is not None else None,
+            "available_versions": self.versions() or [LEGACY_VERSION],
+            "reloading_version": self.reloading_version,
+            "last_error": self.last_error,
+            "history": list(self.history)
+        }
@@ -0,0 +1,21 @@
+from pydantic import BaseModel, Field
+
+
+class PredictionInput(BaseModel):
+    country: str = Field(..., description="Country / territory of asylum/residence")
+    origin: str = Field(..., description="Country of origin of asylum seeker")
+    procedure_type: str = Field(..., description="RSD procedure type / level")
+    year: int = Field(..., ge=2000, le=2030, description="Year of application")
+    applied_during_year: int = Field(..., ge=0, description="Number of applications during year")
+    pending_start: int = Field(..., ge=0, description="Total pending start-year")
+    unhcr_assisted_start: int = Field(..., ge=0, description="UNHCR-assisted at start-year")
+    decisions_other: int = Field(..., ge=0, description="Other decisions made")
+
+
+def field_bounds(field):
+    """(ge, le) constraints declared on a PredictionInput field, None where unbounded"""
+    low = high = None
+    for constraint in PredictionInput.model_fields[field].metadata:
+        low = getattr(constraint, "ge", low)
+        high = getattr(constraint, "le", high)
+    return low, high
@@ -0,0 +1,226 @@
+import collections
+import contextvars
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+
+# The trace of the request being handled, if it is being profiled; copied into threadpool workers with the context
+CURRENT_TRACE = contextvars.ContextVar("request_trace", default=None)
+
+# (file name, function) of leaf frames where a thread is parked rather than working
+IDLE_LEAVES = frozenset([
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("connection.py", "_recv"),
+])
+
+
+def record_stage(pipeline, stage, seconds):
+    """Add a stage timing to the current request's trace; a no-op when the request isn't traced"""
+    trace = CURRENT_TRACE.get()
+    if trace is not None:
+        trace.stages.append((pipeline, stage, seconds))
+
+
+def _collapse(frame):
+    """A thread's stack as 'outer;...;leaf' frame labels, or None if the thread is idle"""
+    leaf = frame.f_code
+    if (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_LEAVES:
+        return None
+    labels = []
+    while frame is not None:
+        code = frame.f_code
+        labels.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class RequestTrace:
+    __slots__ = ("method", "path", "query", "started_at", "stages", "samples")
+
+    def __init__(self, scope):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.query = scope.get("query_string", b"").decode("latin-1")
+        self.started_at = time.time()
+        self.stages = []
+        self.samples = None
+
+
+class StackSampler:
+    """
+    Background thread that snapshots every thread's stack each interval while
+    at least one profiled request is in flight, and sleeps otherwise. Samples
+    go to every request in flight, so concurrent profiled requests share them.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._traces = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self, trace):
+        trace.samples = collections.Counter()
+        with self._lock:
+            self._traces.add(trace)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+            self._wakeup.set()
+
+    def stop(self, trace):
+        with self._lock:
+            self._traces.discard(trace)
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            self._wakeup.wait()
+            with self._lock:
+                if not self._traces:
+                    self._wakeup.clear()
+                    continue
+            stacks = [_collapse(frame) for ident, frame in sys._current_frames().items() if ident != me]
+            stacks = [stack for stack in stacks if stack is not None]
+            with self._lock:
+                # Only requests still in flight; a finished one's samples are being read
+                for trace in self._traces:
+                    trace.samples.update(stacks)
+            time.sleep(self.interval)
+
+
+class RequestProfiler:
+    """
+    Runtime-switchable request profiling. Requests picked at sample_rate, or
+    sent with the profile header set to header_token, get their stacks
+    sampled; every traced request records its pipeline stage timings. A
+    capture is kept in a ring buffer of the last buffer_size requests that
+    were sampled or took longer than slow_threshold_ms. With both switched
+    off and no header, requests pass straight through.
+    """
+
+    def __init__(self, sample_rate=0.0, slow_threshold_ms=0.0, buffer_size=100, interval_ms=5.0, header_token=None):
+        self.sample_rate = sample_rate
+        self.slow_threshold_ms = slow_threshold_ms
+        self.interval_ms = interval_ms
+        # Header value that profiles a request; None ignores the header, so anonymous clients can't start the sampler
+        self.header_token = header_token
+        self.captures = collections.deque(maxlen=buffer_size)
+        self.sampler = StackSampler(interval_ms / 1000)
+        self.traced = 0
+        self.slow = 0
+        self.sampled = 0
+
+    def configure(self, sample_rate=None, slow_threshold_ms=None):
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if slow_threshold_ms is not None:
+            self.slow_threshold_ms = slow_threshold_ms
+
+    def header_requested(self, value):
+        if value is None or self.header_token is None:
+            return False
+        return hmac.compare_digest(value.encode("utf-8"), self.header_token.encode("utf-8"))
+
+    def begin(self, scope, header_value):
+        """A trace for this request, or None to leave it alone"""
+        forced = self.header_requested(header_value)
+        sampled = forced or (self.sample_rate > 0 and random.random() < self.sample_rate)
+        if not sampled and self.slow_threshold_ms <= 0:
+            return None
+        trace = RequestTrace(scope)
+        if sampled:
+            self.sampler.start(trace)
+        return trace
+
+    def finish(self, trace, status, duration):
+        self.traced += 1
+        sampled = trace.samples is not None
+        if sampled:
+            self.sampler.stop(trace)
+            self.sampled += 1
+        slow = 0 < self.slow_threshold_ms <= duration * 1000
+        if slow:
+            self.slow += 1
+        if not (sampled or slow):
+            return
+        self.captures.append({
+            "method": trace.method,
+            "path": trace.path,
+            "query": trace.query,
+            "status": status,
+            "started_at": trace.started_at,
+            "duration_ms": duration * 1000,
+            "slow": slow,
+            "stages": [
+                {"pipeline": pipeline, "stage": stage, "ms": seconds * 1000}
+                for pipeline, stage, seconds in trace.stages
+            ],
+            "profile": {
+                "interval_ms": self.interval_ms,
+                "samples": sum(trace.samples.values()),
+                "stacks": dict(trace.samples.most_common())
+            } if sampled else None
+        })
+
+    def collapsed(self):
+        """Stack samples of every buffered capture merged in collapsed-stack format (flamegraph.pl, speedscope)"""
+        merged = collections.Counter()
+        for capture in list(self.captures):
+            if capture["profile"] is not None:
+                merged.update(capture["profile"]["stacks"])
+        return "".join(f"{stack} {count}\n" for stack, count in merged.most_common())
+
+    def stats(self):
+        return {
+            "sample_rate": self.sample_rate,
+            "slow_threshold_ms": self.slow_threshold_ms,
+            "interval_ms": self.interval_ms,
+            "buffer_size": self.captures.maxlen,
+            "buffered": len(self.captures),
+            "traced": self.traced,
+            "sampled": self.sampled,
+            "slow": self.slow
+        }
+
+
+class ProfilingMiddleware:
+    """ASGI middleware tracing requests for a RequestProfiler"""
+
+    def __init__(self, app, profiler, header="x-profile-request"):
+        self.app = app
+        self.profiler = profiler
+        self.header = header.lower().encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        header_value = next((value.decode("latin-1") for name, value in scope["headers"] if name == self.header), None)
+        trace = self.profiler.begin(scope, header_value)
+        if trace is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        token = CURRENT_TRACE.set(trace)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            CURRENT_TRACE.reset(token)
+            self.profiler.finish(trace, status, time.perf_counter() - start)
@@ -0,0 +1,194 @@
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Rollup level -> the training_data columns it groups by
+LEVELS = {
+    "country": ("country",),
+    "origin": ("origin",),
+    "pair": ("country", "origin"),
+    "pair_year": ("country", "origin", "year"),
+}
+METRICS = ("records", "avg_acceptance_rate", "total_applications", "total_pending")
+
+TOTAL_COLUMNS = ['records', 'rate_sum', 'rate_count', 'total_applications', 'total_pending']
+
+
+def _pair_year_totals(frame):
+    """Row count, acceptance_rate sum and non-NaN count, applications and pending per (country, origin, year) of one frame"""
+    rates = frame['acceptance_rate'].to_numpy(dtype=np.float64) if 'acceptance_rate' in frame.columns else np.full(len(frame), np.nan)
+    valid = ~np.isnan(rates)
+    columns = {
+        # Plain strings, so totals from compact and read_csv frames combine
+        'country': frame['country'].astype(object),
+        'origin': frame['origin'].astype(object),
+        'year': frame['year'],
+        'records': np.ones(len(frame), dtype=np.int64),
+        'rate_sum': np.where(valid, rates, 0.0),
+        'rate_count': valid.astype(np.int64),
+    }
+    for name, column in (('total_applications', 'applied_during_year'), ('total_pending', 'pending_start')):
+        columns[name] = frame[column].to_numpy(dtype=np.int64) if column in frame.columns else np.zeros(len(frame), dtype=np.int64)
+    return pd.DataFrame(columns).groupby(['country', 'origin', 'year'], sort=False).sum().reset_index()
+
+
+def _combine(totals):
+    """Sum pair-year totals from several frames, sorted by key"""
+    combined = totals[0] if len(totals) == 1 else pd.concat(totals, ignore_index=True)
+    combined = combined.groupby(['country', 'origin', 'year'], sort=True).sum().reset_index()
+    combined['year'] = combined['year'].astype(np.int64)
+    return combined
+
+
+class _LevelView:
+    """
+    One level's aggregates as key-sorted columns, with a precomputed ranking
+    per metric and the positions of each country and origin. Entries are
+    turned into dicts only when a page of them is returned.
+    """
+
+    def __init__(self, level, pair_years):
+        self.level = level
+        keys = list(LEVELS[level])
+        if level == "pair_year":
+            grouped = pair_years
+        else:
+            grouped = pair_years.groupby(keys, sort=True).agg(
+                **{column: (column, 'sum') for column in TOTAL_COLUMNS},
+                first_year=('year', 'min'),
+                last_year=('year', 'max'),
+                years_covered=('year', 'nunique')
+            ).reset_index()
+
+        self.size = len(grouped)
+        self.keys = {column: grouped[column].to_numpy() for column in keys}
+        rate_count = grouped['rate_count'].to_numpy()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            avg = np.where(rate_count > 0, grouped['rate_sum'].to_numpy() / rate_count, np.nan)
+        self.metrics = {
+            "records": grouped['records'].to_numpy(),
+            "avg_acceptance_rate": avg,
+            "total_applications": grouped['total_applications'].to_numpy(),
+            "total_pending": grouped['total_pending'].to_numpy(),
+        }
+        self.coverage = None
+        if level != "pair_year":
+            self.coverage = tuple(grouped[column].to_numpy() for column in ('first_year', 'last_year', 'years_covered'))
+
+        # Stable sorts over key order, so ties stay alphabetical; NaN sorts last both ways
+        self.orders = {}
+        for metric, values in self.metrics.items():
+            values = values.astype(np.float64)
+            self.orders[metric] = {"desc": np.argsort(-values, kind="stable"), "asc": np.argsort(values, kind="stable")}
+
+        positions = pd.Series(np.arange(self.size))
+        self.by_key = {column: positions.groupby(self.keys[column]).indices
+                       for column in ('country', 'origin') if column in self.keys}
+
+    def entry(self, position):
+        entry = {column: values[position].item() if column == 'year' else values[position] for column, values in self.keys.items()}
+        avg = self.metrics["avg_acceptance_rate"][position]
+        entry.update({
+            "records": int(self.metrics["records"][position]),
+            "avg_acceptance_rate": None if np.isnan(avg) else float(avg),
+            "total_applications": int(self.metrics["total_applications"][position]),
+            "total_pending": int(self.metrics["total_pending"][position]),
+        })
+        if self.coverage is not None:
+            first_year, last_year, years_covered = self.coverage
+            entry["year_range"] = [int(first_year[position]), int(last_year[position])]
+            entry["years_covered"] = int(years_covered[position])
+        return entry
+
+    def positions(self, country=None, origin=None):
+        """Positions matching the filters in key order, or None for every entry"""
+        matches = None
+        for column, value in (('country', country), ('origin', origin)):
+            if value is None:
+                continue
+            found = self.by_key[column].get(value, np.empty(0, dtype=np.int64))
+            matches = found if matches is None else np.intersect1d(matches, found)
+        return matches
+
+
+class Rollups:
+    """
+    Per-country, per-origin, per-(country, origin) and per-(country, origin,
+    year) aggregates of training_data: record count, mean acceptance_rate,
+    total applied_during_year and pending_start, and year coverage. Built
+    once when a version is loaded and refreshed by append(), so summary
+    pages and top-N lists never scan the data.
+
+    Running totals are kept per (country, origin, year); the coarser levels
+    are re-derived from them, which is far smaller than the data. Each
+    append swaps every level in as one object, so readers need no lock.
+    """
+
+    def __init__(self, frames):
+        self._lock = threading.Lock()
+        self._pair_years = _combine([_pair_year_totals(frame) for frame in frames])
+        self._views = self._build_views()
+        logger.info("Rollups built: " + ", ".join(f"{view.size} {level}" for level, view in self._views.items()))
+
+    def _build_views(self):
+        return {level: _LevelView(level, self._pair_years) for level in LEVELS}
+
+    def append(self, records):
+        """Fold new rows (a DataFrame with the training_data columns) into every level"""
+        with self._lock:
+            self._pair_years = _combine([self._pair_years, _pair_year_totals(records)])
+            self._views = self._build_views()
+
+    def page(self, level, country=None, origin=None, offset=0, limit=50):
+        """(total, entries) of a level in key order, optionally narrowed to one country and/or origin"""
+        view = self._views[level]
+        positions = view.positions(country, origin)
+        if positions is None:
+            return view.size, [view.entry(position) for position in range(offset, min(offset + limit, view.size))]
+        return len(positions), [view.entry(position) for position in positions[offset:offset + limit]]
+
+    def top(self, level, metric, order="desc", country=None, origin=None, min_records=1, offset=0, limit=10):
+        """
+        Entries of a level ranked by metric, skipping those with fewer than
+        min_records rows. Unfiltered rankings walk a precomputed order; a
+        country/origin filter ranks only the matching entries.
+        """
+        view = self._views[level]
+        positions = view.positions(country, origin)
+        if positions is None:
+            ranked = view.orders[metric][order]
+        else:
+            values = view.metrics[metric][positions].astype(np.float64)
+            ranked = positions[np.argsort(-values if order == "desc" else values, kind="stable")]
+
+        records = view.metrics["records"]
+        items, skipped = [], 0
+        for position in ranked:
+            if records[position] < min_records:
+                continue
+            if skipped < offset:
+                skipped += 1
+                continue
+            items.append(view.entry(position))
+            if len(items) == limit:
+                break
+        return items
+
+    def sizes(self):
+        return {level: view.size for level, view in self._views.items()}
+
+
+def build_rollups(frames):
+    """Build rollups over training_data frames, or return None if they lack the columns needed"""
+    frames = [frame for frame in frames if frame is not None]
+    if not frames:
+        return None
+    missing = sorted({column for frame in frames for column in ('country', 'origin', 'year') if column not in frame.columns})
+    if missing:
+        logger.warning(f"Rollups not built, training data is missing columns: {missing}")
+        return None
+    return Rollups(frames)
@@ -0,0 +1,284 @@
+"""
+Offline bulk scoring of CSV or NDJSON files with the API's artifacts.
+
+    python score_file.py extract.csv --output scored.parquet --workers 4
+    python score_file.py extract.ndjson --output scored.csv --artifacts models/2024-09-15
+
+Loads the model version in --artifacts with the same code the API uses
+(model_registry.load_bundle: category encoder, compiled forest, historical
+index), reads the input in chunks of --chunk-rows and scores the chunks in a
+process pool, each worker holding its own loaded bundle. Output rows keep the
+input order. A .parquet output needs pyarrow; any other suffix writes CSV.
+Rows with missing fields, or numbers that aren't integers within the API's
+PredictionInput bounds, get an `error` and no prediction.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from model_registry import BundleSettings, load_bundle
+from prediction_input import field_bounds
+
+CATEGORICAL_FIELDS = {'country': 'country', 'origin': 'origin', 'procedure_type': 'procedure'}
+NUMERIC_FIELDS = ['year', 'applied_during_year', 'pending_start', 'unhcr_assisted_start', 'decisions_other']
+
+# Output column -> type, shared by the CSV and Parquet writers
+OUTPUT_COLUMNS = {
+    'row': 'int64',
+    'predicted_acceptance_rate': 'float64',
+    'prediction_std': 'float64',
+    'prediction_lower': 'float64',
+    'prediction_upper': 'float64',
+    'country_encoded': 'int64',
+    'origin_encoded': 'int64',
+    'procedure_encoded': 'int64',
+    'similar_cases_count': 'int64',
+    'similar_cases_avg_acceptance_rate': 'float64',
+    'similar_cases_years': 'string',
+    'confidence': 'string',
+    'error': 'string',
+}
+
+# The bundle a worker process scores with and the uncertainty interval, set once by _init_worker
+_bundle = None
+_interval = None
+
+
+def _init_worker(artifact_dir, settings, interval):
+    global _bundle, _interval
+    logging.getLogger('category_encoding').setLevel(logging.ERROR)
+    _bundle = load_bundle(artifact_dir, os.path.basename(os.path.abspath(artifact_dir)), settings)
+    _interval = interval
+
+
+def score_frame(frame, bundle, interval=0.9):
+    """Score one chunk of input rows; returns the output frame and per-field unknown-category counts"""
+    n = len(frame)
+    errors = np.full(n, None, dtype=object)
+
+    def flag(mask, message):
+        mask = np.asarray(mask) & pd.isna(errors)
+        errors[mask] = message
+
+    category_encoder = bundle.category_encoder
+    unknowns_before = category_encoder.unknowns.totals()
+    codes = {}
+    for field, name in CATEGORICAL_FIELDS.items():
+        values = frame[field]
+        flag(values.isna().to_numpy(), f"{field}: missing")
+        codes[name] = category_encoder.encode_column(name, values.fillna('').astype(str).to_numpy(dtype=object))
+    unknowns_after = category_encoder.unknowns.totals()
+
+    numeric = {}
+    for field in NUMERIC_FIELDS:
+        values = pd.to_numeric(frame[field], errors='coerce').to_numpy(dtype=np.float64)
+        flag(np.isnan(values) | (values != np.round(values)), f"{field}: not an integer")
+        # The same bounds PredictionInput enforces on /predict and /predict/stream
+        low, high = field_bounds(field)
+        if low is not None:
+            flag(values < low, f"{field}: Input should be greater than or equal to {low}")
+        if high is not None:
+            flag(values > high, f"{field}: Input should be less than or equal to {high}")
+        numeric[field] = values
+
+    valid = pd.isna(errors)
+    predictions = np.full(n, np.nan)
+    spread = [np.full(n, np.nan) for _ in range(3)]
+    if valid.any():
+        features_array = np.column_stack(
+            [codes['country'], codes['origin'], codes['procedure']] + [numeric[field] for field in NUMERIC_FIELDS]
+        )[valid]
+        # Per-tree std and interval bounds come from the same forest pass as the prediction
+        valid_predictions, valid_spread = bundle.score_with_uncertainty(features_array, interval)
+        predictions[valid] = np.clip(valid_predictions, 0.0, 1.0)
+        if valid_spread is not None:
+            std, lower, upper = valid_spread
+            spread[0][valid] = std
+            spread[1][valid] = np.clip(lower, 0.0, 1.0)
+            spread[2][valid] = np.clip(upper, 0.0, 1.0)
+
+    counts = np.zeros(n, dtype=np.int64)
+    rates = np.full(n, np.nan)
+    years = np.full(n, '', dtype=object)
+    if bundle.historical_index is not None:
+        # Similar cases only depend on (country, origin), so look each pair up once and broadcast by pair code
+        pair_codes, unique_pairs = pd.factorize(pd.Series(list(zip(frame['country'], frame['origin'])), dtype=object))
+        pair_counts = np.zeros(len(unique_pairs), dtype=np.int64)
+        pair_rates = np.full(len(unique_pairs), np.nan)
+        pair_years = np.full(len(unique_pairs), '', dtype=object)
+        for i, (country, origin) in enumerate(unique_pairs):
+            if isinstance(country, str) and isinstance(origin, str):
+                # Fuzzy-matched names get the similar cases of the category they resolved to, as in the API
+                country, origin = category_encoder.canonical('country', country), category_encoder.canonical('origin', origin)
+            summary = bundle.historical_index.summary(country, origin)
+            if summary is None:
+                continue
+            pair_counts[i] = summary['count']
+            if summary['avg_acceptance_rate'] is not None:
+                pair_rates[i] = summary['avg_acceptance_rate']
+            pair_years[i] = ';'.join(str(year) for year in summary['years_available'])
+        counts, rates, years = pair_counts[pair_codes], pair_rates[pair_codes], pair_years[pair_codes]
+
+    confidence = np.where(counts > 5, 'High', np.where(counts > 0, 'Medium', 'Low')).astype(object)
+    confidence[~valid] = None
+
+    output = pd.DataFrame({
+        'row': frame.index.to_numpy(dtype=np.int64) + 1,
+        'predicted_acceptance_rate': predictions,
+        'prediction_std': spread[0],
+        'prediction_lower': spread[1],
+        'prediction_upper': spread[2],
+        'country_encoded': codes['country'],
+        'origin_encoded': codes['origin'],
+        'procedure_encoded': codes['procedure'],
+        'similar_cases_count': counts,
+        'similar_cases_avg_acceptance_rate': rates,
+        'similar_cases_years': years,
+        'confidence': confidence,
+        'error': errors,
+    }).astype(OUTPUT_COLUMNS)
+    unknowns = {field: unknowns_after.get(field, 0) - unknowns_before.get(field, 0) for field in unknowns_after}
+    return output, unknowns
+
+
+def _worker_score(frame):
+    return score_frame(frame, _bundle, _interval)
+
+
+def read_chunks(path, chunk_rows):
+    """Input chunks with a RangeIndex continuing across chunks, so row numbers are file-wide"""
+    if path.endswith(('.ndjson', '.jsonl')):
+        reader = pd.read_json(path, lines=True, chunksize=chunk_rows, dtype=False)
+    else:
+        reader = pd.read_csv(path, chunksize=chunk_rows, dtype={field: object for field in CATEGORICAL_FIELDS})
+    for chunk in reader:
+        missing = [field for field in list(CATEGORICAL_FIELDS) + NUMERIC_FIELDS if field not in chunk.columns]
+        if missing:
+            raise ValueError(f"{path} is missing columns: {missing}")
+        yield chunk
+
+
+class CsvSink:
+    def __init__(self, path):
+        self.path = path
+        self._header = True
+
+    def write(self, frame):
+        frame.to_csv(self.path, mode='w' if self._header else 'a', header=self._header, index=False)
+        self._header = False
+
+    def close(self):
+        if self._header:
+            pd.DataFrame(columns=list(OUTPUT_COLUMNS)).to_csv(self.path, index=False)
+
+
+class ParquetSink:
+    """Writes one row group per chunk so the whole output never has to be in memory"""
+
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow (pip install pyarrow); use a .csv output instead")
+        types = {'int64': pyarrow.int64(), 'float64': pyarrow.float64(), 'string': pyarrow.string()}
+        self._pyarrow = pyarrow
+        self._schema = pyarrow.schema([(name, types[kind]) for name, kind in OUTPUT_COLUMNS.items()])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema)
+
+    def write(self, frame):
+        self._writer.write_table(self._pyarrow.Table.from_pandas(frame, schema=self._schema, preserve_index=False))
+
+    def close(self):
+        self._writer.close()
+
+
+def open_sink(path):
+    return ParquetSink(path) if path.endswith('.parquet') else CsvSink(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="CSV with a header row, or NDJSON (.ndjson/.jsonl), with the PredictionInput fields")
+    parser.add_argument("--output", required=True, help=".parquet (needs pyarrow) or .csv")
+    parser.add_argument("--artifacts", default=".", help="directory holding best_model.pkl, scaler.pkl, ...")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-rows", type=int, default=50_000)
+    parser.add_argument("--interval", type=float, default=float(os.getenv("PREDICTION_INTERVAL", "0.9")),
+                        help="central share of the per-tree predictions reported as prediction_lower/prediction_upper")
+    # "reject" is API-only: a file is scored whole, so one unresolvable row would fail everything
+    parser.add_argument("--unknown-policy", default=os.getenv("UNKNOWN_CATEGORY_POLICY", "most_frequent"),
+                        choices=["most_frequent", "sentinel"])
+    parser.add_argument("--unknown-sentinel", type=int, default=int(os.getenv("UNKNOWN_CATEGORY_SENTINEL", "-1")))
+    parser.add_argument("--min-match-score", type=float, default=float(os.getenv("FUZZY_MATCH_MIN_SCORE", "0.75")),
+                        help="lowest similarity at which an unknown name is scored as its closest known category")
+    parser.add_argument("--no-fuzzy-matching", action="store_true", default=os.getenv("FUZZY_CATEGORY_MATCHING", "1") != "1",
+                        help="send every unknown name straight to the fallback policy")
+    parser.add_argument("--cache-dir", default=os.getenv("ARTIFACT_CACHE_DIR", ".artifact_cache"),
+                        help="columnar artifact cache shared with the API; '' disables it")
+    args = parser.parse_args()
+    if not 0 < args.interval < 1:
+        parser.error(f"--interval must be between 0 and 1 (exclusive), got {args.interval}")
+
+    logging.basicConfig(level=logging.WARNING)
+    settings = BundleSettings(
+        # Whole chunks are scored at once, where sklearn is faster than the compiled engine
+        inference_engine="sklearn",
+        artifact_cache_dir=args.cache_dir or None,
+        unknown_policy=args.unknown_policy,
+        unknown_sentinel=args.unknown_sentinel,
+        fuzzy_matching=not args.no_fuzzy_matching,
+        min_match_score=args.min_match_score
+    )
+
+    start = time.perf_counter()
+    rows = failed = 0
+    unknowns = {}
+    sink = open_sink(args.output)
+
+    def collect(result):
+        nonlocal rows, failed
+        output, chunk_unknowns = result
+        sink.write(output)
+        rows += len(output)
+        failed += int(output['error'].notna().sum())
+        for field, hits in chunk_unknowns.items():
+            unknowns[field] = unknowns.get(field, 0) + hits
+        elapsed = time.perf_counter() - start
+        print(f"\r{rows:,} rows scored, {rows / elapsed:,.0f} rows/s", end="", file=sys.stderr, flush=True)
+
+    try:
+        if args.workers <= 1:
+            _init_worker(args.artifacts, settings, args.interval)
+            for chunk in read_chunks(args.input, args.chunk_rows):
+                collect(_worker_score(chunk))
+        else:
+            # spawn so workers start clean; at most 2 chunks per worker are held in memory at a time
+            with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=_init_worker, initargs=(args.artifacts, settings, args.interval)) as executor:
+                pending = deque()
+                for chunk in read_chunks(args.input, args.chunk_rows):
+                    pending.append(executor.submit(_worker_score, chunk))
+                    if len(pending) >= 2 * args.workers:
+                        collect(pending.popleft().result())
+                while pending:
+                    collect(pending.popleft().result())
+    finally:
+        sink.close()
+
+    elapsed = time.perf_counter() - start
+    print(file=sys.stderr)
+    print(f"{rows:,} rows in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:,.0f} rows/s), "
+          f"{failed:,} failed, unknown categories: {unknowns or 'none'} -> {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import os
+import sys
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+from sklearn.ensemble import RandomForestRegressor
+
+# The API's modules sit at the repository root
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO_DIR)
+
+import main  # noqa: E402
+from model_registry import BundleSettings, load_bundle  # noqa: E402
+
+ADMIN_TOKEN = "test-token"
+
+
+@pytest.fixture(scope="session")
+def label_encoders():
+    return joblib.load(os.path.join(REPO_DIR, "label_encoders.pkl"))
+
+
+@pytest.fixture
+def training_data(label_encoders):
+    """400 synthetic rows with the training_data.csv columns over a few countries and origins, some rates missing"""
+    rng = np.random.default_rng(0)
+    n = 400
+    frame = pd.DataFrame({
+        "country": rng.choice(label_encoders["country"].classes_[:4], n),
+        "origin": rng.choice(label_encoders["origin"].classes_[:6], n),
+        "procedure_type": rng.choice(label_encoders["procedure"].classes_, n),
+        "year": rng.integers(2000, 2017, n),
+        "applied_during_year": rng.integers(0, 5000, n),
+        "pending_start": rng.integers(0, 8000, n),
+        "unhcr_assisted_start": rng.integers(0, 2000, n),
+        "decisions_other": rng.integers(0, 300, n),
+        "acceptance_rate": rng.random(n),
+    })
+    frame.loc[rng.random(n) < 0.05, "acceptance_rate"] = np.nan
+    return frame
+
+
+@pytest.fixture
+def model_dir(tmp_path, training_data):
+    """A model version directory: the repo's scaler and encoders, training_data and a small forest"""
+    for name in ("scaler.pkl", "label_encoders.pkl", "feature_columns.pkl"):
+        with open(os.path.join(REPO_DIR, name), "rb") as source, open(tmp_path / name, "wb") as target:
+            target.write(source.read())
+    training_data.to_csv(tmp_path / "training_data.csv", index=False)
+    rng = np.random.default_rng(0)
+    model = RandomForestRegressor(n_estimators=5, max_depth=4, random_state=0).fit(rng.standard_normal((200, 8)), rng.random(200))
+    joblib.dump(model, tmp_path / "best_model.pkl")
+    return str(tmp_path)
+
+
+@pytest.fixture
+def app_client(model_dir, monkeypatch):
+    """TestClient for the app serving the version in model_dir, with ADMIN_TOKEN set"""
+    monkeypatch.setattr(main.registry, "_active", load_bundle(model_dir, "test", BundleSettings()))
+    monkeypatch.setattr(main, "ADMIN_TOKEN", ADMIN_TOKEN)
+    return TestClient(main.app)
@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from admission import DEFAULT_LIMITS, AdmissionControl, Overloaded, parse_limits
+
+# One slot and one queue place per class, so a couple of requests saturate it
+TIGHT_LIMITS = "predict=1:1:1.0,batch=1:1:1.0,historical=1:1:1.0,bulk=1:1:1.0,info=1:1:1.0"
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def queued(control, route_class):
+    """Start an admit that has to wait, and let it reach the queue"""
+    task = asyncio.ensure_future(control.admit(route_class))
+    await asyncio.sleep(0)
+    assert route_class.queue_depth == 1
+    return task
+
+
+@pytest.mark.parametrize("path, name", [
+    ("/predict", "predict"),
+    ("/predict/batch", "batch"),
+    ("/predict/sweep", "batch"),
+    ("/predict/stream", "bulk"),
+    ("/historical-data", "historical"),
+    ("/summary/top", "historical"),
+    ("/model-info", "info"),
+    ("/model-info/categories/origin", "info"),
+    ("/cache-stats", "info"),
+])
+def test_routes_map_to_their_class(path, name):
+    assert AdmissionControl(parse_limits(DEFAULT_LIMITS)).classify(path).name == name
+
+
+@pytest.mark.parametrize("path", ["/metrics", "/admission-stats", "/admin/reload", "/admin/ingest", "/"])
+def test_unclassified_routes_are_never_limited(path):
+    assert AdmissionControl(parse_limits(DEFAULT_LIMITS)).classify(path) is None
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    async def scenario():
+        control = AdmissionControl(parse_limits(TIGHT_LIMITS))
+        predict = control.classes["predict"]
+        await control.admit(predict)
+        waiting = await queued(control, predict)
+        with pytest.raises(Overloaded) as error:
+            await control.admit(predict)
+        assert error.value.reason == "queue_full" and error.value.retry_after >= 1
+        # The freed slot goes to the queued request
+        predict.release(0.01)
+        await waiting
+        assert (predict.in_flight, predict.queue_depth, predict.rejected["queue_full"]) == (1, 0, 1)
+
+    run(scenario())
+
+
+def test_queued_request_past_its_budget_is_rejected():
+    async def scenario():
+        control = AdmissionControl(parse_limits("predict=1:4:0.05"))
+        predict = control.classes["predict"]
+        await control.admit(predict)
+        with pytest.raises(Overloaded) as error:
+            await control.admit(predict)
+        assert error.value.reason == "deadline"
+        assert predict.queue_depth == 0
+
+    run(scenario())
+
+
+def test_lower_priority_classes_are_shed_while_predict_is_queued():
+    async def scenario():
+        control = AdmissionControl(parse_limits(TIGHT_LIMITS))
+        predict, historical = control.classes["predict"], control.classes["historical"]
+        await control.admit(predict)
+        waiting = await queued(control, predict)
+        for name in ("batch", "bulk", "info"):
+            with pytest.raises(Overloaded) as error:
+                await control.admit(control.classes[name])
+            assert error.value.reason == "shed"
+        # Same priority as predict, so still admitted
+        await control.admit(historical)
+        predict.release(0.01)
+        await waiting
+        await control.admit(control.classes["info"])
+
+    run(scenario())
+
+
+def test_busy_batch_class_does_not_hold_up_single_predictions():
+    async def scenario():
+        control = AdmissionControl(parse_limits(TIGHT_LIMITS))
+        batch, predict = control.classes["batch"], control.classes["predict"]
+        await control.admit(batch)
+        waiting = await queued(control, batch)
+        await asyncio.wait_for(control.admit(predict), timeout=1)
+        # A slow batch call must not inflate the wait single predictions expect
+        batch.release(30.0)
+        await waiting
+        assert predict.avg_service_seconds == 0.0
+        assert predict.estimated_wait(0) == 0.0
+
+    run(scenario())
+
+
+@pytest.fixture
+def saturated_info(monkeypatch):
+    """The app's info class with every slot taken and no queue"""
+    info = main.admission.classes["info"]
+    monkeypatch.setattr(info, "in_flight", info.concurrency)
+    monkeypatch.setattr(info, "queue_size", 0)
+    return info
+
+
+def test_app_rejects_with_503_retry_after_and_cors_headers(saturated_info):
+    response = TestClient(main.app).get("/model-info", headers={"Origin": "https://example.org"})
+    assert response.status_code == 503
+    assert int(response.headers["retry-after"]) >= 1
+    assert response.headers["access-control-allow-origin"] in ("*", "https://example.org")
+    assert "queue_full" in response.json()["detail"]
+
+
+def test_preflight_requests_never_take_a_slot(saturated_info):
+    rejected = sum(saturated_info.rejected.values())
+    response = TestClient(main.app).options("/model-info", headers={
+        "Origin": "https://example.org", "Access-Control-Request-Method": "GET"})
+    assert response.status_code == 200
+    assert sum(saturated_info.rejected.values()) == rejected
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from category_encoding import CategoryEncoder
+from category_matching import CategoryMatcher
+
+ORIGINS = ["Afghanistan", "Australia", "Dem. Rep. of the Congo", "Origin 177", "Somalia", "South Sudan", "Sudan",
+           "Syrian Arab Rep."]
+
+
+class FakeLabelEncoder:
+    def __init__(self, classes):
+        self.classes_ = np.array(sorted(classes), dtype=object)
+
+
+@pytest.fixture
+def encoder():
+    return CategoryEncoder({"origin": FakeLabelEncoder(ORIGINS)}, policy="sentinel")
+
+
+@pytest.mark.parametrize("value", ["Austria", "Sudan North", "Unseen origin 177"])
+def test_near_names_of_other_categories_fall_back(encoder, value):
+    match = encoder.resolve("origin", value)
+    assert match.method == "fallback"
+    assert match.code == -1
+
+
+@pytest.mark.parametrize("value, expected, method", [
+    ("Somalia", "Somalia", "exact"),
+    ("somalia ", "Somalia", "normalized"),
+    ("DR Congo", "Dem. Rep. of the Congo", "alias"),
+    ("Syrian Arab Republic", "Syrian Arab Rep.", "normalized"),
+    ("Afghanistaan", "Afghanistan", "trigram"),
+])
+def test_same_category_still_resolves(encoder, value, expected, method):
+    match = encoder.resolve("origin", value)
+    assert (match.category, match.method) == (expected, method)
+
+
+def test_trigram_match_needs_a_margin_over_the_runner_up():
+    # "Nigeri" scores 0.667 against "Nigeria" and 0.625 against "Niger"
+    assert CategoryMatcher(["Niger", "Nigeria"], min_margin=0.1).match("Nigeri") is None
+    assert CategoryMatcher(["Niger", "Nigeria"], min_margin=0.0).match("Nigeri").category == "Nigeria"
+
+
+def test_margin_ignores_aliases_of_the_same_category():
+    # "Congo Kinshasa" is near the class name and its "Congo-Kinshasa" alias, which must not count as a rival
+    match = CategoryMatcher(["Dem. Rep. of the Congo", "Somalia"]).match("Congo Kinshasaa")
+    assert match is not None and match.category == "Dem. Rep. of the Congo"
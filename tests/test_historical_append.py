@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from historical_index import HistoricalIndex
+from rollups import LEVELS, METRICS, build_rollups
+from training_frame import compact_training_data
+
+YEARS = range(1998, 2020)
+
+
+def split(frame, *sizes):
+    """frame cut into consecutive chunks of the given sizes, then the rest"""
+    bounds = np.cumsum((0,) + sizes + (len(frame) - sum(sizes),))
+    return [frame.iloc[start:stop].reset_index(drop=True) for start, stop in zip(bounds, bounds[1:])]
+
+
+def assert_same_entries(entries, expected):
+    # Means are summed in a different order, so they may differ in the last bits
+    assert len(entries) == len(expected)
+    for entry, other in zip(entries, expected):
+        assert entry.pop("avg_acceptance_rate") == pytest.approx(other.pop("avg_acceptance_rate"), nan_ok=True)
+        assert entry == other
+
+
+@pytest.fixture(params=["plain", "compact"])
+def frames(request, training_data, label_encoders):
+    # New rows include pairs the base rows never had
+    base, *appended = split(training_data, 250, 1, 100)
+    base = base[base["origin"] != base["origin"].iloc[0]].reset_index(drop=True)
+    if request.param == "compact":
+        base = compact_training_data(base, label_encoders)
+        appended = [compact_training_data(chunk, label_encoders) for chunk in appended]
+    return base, appended
+
+
+def test_appended_index_matches_a_full_build(frames):
+    base, appended = frames
+    index = HistoricalIndex(base)
+    for chunk in appended:
+        index.append(chunk)
+    full = HistoricalIndex(pd.concat([base] + appended, ignore_index=True))
+
+    assert index.row_count == full.row_count
+    pairs = pd.concat([base] + appended)[["country", "origin"]].astype(object).drop_duplicates().itertuples(index=False)
+    for country, origin in pairs:
+        assert index.summary(country, origin) == pytest.approx(full.summary(country, origin))
+        for year in YEARS:
+            found = index.find(country, origin, year)
+            assert found == full.find(country, origin, year)
+            assert index.record(found[0]) == full.record(found[0])
+    assert index.summary("Nowhere", "Nowhere") is None
+
+
+def test_appended_rollups_match_a_full_build(frames):
+    base, appended = frames
+    rollups = build_rollups([base])
+    for chunk in appended:
+        rollups.append(chunk)
+    full = build_rollups([pd.concat([base] + appended, ignore_index=True)])
+
+    assert rollups.sizes() == full.sizes()
+    for level in LEVELS:
+        total, entries = rollups.page(level, limit=10000)
+        expected_total, expected = full.page(level, limit=10000)
+        assert total == expected_total
+        assert_same_entries(entries, expected)
+        for metric in METRICS:
+            assert_same_entries(rollups.top(level, metric, limit=20), full.top(level, metric, limit=20))
@@ -0,0 +1,70 @@
+import os
+import stat
+
+import pandas as pd
+import pytest
+
+import main
+from conftest import ADMIN_TOKEN
+from ingestion import INGEST_LOG_FILE
+from model_registry import BundleSettings, load_bundle
+
+HEADERS = {"X-Admin-Token": ADMIN_TOKEN}
+
+
+@pytest.fixture
+def new_records(training_data, label_encoders):
+    """Rows for pairs already in training_data and for a pair it doesn't have"""
+    records = training_data.dropna(subset=["acceptance_rate"]).sample(30, random_state=1).assign(year=2018)
+    unseen = records.head(5).assign(country=label_encoders["country"].classes_[-1],
+                                    origin=label_encoders["origin"].classes_[-1])
+    return pd.concat([records, unseen]).to_dict("records")
+
+
+def historical_responses(client, records):
+    return [client.post("/historical-data", json={"country": record["country"], "origin": record["origin"], "year": year}).json()
+            for record in records for year in (2005, 2018)]
+
+
+def test_ingest_then_compact_keeps_every_row(app_client, model_dir, training_data, new_records):
+    csv_path = os.path.join(model_dir, "training_data.csv")
+    os.chmod(csv_path, 0o640)
+
+    response = app_client.post("/admin/ingest", json={"records": new_records}, headers=HEADERS)
+    assert response.status_code == 200
+    assert response.json()["pending_records"] == len(new_records)
+    assert response.json()["total_records"] == len(training_data) + len(new_records)
+    ingested = historical_responses(app_client, new_records)
+    assert all(body["success"] for body in ingested)
+
+    response = app_client.post("/admin/compact", headers=HEADERS)
+    assert response.status_code == 200
+    assert response.json()["compacted"] == len(new_records)
+    assert response.json()["pending_records"] == 0
+    assert historical_responses(app_client, new_records) == ingested
+
+    merged = pd.read_csv(csv_path)
+    expected = pd.concat([training_data, pd.DataFrame(new_records)], ignore_index=True)
+    pd.testing.assert_frame_equal(merged, expected, check_dtype=False)
+    assert not os.path.exists(os.path.join(model_dir, INGEST_LOG_FILE))
+    assert stat.S_IMODE(os.stat(csv_path).st_mode) == 0o640
+
+    # A fresh load of the compacted version answers the same
+    reloaded = load_bundle(model_dir, "test", BundleSettings())
+    assert reloaded.historical_index.row_count == len(expected)
+    for record in new_records:
+        found = reloaded.historical_index.find(record["country"], record["origin"], 2018)
+        assert found is not None and found[2]
+
+
+def test_invalid_batch_writes_nothing(app_client, model_dir, new_records):
+    response = app_client.post("/admin/ingest", json={"records": new_records[:3] + [dict(new_records[0], year="abc")]},
+                               headers=HEADERS)
+    assert response.status_code == 422
+    assert not os.path.exists(os.path.join(model_dir, INGEST_LOG_FILE))
+
+
+def test_ingest_and_compact_need_a_configured_token(app_client, monkeypatch, new_records):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", None)
+    assert app_client.post("/admin/ingest", json={"records": new_records}).status_code == 403
+    assert app_client.post("/admin/compact").status_code == 403
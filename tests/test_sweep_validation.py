@@ -0,0 +1,54 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+BASE = {
+    "country": "Kenya", "origin": "Somalia", "procedure_type": "G", "year": 2015,
+    "applied_during_year": 10, "pending_start": 5, "unhcr_assisted_start": 0, "decisions_other": 1,
+}
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(main.app)
+
+
+def sweep(client, *ranges):
+    return client.post("/predict/sweep", json={"base": BASE, "ranges": list(ranges)})
+
+
+def test_grid_size_does_not_wrap_around(client):
+    # 2**32 * 2**32 points is 0 in int64
+    response = sweep(client,
+                     {"field": "pending_start", "start": 0, "stop": 2**32 - 1},
+                     {"field": "applied_during_year", "start": 0, "stop": 2**32 - 1})
+    assert response.status_code == 422
+
+
+def test_grid_of_two_allowed_axes_over_the_limit(client):
+    response = sweep(client,
+                     {"field": "pending_start", "start": 0, "stop": 199},
+                     {"field": "applied_during_year", "start": 0, "stop": 199})
+    assert response.status_code == 422
+    assert "grid has 40000 points" in response.text
+
+
+def test_single_axis_over_the_limit(client):
+    response = sweep(client, {"field": "pending_start", "start": 0, "stop": main.SWEEP_MAX_POINTS})
+    assert response.status_code == 422
+    assert f"more than the limit of {main.SWEEP_MAX_POINTS}" in response.text
+
+
+def test_stop_beyond_int64_is_a_validation_error(client):
+    response = sweep(client, {"field": "pending_start", "start": 0, "stop": 10**19})
+    assert response.status_code == 422
+    assert "pending_start values must be within" in response.text
+
+
+def test_grid_within_limits_is_accepted():
+    request = main.SweepRequest.model_validate({
+        "base": BASE,
+        "ranges": [{"field": "year", "start": 2000, "stop": 2030}, {"field": "pending_start", "values": [0, 10, 100]}],
+    })
+    assert [sweep.size() for sweep in request.ranges] == [31, 3]
@@ -0,0 +1,339 @@
+"""
+Train the acceptance-rate model from the raw UNHCR asylum_seekers.csv and
+write the artifact set the API loads.
+
+    python train_model.py asylum_seekers.csv --output models/2024-09-15 --jobs 4
+    python train_model.py asylum_seekers.csv --search --models random_forest
+
+Same preparation as task1_refugee_analysis.ipynb: rows for African countries
+of asylum, numeric columns cleaned of ',' and '*' with '-' read as 0,
+acceptance_rate = recognized / (recognized + rejected + other), label
+encoded categories, an 80/20 split with random_state 42 and StandardScaler.
+The raw file is read in typed chunks and each numeric column is cleaned
+once per distinct value. The cleaned frame is cached (keyed by the raw
+file's content hash), so re-runs with other models or grids skip parsing.
+Candidates are scored by cross-validated R² on the training split, with
+every (candidate, fold) fit running in parallel; the best one is refit on
+the whole training split and evaluated on the test split.
+
+Writes best_model.pkl, scaler.pkl, label_encoders.pkl, feature_columns.pkl
+and training_data.csv (best_model.pkl last, so a model registry never sees
+a partial version) plus training_report.json with stage timings and metrics.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import LinearRegression
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from sklearn.model_selection import KFold, ParameterGrid, train_test_split
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+from sklearn.tree import DecisionTreeRegressor
+
+from artifact_cache import content_hash, load_cached_frame, store_cached_frame
+from model_registry import ARTIFACT_FILES
+
+logger = logging.getLogger(__name__)
+
+AFRICAN_COUNTRIES = [
+    'Algeria', 'Angola', 'Benin', 'Botswana', 'Burkina Faso', 'Burundi', 'Cabo Verde',
+    'Cameroon', 'Central African Republic', 'Chad', 'Comoros', 'Congo (Brazzaville)',
+    'Congo (Kinshasa)', 'Djibouti', 'Egypt', 'Equatorial Guinea', 'Eritrea', 'Eswatini',
+    'Ethiopia', 'Gabon', 'Gambia', 'Ghana', 'Guinea', 'Guinea-Bissau', 'Ivory Coast',
+    'Kenya', 'Lesotho', 'Liberia', 'Libya', 'Madagascar', 'Malawi', 'Mali', 'Mauritania',
+    'Mauritius', 'Morocco', 'Mozambique', 'Namibia', 'Niger', 'Nigeria', 'Rwanda',
+    'Sao Tome and Principe', 'Senegal', 'Seychelles', 'Sierra Leone', 'Somalia',
+    'South Africa', 'South Sudan', 'Sudan', 'Tanzania', 'Togo', 'Tunisia', 'Uganda',
+    'Zambia', 'Zimbabwe'
+]
+
+# Raw column -> training_data.csv column
+CATEGORICAL_COLUMNS = {
+    'Country / territory of asylum/residence': 'country',
+    'Origin': 'origin',
+    'RSD procedure type / level': 'procedure_type',
+}
+NUMERIC_COLUMNS = {
+    'Year': 'year',
+    'Tota pending start-year': 'pending_start',
+    'of which UNHCR-assisted(start-year)': 'unhcr_assisted_start',
+    'Applied during year': 'applied_during_year',
+    'decisions_recognized': 'decisions_recognized',
+    'decisions_other': 'decisions_other',
+    'Rejected': 'rejected',
+}
+
+# feature_columns.pkl: the notebook's feature names, in the order the scaler and model expect
+FEATURES = ['country_encoded', 'origin_encoded', 'procedure_encoded', 'Year', 'Applied during year',
+            'Tota pending start-year', 'of which UNHCR-assisted(start-year)', 'decisions_other']
+FEATURE_SOURCES = {
+    'country_encoded': 'country_encoded', 'origin_encoded': 'origin_encoded', 'procedure_encoded': 'procedure_encoded',
+    'Year': 'year', 'Applied during year': 'applied_during_year', 'Tota pending start-year': 'pending_start',
+    'of which UNHCR-assisted(start-year)': 'unhcr_assisted_start', 'decisions_other': 'decisions_other',
+}
+ENCODED_COLUMNS = {'country': 'country', 'origin': 'origin', 'procedure': 'procedure_type'}
+
+TRAINING_DATA_COLUMNS = ['country', 'origin', 'procedure_type', 'year', 'applied_during_year', 'pending_start',
+                         'unhcr_assisted_start', 'decisions_other', 'acceptance_rate']
+
+# Bump when the cleaning rules change, so cached frames from older rules are not reused
+CLEANING_VERSION = 1
+# ',' and '*' dropped, '-' read as 0 (the notebook's three str.replace calls in one pass)
+CLEANING_TABLE = str.maketrans({',': None, '*': None, '-': '0'})
+
+# name -> (estimator class, the notebook's parameters, extra grid searched with --search)
+CANDIDATES = {
+    'linear_regression': (LinearRegression, {}, {}),
+    'decision_tree': (DecisionTreeRegressor, {'max_depth': 10}, {'max_depth': [5, 10, 20, None], 'min_samples_leaf': [1, 5]}),
+    'random_forest': (RandomForestRegressor, {'n_estimators': 100},
+                      {'n_estimators': [100, 200], 'max_depth': [None, 20], 'min_samples_leaf': [1, 3]}),
+}
+
+
+def clean_numeric(values):
+    """Vectorized notebook cleaning for one raw text column; each distinct value is parsed once"""
+    codes, uniques = pd.factorize(values)
+    cleaned = pd.to_numeric(pd.Series(uniques, dtype=object).astype(str).str.translate(CLEANING_TABLE),
+                            errors='coerce').to_numpy(dtype=np.float64)
+    # Missing values (code -1) become NaN like the notebook's astype(str) 'nan'
+    return np.append(cleaned, np.nan)[codes]
+
+
+def read_raw(path, chunk_rows):
+    """African-asylum rows of the raw file, cleaned, with training_data.csv column names"""
+    columns = list(CATEGORICAL_COLUMNS) + list(NUMERIC_COLUMNS)
+    chunks = []
+    reader = pd.read_csv(path, usecols=columns, dtype={column: str for column in columns},
+                         chunksize=chunk_rows, low_memory=False)
+    for chunk in reader:
+        chunk = chunk[chunk['Country / territory of asylum/residence'].isin(AFRICAN_COUNTRIES)]
+        cleaned = {}
+        for raw, name in CATEGORICAL_COLUMNS.items():
+            # The notebook's fillna(0) turns missing categories into the string '0'
+            cleaned[name] = chunk[raw].fillna('0').to_numpy(dtype=object)
+        for raw, name in NUMERIC_COLUMNS.items():
+            cleaned[name] = np.nan_to_num(clean_numeric(chunk[raw]), nan=0.0)
+        chunks.append(pd.DataFrame(cleaned))
+    frame = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=list(CATEGORICAL_COLUMNS.values()) + list(NUMERIC_COLUMNS.values()))
+
+    decisions = frame['decisions_recognized'] + frame['rejected'] + frame['decisions_other']
+    frame['acceptance_rate'] = frame['decisions_recognized'] / decisions.replace(0, 1)
+    return frame
+
+
+def cache_key(raw_hash):
+    params = json.dumps([raw_hash, CLEANING_VERSION, AFRICAN_COUNTRIES, CATEGORICAL_COLUMNS, NUMERIC_COLUMNS])
+    return hashlib.sha256(params.encode('utf-8')).hexdigest()
+
+
+def load_frame(path, chunk_rows, cache_dir, timings):
+    start = time.perf_counter()
+    key = cache_key(content_hash(path)) if cache_dir else None
+    frame = load_cached_frame("training_frame", key, cache_dir) if cache_dir else None
+    if frame is not None:
+        timings['load_cached_frame'] = time.perf_counter() - start
+        return frame, True
+    frame = read_raw(path, chunk_rows)
+    timings['read_and_clean'] = time.perf_counter() - start
+    if cache_dir:
+        store_cached_frame(frame, "training_frame", key, cache_dir, path)
+    return frame, False
+
+
+def encode(frame):
+    """Fit the label encoders and build the unscaled feature matrix"""
+    label_encoders = {}
+    for name, column in ENCODED_COLUMNS.items():
+        encoder = LabelEncoder()
+        frame[f'{name}_encoded'] = encoder.fit_transform(frame[column].astype(str))
+        label_encoders[name] = encoder
+    X = np.column_stack([frame[FEATURE_SOURCES[feature]].to_numpy(dtype=np.float64) for feature in FEATURES])
+    return X, frame['acceptance_rate'].to_numpy(dtype=np.float64), label_encoders
+
+
+def candidate_configs(names, search, seed):
+    configs = []
+    for name in names:
+        estimator_class, params, grid = CANDIDATES[name]
+        for grid_params in (ParameterGrid(grid) if search and grid else [{}]):
+            config = dict(params, **grid_params)
+            if 'random_state' in estimator_class().get_params():
+                config['random_state'] = seed
+            configs.append((name, config))
+    return configs
+
+
+def _fit_fold(name, params, X, y, train_idx, test_idx):
+    estimator_class = CANDIDATES[name][0]
+    start = time.perf_counter()
+    # One process per fit; nested parallelism inside a forest would only oversubscribe the cores
+    estimator = estimator_class(**params)
+    if 'n_jobs' in estimator.get_params():
+        estimator.set_params(n_jobs=1)
+    estimator.fit(X[train_idx], y[train_idx])
+    return r2_score(y[test_idx], estimator.predict(X[test_idx])), time.perf_counter() - start
+
+
+def select_model(configs, X, y, folds, jobs, seed):
+    """Mean cross-validated R² of every config, all (config, fold) fits run in parallel"""
+    splits = list(KFold(n_splits=folds, shuffle=True, random_state=seed).split(X))
+    results = Parallel(n_jobs=jobs)(
+        delayed(_fit_fold)(name, params, X, y, train_idx, test_idx)
+        for name, params in configs for train_idx, test_idx in splits
+    )
+    scores = []
+    for i, (name, params) in enumerate(configs):
+        fold_results = results[i * folds:(i + 1) * folds]
+        scores.append({
+            "model": name,
+            "params": params,
+            "cv_r2": float(np.mean([r2 for r2, _ in fold_results])),
+            "cv_r2_std": float(np.std([r2 for r2, _ in fold_results])),
+            "fit_seconds": float(np.mean([seconds for _, seconds in fold_results])),
+        })
+    return sorted(scores, key=lambda score: score["cv_r2"], reverse=True)
+
+
+def write_artifacts(output_dir, model, scaler, label_encoders, training_data):
+    """Write each artifact to a temporary file and rename it into place, best_model.pkl last"""
+    os.makedirs(output_dir, exist_ok=True)
+    umask = os.umask(0)
+    os.umask(umask)
+
+    def publish(name, write):
+        fd, tmp_path = tempfile.mkstemp(prefix=f'.{name}.', dir=output_dir)
+        os.close(fd)
+        try:
+            write(tmp_path)
+            # mkstemp creates the file 0600; an API running as another user must still be able to load it
+            os.chmod(tmp_path, 0o644 & ~umask)
+            os.replace(tmp_path, os.path.join(output_dir, name))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def dump_label_encoders(path):
+        with open(path, 'wb') as f:
+            pickle.dump(label_encoders, f)
+
+    writers = {
+        'training_data.csv': lambda path: training_data.to_csv(path, index=False),
+        'feature_columns.pkl': lambda path: joblib.dump(FEATURES, path),
+        'label_encoders.pkl': dump_label_encoders,
+        'scaler.pkl': lambda path: joblib.dump(scaler, path),
+        'best_model.pkl': lambda path: joblib.dump(model, path),
+    }
+    assert set(writers) == set(ARTIFACT_FILES)
+    for name, write in writers.items():
+        publish(name, write)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="raw UNHCR asylum_seekers.csv")
+    parser.add_argument("--output", default=".", help="directory to write the artifacts to, e.g. models/<version>")
+    parser.add_argument("--models", default=",".join(CANDIDATES), help=f"comma-separated subset of {', '.join(CANDIDATES)}")
+    parser.add_argument("--search", action="store_true", help="search each model's hyperparameter grid instead of the notebook's settings")
+    parser.add_argument("--folds", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-rows", type=int, default=100_000)
+    parser.add_argument("--cache-dir", default=os.getenv("ARTIFACT_CACHE_DIR", ".artifact_cache"),
+                        help="where the cleaned frame is cached; '' disables caching")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    names = [name.strip() for name in args.models.split(",") if name.strip()]
+    unknown = [name for name in names if name not in CANDIDATES]
+    if unknown or not names:
+        parser.error(f"unknown models {unknown}; choose from {', '.join(CANDIDATES)}")
+
+    timings = {}
+    total_start = time.perf_counter()
+    frame, from_cache = load_frame(args.input, args.chunk_rows, args.cache_dir or None, timings)
+    if frame.empty:
+        raise SystemExit(f"No rows for African countries of asylum in {args.input}")
+    logger.info(f"{len(frame):,} rows {'from cache' if from_cache else 'read and cleaned'}")
+
+    start = time.perf_counter()
+    X, y, label_encoders = encode(frame)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+    X_test_scaled = scaler.transform(X_test)
+    timings['encode_and_scale'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    configs = candidate_configs(names, args.search, args.seed)
+    logger.info(f"Cross-validating {len(configs)} configurations x {args.folds} folds on {args.jobs} workers")
+    scores = select_model(configs, X_train_scaled, y_train, args.folds, args.jobs, args.seed)
+    timings['model_selection'] = time.perf_counter() - start
+    for score in scores:
+        logger.info(f"  {score['model']:<18} cv R² {score['cv_r2']:.4f} ± {score['cv_r2_std']:.4f}  "
+                    f"{score['fit_seconds']:.2f}s/fit  {score['params']}")
+
+    start = time.perf_counter()
+    best = scores[0]
+    model = CANDIDATES[best['model']][0](**best['params'])
+    if 'n_jobs' in model.get_params():
+        model.set_params(n_jobs=args.jobs)
+        model.fit(X_train_scaled, y_train)
+        # The API predicts a few rows at a time, where a worker pool per call costs more than it saves
+        model.set_params(n_jobs=None)
+    else:
+        model.fit(X_train_scaled, y_train)
+    timings['final_fit'] = time.perf_counter() - start
+
+    y_pred = model.predict(X_test_scaled)
+    test_metrics = {
+        "r2": float(r2_score(y_test, y_pred)),
+        "rmse": float(np.sqrt(mean_squared_error(y_test, y_pred))),
+        "mae": float(mean_absolute_error(y_test, y_pred)),
+    }
+    logger.info(f"Selected {best['model']} {best['params']}: test R² {test_metrics['r2']:.4f}, "
+                f"RMSE {test_metrics['rmse']:.4f}, MAE {test_metrics['mae']:.4f}")
+    if not hasattr(model, 'estimators_'):
+        logger.warning("The selected model is not a tree ensemble; the API will serve it with sklearn inference")
+
+    start = time.perf_counter()
+    training_data = frame[TRAINING_DATA_COLUMNS].copy()
+    count_columns = TRAINING_DATA_COLUMNS[3:-1]
+    if all((training_data[column] == np.round(training_data[column])).all() for column in count_columns):
+        training_data[count_columns] = training_data[count_columns].astype(np.int64)
+    write_artifacts(args.output, model, scaler, label_encoders, training_data)
+    timings['write_artifacts'] = time.perf_counter() - start
+    timings['total'] = time.perf_counter() - total_start
+
+    report = {
+        "input": os.path.abspath(args.input),
+        "rows": len(frame),
+        "train_rows": len(X_train),
+        "test_rows": len(X_test),
+        "frame_from_cache": from_cache,
+        "jobs": args.jobs,
+        "folds": args.folds,
+        "selected": {"model": best['model'], "params": best['params'], "cv_r2": best['cv_r2']},
+        "test_metrics": test_metrics,
+        "candidates": scores,
+        "timings_seconds": {stage: round(seconds, 3) for stage, seconds in timings.items()},
+    }
+    with open(os.path.join(args.output, "training_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Artifacts written to {args.output} in {timings['total']:.1f}s "
+          f"({', '.join(f'{stage} {seconds:.1f}s' for stage, seconds in timings.items() if stage != 'total')})",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
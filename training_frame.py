@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+# training_data column -> label_encoders.pkl key whose classes are its vocabulary
+CATEGORY_VOCABULARIES = {'country': 'country', 'origin': 'origin', 'procedure_type': 'procedure'}
+
+
+def downcast_numeric(df):
+    """Integer columns in the smallest integer dtype that holds them; float columns are left alone"""
+    columns = {}
+    for name in df.columns:
+        series = df[name]
+        if pd.api.types.is_integer_dtype(series.dtype) and not isinstance(series.dtype, pd.CategoricalDtype):
+            series = pd.to_numeric(series, downcast='integer')
+        columns[name] = series
+    return pd.DataFrame(columns, index=df.index)
+
+
+def _categorical(series, vocabulary):
+    """series as a Categorical whose categories are vocabulary, plus any values it doesn't contain"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, uniques = series.cat.codes.to_numpy(), series.cat.categories
+    else:
+        codes, uniques = pd.factorize(series)
+    positions = vocabulary.get_indexer(uniques)
+    unseen = positions < 0
+    categories = vocabulary
+    if unseen.any():
+        # Values outside the encoders (e.g. ingested after training) get codes after every known class
+        categories = vocabulary.append(pd.Index(uniques[unseen]))
+        positions[unseen] = len(vocabulary) + np.arange(int(unseen.sum()))
+    codes = np.where(codes < 0, -1, positions[codes]) if len(positions) else np.full(len(codes), -1)
+    return pd.Categorical.from_codes(codes, dtype=pd.CategoricalDtype(categories))
+
+
+def compact_training_data(df, label_encoders):
+    """
+    Memory-compact copy of a training_data frame: country, origin and
+    procedure_type become categoricals over the label encoders' classes, so a
+    row's category code is its label-encoded value, and integer columns are
+    downcast. acceptance_rate stays float64 so similar-case averages are unchanged.
+    """
+    df = downcast_numeric(df)
+    for column, encoder_name in CATEGORY_VOCABULARIES.items():
+        if column in df.columns and label_encoders and encoder_name in label_encoders:
+            vocabulary = pd.Index(label_encoders[encoder_name].classes_, dtype=object)
+            df[column] = _categorical(df[column], vocabulary)
+    return df
+
+
+def memory_report(frames):
+    """Bytes held by a list of training_data frames, in total and per column"""
+    columns = {}
+    rows = 0
+    for frame in frames:
+        rows += len(frame)
+        usage = frame.memory_usage(index=False, deep=True)
+        for name in frame.columns:
+            entry = columns.setdefault(name, {"dtype": str(frame[name].dtype), "bytes": 0})
+            entry["bytes"] += int(usage[name])
+    total = sum(entry["bytes"] for entry in columns.values())
+    return {
+        "rows": rows,
+        "total_bytes": total,
+        "bytes_per_row": round(total / rows, 1) if rows else 0.0,
+        "columns": columns
+    }